@@ -1,16 +1,21 @@
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import tweets.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
+# Set up Django BEFORE importing anything that touches models (ws_auth uses Token)
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+import tweets.routing  # noqa: E402
+from tweets.ws_auth import TokenAuthMiddlewareStack  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    # DRF token (?token=...) or session, see tweets/ws_auth.py
+    "websocket": TokenAuthMiddlewareStack(
         URLRouter(
             tweets.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
@@ -1,5 +1,8 @@
 import os
+import time
+
 from celery import Celery
+from celery.signals import before_task_publish
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -11,4 +14,12 @@ app = Celery('backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Auto-discover tasks in all installed apps
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# --- NEW: QUEUE LATENCY ---
+# Every message carries the time it was published, so /metrics can tell how
+# long the oldest message of each queue has been waiting (tweets/metrics.py)
+@before_task_publish.connect
+def stamp_sent_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('sent_at', time.time())
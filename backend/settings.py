@@ -41,8 +41,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
-    'debug_toolbar',
     'tweets',
     'django_prometheus',
     'corsheaders',
@@ -54,7 +54,6 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -97,6 +96,23 @@ DATABASES = {
     }
 }
 
+# Connection pooling (psycopg 3). Without it every request opens (and closes) its own
+# Postgres connection. The pool is per process: keep workers * DB_POOL_MAX_SIZE
+# under Postgres' max_connections (100 by default).
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+if DB_POOL_MAX_SIZE:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': min(2, DB_POOL_MAX_SIZE),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': 10,  # seconds to wait for a free connection before erroring
+        },
+    }
+else:
+    # No pool (e.g. behind pgbouncer): at least reuse the connection of each thread
+    DATABASES['default']['CONN_MAX_AGE'] = 60
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -145,11 +161,55 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media on local disk by default. Set S3_BUCKET to use any S3-compatible store
+# (AWS, MinIO, R2...); S3_ENDPOINT_URL is e.g. http://minio:9000 for MinIO.
+S3_BUCKET = os.environ.get('S3_BUCKET')
+if S3_BUCKET:
+    STORAGES = {
+        'default': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+            'OPTIONS': {
+                'bucket_name': S3_BUCKET,
+                'endpoint_url': os.environ.get('S3_ENDPOINT_URL'),
+                'access_key': os.environ.get('S3_ACCESS_KEY'),
+                'secret_key': os.environ.get('S3_SECRET_KEY'),
+                'region_name': os.environ.get('S3_REGION'),
+                'file_overwrite': True,  # variant paths are deterministic (see media.py)
+            },
+        },
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    }
+
+# Resumable chunked uploads (see tweets/uploads.py)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024   # bytes per PUT; S3 multipart parts must be >= 5 MiB
+UPLOAD_COPY_BUFFER = 256 * 1024       # bytes in memory while a chunk is copied to the storage
+UPLOAD_MAX_SIZE = {'image': 20 * 1024 * 1024, 'video': 1024 * 1024 * 1024}
+UPLOAD_EXPIRY = 24 * 3600             # seconds before an unfinished/unused upload is deleted
+MEDIA_BLOCK_SIZE = 256 * 1024         # media responses are streamed in blocks of this size
+
+# Video renditions (see tweets/video.py): name -> (height, max video kbps, audio kbps)
+VIDEO_RENDITIONS = {'720p': (720, 2500, 128), '480p': (480, 1000, 96), '240p': (240, 300, 64)}
+VIDEO_HLS_SEGMENT_SECONDS = 4
+VIDEO_POSTER_SECOND = 1.0
+VIDEO_FFMPEG_THREADS = int(os.environ.get('VIDEO_FFMPEG_THREADS', 2))  # per transcode
+VIDEO_TRANSCODE_TIMEOUT = 900         # seconds per ffmpeg run
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+
+# Responsive image variants (name -> max width in px) and encoder quality
+IMAGE_VARIANT_WIDTHS = {'thumb': 150, 'feed': 600, 'full': 1200}
+IMAGE_VARIANT_QUALITY = {'webp': 80, 'jpeg': 82}
+
+# Perceptual hashes (see tweets/imagehash.py), in bits out of 64
+IMAGE_DUPLICATE_DISTANCE = 4      # this close to a classified image: reuse its ai_tags, no model run
+IMAGE_SIMILAR_MAX_DISTANCE = 11   # largest ?distance= of /api/tweets/{id}/similar/ (cost grows fast above)
+
 # DRF Settings (Optional but good practice)
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        # This enables Token Authentication
-        'rest_framework.authentication.TokenAuthentication',
+        # This enables Token Authentication (token -> user cached in-process + Redis,
+        # see tweets/authentication.py)
+        'tweets.authentication.CachedTokenAuthentication',
         
         # Keep this so you can still use the Admin panel in the browser
         'rest_framework.authentication.SessionAuthentication',
@@ -162,22 +222,155 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
 
-    # THROTTLING (Rate limits)
+    # RENDERERS: orjson instead of the stdlib json module; msgpack on `Accept: application/msgpack`
+    'DEFAULT_RENDERER_CLASSES': [
+        'tweets.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'tweets.renderers.MessagePackRenderer',
+    ],
+
+    # THROTTLING (Rate limits): GCRA in Redis, shared with GraphQL and WebSockets
+    # (see tweets/ratelimit.py). Rates are in cells, requests cost RATE_LIMIT_COSTS.
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'tweets.ratelimit.GCRARateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/day',
-        'user': '1000/day'
+        # Overridable so load tests (benchmarks/bench_http.py) aren't just measuring 429s
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '100/day'),
+        'user': os.environ.get('THROTTLE_USER_RATE', '1000/day')
     }
 }
 
+# Cells each kind of request spends from the rates above (see tweets/ratelimit.py)
+RATE_LIMIT_COSTS = {
+    'read': 1,         # REST GET
+    'write': 5,        # other REST writes (comment, share, follow...)
+    'media': 20,       # a tweet with a photo/video, starting a chunked upload
+    'chunk': 1,        # one chunk of an upload (its start already paid for `media`)
+    'graphql': 2,      # a GraphQL query (many fields per request)
+    'ws_connect': 5,   # opening a notification WebSocket (reconnect storms)
+}
+
 # Celery Configuration
 REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
 CELERY_BROKER_URL = f'redis://{REDIS_HOST}:6379/0'
 CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:6379/0'
 
+# --- NEW: QUEUES, ROUTING AND PRIORITIES ---
+# One queue per class of work, each with its own workers (docker-compose.yml),
+# so a burst of uploads can't take the worker slots moderation needs:
+#   realtime  cheap and user-visible (moderation, fan-out, notifications)
+#   images    CPU/TensorFlow (variants, classification), few processes
+#   video     ffmpeg (celery-video), one at a time
+#   celery    anything not routed
+# Priorities: 0 is the highest, 9 the lowest (Redis emulates them with one list
+# per level, `<queue>:<priority>`, polled in order).
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+CELERY_TASK_ROUTES = {
+    'tweets.tasks.process_new_tweet': {'queue': 'realtime', 'priority': 2},
+    'tweets.tasks.moderate_content': {'queue': 'realtime', 'priority': 2},
+    'tweets.tasks.moderate_tweets': {'queue': 'realtime', 'priority': 3},
+    'tweets.tasks.notify_followers': {'queue': 'realtime', 'priority': 3},
+    'tweets.tasks.flush_notifications': {'queue': 'realtime', 'priority': 1},
+    'tweets.tasks.flush_share_counts': {'queue': 'realtime', 'priority': 8},
+    'tweets.tasks.process_tweet_image': {'queue': 'images', 'priority': 5},
+    'tweets.tasks.resize_image': {'queue': 'images', 'priority': 5},
+    'tweets.tasks.classify_image': {'queue': 'images', 'priority': 6},
+    'tweets.tasks.transcode_video': {'queue': 'video'},
+    # Daily full scan of auth_user: default queue, behind everything else
+    'tweets.tasks.rebuild_availability_filters': {'queue': 'celery', 'priority': 9},
+}
+# Per worker process: a flood of re-classifications or transcodes is spread out
+# instead of pinning every core (also set from the env on a busy day)
+CELERY_TASK_ANNOTATIONS = {
+    'tweets.tasks.classify_image': {'rate_limit': os.environ.get('CLASSIFY_RATE_LIMIT', '120/m')},
+    'tweets.tasks.transcode_video': {'rate_limit': os.environ.get('TRANSCODE_RATE_LIMIT', '30/m')},
+}
+CELERY_QUEUE_METRICS = ['realtime', 'images', 'video', 'celery']  # depth/age exported at /metrics
+
+# Periodic tasks (run with: celery -A backend beat)
+SHARE_FLUSH_INTERVAL = float(os.environ.get('SHARE_FLUSH_INTERVAL', 5.0))  # seconds
+CELERY_BEAT_SCHEDULE = {
+    'flush-share-counts': {
+        'task': 'tweets.tasks.flush_share_counts',
+        'schedule': SHARE_FLUSH_INTERVAL,
+    },
+    'flush-notifications': {
+        'task': 'tweets.tasks.flush_notifications',
+        'schedule': float(os.environ.get('NOTIFICATION_FLUSH_INTERVAL', 1.0)),
+    },
+    'expire-uploads': {
+        'task': 'tweets.tasks.expire_uploads',
+        'schedule': 3600,
+    },
+    'rebuild-availability-filters': {
+        'task': 'tweets.tasks.rebuild_availability_filters',
+        'schedule': 24 * 3600,
+    },
+}
+
+# App-level Redis (work queues, counters, timelines). Kept off the broker DB.
+REDIS_URL = os.environ.get('REDIS_URL', f'redis://{REDIS_HOST}:6379/1')
+REDIS_ASYNC_MAX_CONNECTIONS = 50  # per ASGI process/event loop (see tweets/redis_client.py)
+
+# CACHE (django-redis).
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', f'redis://{REDIS_HOST}:6379/2'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+# RESPONSE CACHE for anonymous reads (see tweets/cache.py)
+RESPONSE_CACHE_FRESH_TTL = 60    # seconds a cached response is served as-is
+RESPONSE_CACHE_STALE_TTL = 600   # seconds it may still be served while one request refreshes it
+
+# AI IMAGE CLASSIFICATION
+# The model is loaded once per worker process; images are classified in micro-batches.
+AI_MODEL = os.environ.get('AI_MODEL', 'mobilenet_v2')  # 'stub': no TensorFlow, see ml.StubModel (load tests)
+AI_STUB_SECONDS = float(os.environ.get('AI_STUB_SECONDS', 0.05))  # simulated inference time per image
+AI_WARM_ON_START = os.environ.get('AI_WARM_ON_START', 'True') == 'True'
+AI_BATCH_SIZE = int(os.environ.get('AI_BATCH_SIZE', 16))        # max images per model.predict
+AI_BATCH_MAX_WAIT = float(os.environ.get('AI_BATCH_MAX_WAIT', 0.2))  # seconds to wait for a fuller batch
+
+# CONTENT MODERATION (see tweets/moderation.py)
+# Extra terms can be kept in a text file (one per line); edits are picked up automatically.
+MODERATION_BAD_WORDS = ['bad', 'stupid', 'hate', 'spam']
+MODERATION_LEXICON_FILE = os.environ.get('MODERATION_LEXICON_FILE', '')
+
+# TOKEN AUTHENTICATION CACHE (see tweets/authentication.py)
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))  # seconds in Redis
+AUTH_TOKEN_LOCAL_TTL = int(os.environ.get('AUTH_TOKEN_LOCAL_TTL', 30))   # seconds in each process
+AUTH_TOKEN_LOCAL_MAX = 10000  # tokens per process
+
+# SIGNUP AVAILABILITY CHECKS (Bloom filter in Redis, see tweets/availability.py)
+AVAILABILITY_BLOOM_CAPACITY = int(os.environ.get('AVAILABILITY_BLOOM_CAPACITY', 10_000_000))  # per filter
+AVAILABILITY_BLOOM_ERROR_RATE = 0.01  # share of free names still checked in the DB at capacity
+AVAILABILITY_BLOOM_SHARDS = 16        # 10M at 1% = 12 MB per filter, 750 KB per shard key
+
+# HOME TIMELINES (Redis sorted sets, see tweets/timeline.py)
+TIMELINE_MAX_LENGTH = 800       # tweet IDs kept per user
+TIMELINE_FANOUT_LIMIT = 10000   # above this many followers, fan out on read instead of write
+TIMELINE_EMPTY_TTL = 300        # seconds an empty rebuilt timeline is remembered as empty
+
+# Comments embedded in each tweet of a feed (the rest via /api/tweets/{id}/comments/)
+COMMENT_PREVIEW_SIZE = 3
+
+# GRAPHQL LIMITS (see tweets/graphql_extensions.py)
+GRAPHQL_MAX_DEPTH = 8
+GRAPHQL_MAX_COST = 5000          # estimated number of resolved fields
+GRAPHQL_MAX_LIST_SIZE = 50       # assumed size of a list whose `first` is a variable
+GRAPHQL_PERSISTED_QUERY_CACHE_SIZE = 1000
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -186,17 +379,32 @@ CORS_ALLOWED_ORIGINS = [
 # ASGI CONFIGURATION
 ASGI_APPLICATION = 'backend.asgi.application'
 
+# WEBSOCKET NOTIFICATIONS (see tweets/presence.py and tweets/publisher.py)
+PRESENCE_TTL = 60               # seconds a socket stays "online" without a heartbeat
+NOTIFICATION_BATCH_SIZE = 500   # notifications published per presence lookup
+NOTIFICATION_COALESCE_WINDOW = 5.0  # seconds: events of the same kind/tweet within it become one notification
+NOTIFICATION_REPLAY_LIMIT = 100     # missed notifications sent on reconnect (the rest via the API)
+
 # CHANNEL LAYER (Redis)
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [({REDIS_HOST}, 6379)], # "redis" is the docker service name
+            # "redis" is the docker service name. The default pool fails with
+            # "Too many connections" at 100, which a burst of reconnecting sockets hits
+            "hosts": [{"address": f"redis://{REDIS_HOST}:6379", "max_connections": 500}],
         },
     },
 }
 
 # --- DEBUG TOOLBAR CONFIG ---
+# Only loaded when enabled: its middleware runs on every request even when the
+# toolbar isn't shown. Off in production (DEBUG=False) or with DEBUG_TOOLBAR=False.
+DEBUG_TOOLBAR = DEBUG and os.environ.get('DEBUG_TOOLBAR', 'True') == 'True'
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(MIDDLEWARE.index('corsheaders.middleware.CorsMiddleware') + 1,
+                      'debug_toolbar.middleware.DebugToolbarMiddleware')
 
 # This trick detects the IP of the Docker Gateway so the toolbar works
 hostname, _, ips = socket.gethostbyname_ex(socket.gethostname())
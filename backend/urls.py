@@ -1,10 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework.authtoken.views import obtain_auth_token # <--- IMPORT THIS
-from strawberry.django.views import GraphQLView # <--- CHANGED: Use GraphQLView (Sync) instead of AsyncGraphQLView
+from tweets.graphql_views import CachedGraphQLView # AsyncGraphQLView + DataLoaders + response cache for anonymous reads
 from tweets.schema import schema
+from tweets.views import export_metrics, serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,15 +13,17 @@ urlpatterns = [
     # ADD THIS LINE for Login to work:
     path('api-token-auth/', obtain_auth_token), 
     
-    # The Metrics Endpoint
-    path('', include('django_prometheus.urls')),
-    path('graphql/', GraphQLView.as_view(schema=schema)),
+    # The Metrics Endpoint (django_prometheus' metrics + Celery queue depth/age)
+    path('metrics', export_metrics, name='prometheus-django-metrics'),
+    path('graphql/', CachedGraphQLView.as_view(schema=schema)),
+
+    # Uploaded media, streamed with Range support (redirects to the bucket on S3)
+    re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.+)$', serve_media),
 ]
 
-# Add Debug Toolbar URLs only in Debug mode
-if settings.DEBUG:
+# Add Debug Toolbar URLs only when it's installed (see DEBUG_TOOLBAR in settings)
+if settings.DEBUG_TOOLBAR:
     import debug_toolbar
     urlpatterns += [
         path('__debug__/', include(debug_toolbar.urls)),
     ]
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Signup availability-check latency: UPPER() scan vs functional index vs Bloom filter.
+
+    DB_HOST=localhost REDIS_HOST=localhost python benchmarks/bench_availability.py --users 10000000
+
+Inserts synthetic users with generate_series into the configured database,
+INSIDE a transaction that is rolled back at the end, so nothing is left behind
+(10M users and their unique indexes take a few minutes). The Bloom filter is
+built from those rows into separate `bench:` keys of the app Redis, deleted at
+the end. Scenarios, each on free and taken names:
+
+    db/scan     username__iexact with index scans disabled (before migration 0013)
+    db/index    the same query on the UPPER() unique index
+    is_taken    availability.is_taken(): Bloom filter, then the index on a "maybe"
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from tweets import availability  # noqa: E402
+from tweets.bloom import RedisBloomFilter  # noqa: E402
+
+
+class Rollback(Exception):
+    pass
+
+
+def load(count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO auth_user (password, is_superuser, username, first_name, last_name,
+                                   email, is_staff, is_active, date_joined)
+            SELECT '!', false, 'BenchUser' || g, '', '', 'bench.user' || g || '@Example.com',
+                   false, true, now()
+              FROM generate_series(1, %s) AS g
+            """,
+            [count],
+        )
+        cursor.execute('ANALYZE auth_user')
+
+
+def timed(fn, values):
+    samples = []
+    for value in values:
+        start = time.perf_counter()
+        fn(value)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def without_index(value):
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_indexscan = off')
+        cursor.execute('SET LOCAL enable_bitmapscan = off')
+        try:
+            return availability.taken_queryset('username', value).exists()
+        finally:
+            cursor.execute('SET LOCAL enable_indexscan = on')
+            cursor.execute('SET LOCAL enable_bitmapscan = on')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10_000_000)
+    parser.add_argument('--checks', type=int, default=1000, help='lookups per scenario')
+    parser.add_argument('--scan-checks', type=int, default=20, help='lookups for db/scan (slow)')
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    # Typed names: existing ones in another case, and free ones
+    taken = [f'benchuser{1 + i * (args.users // args.checks)}' for i in range(args.checks)]
+    free = [f'newcomer{i}' for i in range(args.checks)]
+
+    bloom = RedisBloomFilter('bench:username', capacity=args.users, error_rate=args.error_rate)
+    availability._filters['username'] = bloom
+    scenarios = {
+        'db/scan': (without_index, args.scan_checks),
+        'db/index': (lambda v: availability.taken_queryset('username', v).exists(), args.checks),
+        'is_taken': (lambda v: availability.is_taken('username', v), args.checks),
+    }
+
+    try:
+        with transaction.atomic():
+            start = time.perf_counter()
+            load(args.users)
+            print(f"loaded {args.users} users in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            names = User.objects.filter(username__startswith='BenchUser').values_list('username', flat=True)
+            bloom.rebuild(availability.normalize(name) for name in names.iterator(chunk_size=10000))
+            print(
+                f"bloom filter built in {time.perf_counter() - start:.1f}s "
+                f"({bloom.shards} x {bloom.shard_bits / 8 / 1024:.0f} KB, {bloom.hashes} hashes)"
+            )
+
+            false_positives = sum(bool(bloom.might_contain(availability.normalize(v))) for v in free)
+            print(f"free names sent to the DB by the filter: {false_positives}/{len(free)}")
+
+            for name, (fn, n) in scenarios.items():
+                for label, values in (('free', free[:n]), ('taken', taken[:n])):
+                    median, p99 = timed(fn, values)
+                    print(f"{name + '/' + label:<16} median {median:9.3f} ms   p99 {p99:9.3f} ms")
+            raise Rollback
+    except Rollback:
+        pass
+    finally:
+        bloom.client.delete(*(bloom.key(s) for s in range(bloom.shards)))
+        bloom.client.delete(*(bloom.build_key(s) for s in range(bloom.shards)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Throughput benchmark: image classification, old per-call path vs warm batched path.
+
+    python benchmarks/bench_classify.py --images 64 --batch-size 16
+
+"per-call" reproduces the old classify_image: build MobileNetV2 and predict one
+image per task. "batched" uses tweets.ml: one warm model, one predict per batch.
+Needs tensorflow-cpu (see requirements.txt); no database or Redis required.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tweets import ml  # noqa: E402
+
+
+def make_images(directory, count, size=(640, 480)):
+    rng = np.random.default_rng(42)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+        path = os.path.join(directory, f'img_{i}.jpg')
+        Image.fromarray(pixels).save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def per_call(paths):
+    # Mirrors the original task body: fresh model for every image
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
+    from tensorflow.keras.preprocessing import image as keras_image
+
+    for path in paths:
+        model = MobileNetV2(weights='imagenet')
+        x = keras_image.img_to_array(keras_image.load_img(path, target_size=(224, 224)))
+        x = preprocess_input(np.expand_dims(x, axis=0))
+        decode_predictions(model.predict(x, verbose=0), top=3)
+
+
+def batched(paths, batch_size):
+    ml.get_model()  # warm-up happens at worker start, so it is not timed per image
+    for i in range(0, len(paths), batch_size):
+        ml.predict_tags([ml.load_pixels(p) for p in paths[i:i + batch_size]])
+
+
+def run(label, fn, paths):
+    start = time.perf_counter()
+    fn(paths)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(paths):>6} images  {elapsed:8.2f}s  {len(paths) / elapsed:8.2f} images/sec")
+    return len(paths) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=64, help='images for the batched path')
+    parser.add_argument('--per-call-images', type=int, default=8,
+                        help='images for the per-call path (it is slow)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_images(tmp, max(args.images, args.per_call_images))
+
+        slow = run('per-call', per_call, paths[:args.per_call_images])
+        # Load the model outside the timed section, like a warm worker
+        ml.get_model()
+        fast = run('batched', lambda p: batched(p, args.batch_size), paths[:args.images])
+
+    print(f"speed-up: {fast / slow:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+HTTP serving benchmark: requests/sec and latency percentiles of a running server.
+
+    export THROTTLE_ANON_RATE=1000000/second   # or every request after the 100th is a 429
+    # the current setup: runserver (single daphne process, debug toolbar, no DB pool)
+    DEBUG=True DB_POOL_MAX_SIZE=0 python manage.py runserver 8000
+    # the production profile (docker-compose.prod.yml)
+    DEBUG=False uvicorn backend.asgi:application --port 8000 --workers 4 --lifespan off --no-access-log
+
+    python benchmarks/bench_http.py --url http://localhost:8000/api/tweets/ --concurrency 64 --duration 20
+
+Each of --concurrency clients sends GET requests back to back on one keep-alive
+connection (a connection that drops is reopened). The first --warmup seconds
+are not counted, so pools, caches and workers are warm. Several --url values
+are requested round-robin. Results are printed as one JSON object; run it once
+per setup and compare `requests_per_second` and `p99_ms`.
+
+The client is plain asyncio (HTTP/1.1, Content-Length or chunked bodies), so
+the numbers don't depend on an HTTP library, and nothing has to be installed.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path, headers):
+        status, _ = await self.request('GET', path, headers)
+        return status
+
+    async def request(self, method, path, headers, body=b'', read_body=False):
+        """(status, body or None). `headers` is preformatted: 'Name: value\\r\\n' lines."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if body or method != 'GET':
+            headers += f'Content-Length: {len(body)}\r\n'
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n{headers}\r\n'.encode() + body)
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status_line, *lines = head.decode('latin1').split('\r\n')
+        fields = {}
+        for line in lines:
+            name, _, value = line.partition(':')
+            fields[name.strip().lower()] = value.strip()
+
+        chunks = []
+        if fields.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunks.append((await self.reader.readexactly(size + 2))[:-2])
+                if size == 0:
+                    break
+        else:
+            chunks.append(await self.reader.readexactly(int(fields.get('content-length', 0))))
+
+        if fields.get('connection', '').lower() == 'close':
+            self.close()
+        return int(status_line.split()[1]), b''.join(chunks) if read_body else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(args):
+    targets = [urlsplit(url) for url in args.url]
+    host, port = targets[0].hostname, targets[0].port or 80
+    paths = [t.path + (f'?{t.query}' if t.query else '') for t in targets]
+    headers = ''.join(f'{h}\r\n' for h in args.header)
+
+    latencies, statuses, errors = [], Counter(), Counter()
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+
+    async def client(n):
+        conn = Connection(host, port)
+        i = n
+        while time.perf_counter() < stop_at:
+            path = paths[i % len(paths)]
+            i += 1
+            sent = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(conn.get(path, headers), args.timeout)
+            except Exception as e:
+                conn.close()
+                if sent >= measure_from:
+                    errors[type(e).__name__] += 1
+                continue
+            if sent >= measure_from:
+                latencies.append(time.perf_counter() - sent)
+                statuses[status] += 1
+        conn.close()
+
+    await asyncio.gather(*[client(n) for n in range(args.concurrency)])
+
+    latencies.sort()
+    return {
+        'urls': args.url,
+        'concurrency': args.concurrency,
+        'duration_seconds': args.duration,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / args.duration, 1),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'errors': dict(errors),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', action='append', help='repeat for several endpoints (same host)')
+    parser.add_argument('--header', action='append', default=[], help='e.g. "Authorization: Token <key>"')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds sent but not counted')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+    args.url = args.url or ['http://localhost:8000/api/tweets/']
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
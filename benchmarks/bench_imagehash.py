@@ -0,0 +1,140 @@
+"""
+Near-duplicate image lookup: candidates filtered in Python vs bit_count() in SQL.
+
+    DB_HOST=localhost python benchmarks/bench_imagehash.py --hashes 1000000 --cluster 50000
+
+Inserts synthetic tweets and ImageHash rows with generate_series into the
+configured database, INSIDE a transaction that is rolled back at the end, so
+nothing is left behind. Most hashes are uniformly random; --cluster of them
+share their first band (one meme template, edited a thousand ways), which is
+the worst case of the band lookup: every one of them is a candidate.
+
+    python    band candidates loaded into Python, distances computed there
+              (imagehash.py before the bit_count() filter)
+    sql       imagehash.find_similar(): distance, filter, ORDER BY and LIMIT in Postgres
+
+each for a random image and a clustered one, at IMAGE_DUPLICATE_DISTANCE (the
+upload path) and IMAGE_SIMILAR_MAX_DISTANCE (the /similar/ endpoint).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from tweets import imagehash  # noqa: E402
+
+HOT_BAND = 0x1234
+
+
+class Rollback(Exception):
+    pass
+
+
+def load(user_id, count, cluster):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO tweets_tweet (user_id, content, image, image_variants, video_renditions,
+                                      created_at, shares_count, comments_count)
+            SELECT %s, '', 'tweet_images/bench.jpg', '{}', '{}', now(), 0, 0
+              FROM generate_series(1, %s)
+            RETURNING id
+            """,
+            [user_id, count],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        # 64 random bits; the first `cluster` rows get the same lowest band
+        cursor.execute(
+            """
+            INSERT INTO tweets_imagehash (tweet_id, hash, band0, band1, band2, band3, created_at)
+            SELECT tweet_id, hash, hash & 65535, (hash >> 16) & 65535, (hash >> 32) & 65535, (hash >> 48) & 65535, now()
+              FROM (
+                SELECT tweet_id,
+                       CASE WHEN n <= %s THEN (bits & ~65535::bigint) | %s ELSE bits END AS hash
+                  FROM (
+                    SELECT tweet_id, row_number() OVER (ORDER BY tweet_id) AS n,
+                           ((random() * 4294967296)::bigint << 32) | (random() * 4294967296)::bigint AS bits
+                      FROM unnest(%s::bigint[]) AS tweet_id
+                  ) r
+              ) h
+            """,
+            [cluster, HOT_BAND, ids],
+        )
+        cursor.execute('ANALYZE tweets_imagehash')
+
+
+def python_side(value, max_distance, limit=20):
+    rows = imagehash._candidates(value, max_distance).values_list('tweet_id', 'hash')
+    matches = []
+    for tweet_id, other in rows:
+        d = imagehash.distance(value, other)
+        if d <= max_distance:
+            matches.append((d, tweet_id))
+    matches.sort()
+    return matches[:limit]
+
+
+def timed(fn, values, max_distance):
+    samples = []
+    for value in values:
+        start = time.perf_counter()
+        fn(value, max_distance)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--hashes', type=int, default=1_000_000)
+    parser.add_argument('--cluster', type=int, default=50_000, help='hashes sharing one band')
+    parser.add_argument('--lookups', type=int, default=50, help='lookups per scenario')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lookups = {
+        'random': [rng.getrandbits(64) for _ in range(args.lookups)],
+        'clustered': [(rng.getrandbits(48) << 16) | HOT_BAND for _ in range(args.lookups)],
+    }
+    scenarios = {
+        'python': python_side,
+        'sql': lambda value, d: imagehash.find_similar(value, d),
+    }
+
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(username='bench_imagehash')
+            start = time.perf_counter()
+            load(user.id, args.hashes, args.cluster)
+            print(f"loaded {args.hashes} hashes ({args.cluster} clustered) in {time.perf_counter() - start:.1f}s")
+
+            for max_distance in (settings.IMAGE_DUPLICATE_DISTANCE, settings.IMAGE_SIMILAR_MAX_DISTANCE):
+                for kind, values in lookups.items():
+                    candidates = statistics.median(
+                        imagehash._candidates(v, max_distance).count() for v in values[:5]
+                    )
+                    for name, fn in scenarios.items():
+                        median, p99 = timed(fn, values, max_distance)
+                        print(f"d={max_distance:<3} {kind:<10} {name:<7} median {median:9.3f} ms   "
+                              f"p99 {p99:9.3f} ms   ({candidates:.0f} candidates)")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
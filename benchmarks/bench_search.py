@@ -0,0 +1,110 @@
+"""
+Search latency benchmark: ILIKE (old SearchFilter) vs full-text vs trigram.
+
+    DB_HOST=localhost python benchmarks/bench_search.py --tweets 1000000
+
+Inserts synthetic tweets with generate_series into the configured database,
+INSIDE a transaction that is rolled back at the end, so nothing is left behind.
+The search trigger runs for every row, so loading 1M tweets takes a few minutes.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Q  # noqa: E402
+
+from tweets.models import Tweet  # noqa: E402
+from tweets.search import ranked_search  # noqa: E402
+
+WORDS = (
+    'cat dog coffee morning rain python django music concert football pizza travel '
+    'sunset beach mountain code bug deploy weekend movie book garden city night '
+    'train coffee tea happy tired launch release startup meeting'
+).split()
+
+
+class Rollback(Exception):
+    pass
+
+
+def load(count):
+    user = User.objects.create_user(username='bench_search_user')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO tweets_tweet (user_id, content, created_at, shares_count, comments_count, image_variants)
+            SELECT %s,
+                   array_to_string(ARRAY(
+                       -- half common words, half a long tail of rarer ones (topic42, topic977...)
+                       SELECT CASE WHEN random() < 0.5
+                                   THEN w[1 + floor(random() * array_length(w, 1))::int]
+                                   ELSE 'topic' || floor(power(random(), 2) * 50000)::int END
+                         FROM generate_series(1, 12 + (g %% 8))), ' '),
+                   now() - (g || ' seconds')::interval, 0, 0, '{}'
+              FROM generate_series(1, %s) AS g,
+                   (SELECT %s::text[] AS w) AS vocab
+            """,
+            [user.id, count, WORDS],
+        )
+        cursor.execute('ANALYZE tweets_tweet')
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tweets', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--term', default='topic4242', help='a selective term')
+    parser.add_argument('--common-term', default='sunset', help='a term in ~1/3 of all tweets')
+    parser.add_argument('--typo', default='sunest', help='misspelled term (trigram fallback)')
+    args = parser.parse_args()
+
+    def ilike(term):
+        # What DRF's SearchFilter generated: ILIKE ORs across the user join
+        return Tweet.objects.filter(
+            Q(content__icontains=term) | Q(user__username__icontains=term) | Q(ai_tags__icontains=term)
+        )
+
+    scenarios = {}
+    for label, term in (('rare', args.term), ('common', args.common_term)):
+        scenarios[f'ilike/{label}'] = lambda t=term: list(ilike(t).order_by('-created_at')[:20])
+        # The old page-number pagination also ran a COUNT over the same filter
+        scenarios[f'ilike+count/{label}'] = lambda t=term: ilike(t).count()
+        scenarios[f'fulltext/{label}'] = lambda t=term: ranked_search(Tweet.objects.all(), t, 0, 20)
+    scenarios['trigram/typo'] = lambda: ranked_search(Tweet.objects.all(), args.typo, 0, 20)
+
+    try:
+        with transaction.atomic():
+            start = time.perf_counter()
+            load(args.tweets)
+            print(f"loaded {args.tweets} tweets in {time.perf_counter() - start:.1f}s")
+
+            for name, fn in scenarios.items():
+                median, worst = timed(fn, args.repeat)
+                print(f"{name:<20} median {median:9.2f} ms   max {worst:9.2f} ms")
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
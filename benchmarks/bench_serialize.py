@@ -0,0 +1,111 @@
+"""
+Feed serialization benchmark: serialize + render time per 1,000 tweets.
+
+    python benchmarks/bench_serialize.py --tweets 1000 --repeat 20
+
+"drf"  is the per-row ModelSerializer path (every Field, SerializerMethodField
+and a nested CommentSerializer per tweet), "fast" is TweetSerializer.represent_many().
+Each is rendered with the stdlib JSON renderer, orjson and msgpack.
+Tweets are built in memory (with a 3-comment preview and image variants), so no
+database or Redis is required.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework import serializers  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from tweets.models import Comment, Tweet  # noqa: E402
+from tweets.renderers import MessagePackRenderer, ORJSONRenderer  # noqa: E402
+from tweets.serializers import TweetSerializer  # noqa: E402
+
+
+def make_tweets(count):
+    users = [User(id=i, username=f'user{i}') for i in range(1, 51)]
+    now = timezone.now()
+    tweets = []
+    for i in range(count):
+        tweet = Tweet(
+            id=i + 1, user=users[i % len(users)], content=f'tweet number {i} ' * 8,
+            created_at=now - timedelta(seconds=i), shares_count=i % 17, comments_count=3,
+            ai_tags='tabby, Egyptian cat, lynx' if i % 3 == 0 else None,
+            image_variants={
+                name: {'width': width, 'height': width // 2,
+                       'webp': f'tweet_images/variants/{i}/{name}.webp',
+                       'jpeg': f'tweet_images/variants/{i}/{name}.jpg'}
+                for name, width in (('thumb', 150), ('feed', 600), ('full', 1200))
+            } if i % 2 == 0 else {},
+        )
+        tweet.latest_comments = [
+            Comment(id=i * 3 + j, user=users[(i + j) % len(users)], tweet_id=tweet.id,
+                    text=f'comment {j}', created_at=now)
+            for j in range(3)
+        ]
+        tweet._shares_merged = True  # no Redis lookup
+        tweets.append(tweet)
+    return tweets
+
+
+def drf(tweets, context):
+    return serializers.ListSerializer(tweets, child=TweetSerializer(), context=context).data
+
+
+def fast(tweets, context):
+    return TweetSerializer(tweets, many=True, context=context).data
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tweets', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tweets = make_tweets(args.tweets)
+    request = Request(APIRequestFactory().get('/api/tweets/'))
+    context = {'request': request}
+    per_1000 = 1000 / args.tweets
+
+    renderers = [('json', JSONRenderer()), ('orjson', ORJSONRenderer()), ('msgpack', MessagePackRenderer())]
+    results = {}
+    for name, serialize in (('drf', drf), ('fast', fast)):
+        data = serialize(tweets, context)
+        serialize_time = timed(lambda: serialize(tweets, context), args.repeat)
+        for renderer_name, renderer in renderers:
+            body = renderer.render(data)
+            render_time = timed(lambda: renderer.render(data), args.repeat)
+            total = (serialize_time + render_time) * per_1000 * 1000
+            results[(name, renderer_name)] = total
+            print(f"{name:<5} + {renderer_name:<8} serialize {serialize_time * per_1000 * 1000:7.1f} ms  "
+                  f"render {render_time * per_1000 * 1000:6.1f} ms  total {total:7.1f} ms/1000 tweets  "
+                  f"{len(body) / 1024:7.0f} KiB")
+
+    print(f"speed-up (fast + orjson vs drf + json): "
+          f"{results[('drf', 'json')] / results[('fast', 'orjson')]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares run_suite.py result files: the first one is the baseline.
+
+    python benchmarks/compare_results.py results/<before>.json results/<after>.json
+    python benchmarks/compare_results.py before.json after.json --threshold 10   # exit 1 on a regression
+
+For every scenario in both files, prints the headline metrics and their change
+against the baseline. With --threshold, a metric more than that many percent
+worse (throughput down, latency or error rate up) is a regression, and the
+exit status is 1, so it can gate a CI job. Runs are only comparable on the
+same machine, data set and options: differences there are printed first.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True if higher is better
+METRICS = {
+    'requests_per_second': True,
+    'error_rate': False,
+    'p50_ms': False,
+    'p90_ms': False,
+    'p99_ms': False,
+    'handshake_p99_ms': False,
+    'delivery_p50_ms': False,
+    'delivery_p99_ms': False,
+    'notifications_received': True,
+}
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(baseline, other, threshold):
+    """Prints the comparison; returns the list of regressions."""
+    print(f"\n{baseline['commit'] or '?'}{'+' if baseline.get('dirty') else ''} -> "
+          f"{other['commit'] or '?'}{'+' if other.get('dirty') else ''} {other.get('label', '')}")
+    for key in ('host', 'dataset', 'options'):
+        # Which scenarios ran doesn't matter: only common ones are compared
+        before, after = ({k: v for k, v in (run.get(key) or {}).items() if k != 'scenario'} for run in (baseline, other))
+        if before != after:
+            print(f"  ⚠️  different {key}: {before} vs {after}")
+
+    regressions = []
+    for scenario, before in baseline['scenarios'].items():
+        after = other['scenarios'].get(scenario)
+        if after is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in before or metric not in after:
+                continue
+            delta = change(before[metric], after[metric])
+            worse = delta is not None and (-delta if higher_is_better else delta) > (threshold or 0)
+            flag = '❌' if worse and threshold is not None else '  '
+            shown = f'{delta:+7.1f}%' if delta is not None else '      -'
+            print(f"  {flag} {scenario:<12} {metric:<24} {before[metric]!s:>10} -> {after[metric]!s:>10}  {shown}")
+            if worse and threshold is not None:
+                regressions.append((scenario, metric, delta))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('files', nargs='+', help='result files, baseline first')
+    parser.add_argument('--threshold', type=float, help='percent; fail if a metric is this much worse')
+    args = parser.parse_args()
+
+    runs = []
+    for path in args.files:
+        with open(path) as f:
+            runs.append(json.load(f))
+    regressions = []
+    for other in runs[1:]:
+        regressions += compare(runs[0], other, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Synthetic data set for the load tests: users, follows, tweets (some with images) and comments.
+
+    python benchmarks/generate_data.py --users 100000 --tweets 10000000 --comments 20000000 --load
+    # in the compose stack (see docker-compose.bench.yml)
+    docker compose -f docker-compose.yml -f docker-compose.bench.yml run --rm bench \\
+        python benchmarks/generate_data.py --users 10000 --tweets 1000000 --load
+
+Writes users.csv and tweets.jsonl to --out, in the formats `manage.py
+bulk_ingest` reads, and JPEGs to the media storage (tweet_images/bench/). The
+same --seed always gives the same data. Shapes are skewed like real traffic:
+a few authors write most tweets and have most followers (some beyond
+TIMELINE_FANOUT_LIMIT, so both fan-out paths are used), words follow a Zipf
+law, a share of the images are near-duplicates of others (imagehash.py).
+
+--load loads everything through tweets/ingest.py (COPY, resumable: run it
+again after a crash), then writes and loads comments.jsonl (they need the new
+tweet ids), the follow graph and API tokens for the first --tokens users, the
+accounts run_suite.py logs in as. The tweet pipeline is deferred by default,
+so a backlog of moderation/image tasks doesn't skew the measurements; use
+--pipeline schedule to measure the workers as well.
+
+Users are named bench_<n> (password: bench-password). Nothing is rolled back:
+point it at a throwaway database.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+from bisect import bisect
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files.base import ContentFile  # noqa: E402
+from django.core.files.storage import default_storage  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from tweets import ingest  # noqa: E402
+from tweets.models import Follow  # noqa: E402
+
+USERNAME = 'bench_{}'
+PASSWORD = 'bench-password'
+IMAGE_PATH = 'tweet_images/bench/{}.jpg'
+
+WORDS = (
+    'cat dog coffee morning rain python django music concert football pizza travel '
+    'sunset beach mountain code bug deploy weekend movie book garden city night '
+    'train tea happy tired launch release startup meeting friday lunch game news '
+    'photo summer winter snow run gym dinner family birthday party road trip'
+).split()
+HASHTAGS = ['#python', '#django', '#music', '#travel', '#food', '#news', '#tech', '#sports']
+
+
+class Zipf:
+    """Picks ranks 0..n-1 with P(rank) ~ 1 / (rank + 1) ** s (rank 0 is the most popular)."""
+
+    def __init__(self, n, s=1.1):
+        self.cumulative = list(accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def pick(self, rng):
+        return min(bisect(self.cumulative, rng.random() * self.cumulative[-1]), len(self.cumulative) - 1)
+
+
+def sentence(rng, words, low=6, high=20):
+    text = ' '.join(WORDS[words.pick(rng)] for _ in range(rng.randint(low, high)))
+    if rng.random() < 0.2:
+        text += ' ' + rng.choice(HASHTAGS)
+    return text
+
+
+def make_image(rng, size=(640, 480), base=None):
+    """A JPEG with a few coloured shapes (so sizes and hashes vary), or a near-copy of `base`."""
+    if base is not None:
+        # Same picture, slightly brighter and re-encoded: a near-duplicate for imagehash
+        img = Image.open(io.BytesIO(base)).point(lambda v: min(255, v + 12))
+    else:
+        img = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(3, 12)):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            box = [x, y, x + rng.randint(20, 300), y + rng.randint(20, 300)]
+            colour = tuple(rng.randrange(256) for _ in range(3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=colour)
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def write_images(rng, count, duplicate_ratio):
+    images = []
+    for n in range(count):
+        base = images[rng.randrange(len(images))] if images and rng.random() < duplicate_ratio else None
+        images.append(make_image(rng, base=base))
+        path = IMAGE_PATH.format(n)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(images[-1]))
+    return count
+
+
+def write_users(path, count):
+    password = make_password(PASSWORD)  # one hash for everybody: hashing 10M passwords takes days
+    joined = datetime.now(timezone.utc) - timedelta(days=365)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['username', 'email', 'password', 'date_joined'])
+        for n in range(count):
+            writer.writerow([USERNAME.format(n), f'bench_{n}@example.com', password, joined.isoformat()])
+
+
+def write_tweets(path, rng, args):
+    authors, words = Zipf(args.users), Zipf(len(WORDS))
+    # Oldest first, so ids grow with created_at (see ingest.py)
+    start = datetime.now(timezone.utc) - timedelta(days=args.days)
+    step = timedelta(days=args.days) / max(1, args.tweets)
+    with open(path, 'w') as f:
+        for n in range(args.tweets):
+            tweet = {
+                'username': USERNAME.format(authors.pick(rng)),
+                'content': sentence(rng, words),
+                'created_at': (start + step * n).isoformat(),
+            }
+            if args.images and rng.random() < args.image_ratio:
+                tweet['image'] = IMAGE_PATH.format(rng.randrange(args.images))
+            f.write(json.dumps(tweet) + '\n')
+
+
+def write_comments(path, rng, args, first_id, last_id):
+    authors, words = Zipf(args.users, s=0.8), Zipf(len(WORDS))
+    # Recent tweets get most comments, and a few go viral
+    hot = [rng.randint(first_id, last_id) for _ in range(20)]
+    with open(path, 'w') as f:
+        for _ in range(args.comments):
+            if rng.random() < 0.1:
+                tweet_id = rng.choice(hot)
+            else:
+                tweet_id = last_id - int((last_id - first_id) * rng.random() ** 3)
+            comment = {'username': USERNAME.format(authors.pick(rng)), 'tweet_id': tweet_id,
+                       'text': sentence(rng, words, 2, 12)}
+            f.write(json.dumps(comment) + '\n')
+
+
+def load_follows(rng, args, batch_size=10000):
+    ids = list(User.objects.filter(username__startswith='bench_').order_by('id').values_list('id', flat=True))
+    popular = Zipf(len(ids))
+    batch = []
+    for follower in ids:
+        for _ in range(rng.randint(0, 2 * args.follows)):
+            following = ids[popular.pick(rng)]
+            if following != follower:
+                batch.append(Follow(follower_id=follower, following_id=following))
+        if len(batch) >= batch_size:
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)  # repeated picks are dropped
+            batch = []
+    Follow.objects.bulk_create(batch, ignore_conflicts=True)
+    return Follow.objects.filter(follower__username__startswith='bench_').count()
+
+
+def load_tokens(count):
+    users = User.objects.filter(username__in=[USERNAME.format(n) for n in range(count)])
+    Token.objects.bulk_create(
+        [Token(user=user, key=Token.generate_key()) for user in users.filter(auth_token__isnull=True)],
+        batch_size=1000,
+    )
+    return users.count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', default='/tmp/bench-data')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--tweets', type=int, default=1_000_000)
+    parser.add_argument('--comments', type=int, default=2_000_000)
+    parser.add_argument('--follows', type=int, default=50, help='average followees per user')
+    parser.add_argument('--images', type=int, default=200, help='distinct image files')
+    parser.add_argument('--image-ratio', type=float, default=0.1, help='share of tweets with an image')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.2, help='share of near-duplicate images')
+    parser.add_argument('--days', type=int, default=90, help='tweets are spread over this many days')
+    parser.add_argument('--tokens', type=int, default=1000, help='users given an API token (with --load)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--load', action='store_true', help='load it into the configured database')
+    parser.add_argument('--pipeline', choices=['defer', 'schedule'], default='defer')
+    parser.add_argument('--batch-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    files = {kind: os.path.join(args.out, name) for kind, name in (
+        ('users', 'users.csv'), ('tweets', 'tweets.jsonl'), ('comments', 'comments.jsonl'),
+    )}
+
+    def step(label, fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        print(f"{label:<22} {time.perf_counter() - start:8.1f}s")
+        return result
+
+    step('images', write_images, rng, args.images, args.duplicate_ratio)
+    step('users.csv', write_users, files['users'], args.users)
+    step('tweets.jsonl', write_tweets, files['tweets'], rng, args)
+    if not args.load:
+        print(f"written to {args.out} (comments need the tweet ids: use --load)")
+        return
+
+    options = {'batch_size': args.batch_size, 'log': lambda _: None}
+    step('load users', lambda: ingest.ingest('users', files['users'], **options))
+    tweets = step('load tweets', lambda: ingest.ingest('tweets', files['tweets'], pipeline=args.pipeline, **options))
+    if tweets.first_id is not None and args.comments:
+        step('comments.jsonl', write_comments, files['comments'], rng, args, tweets.first_id, tweets.last_id)
+        step('load comments', lambda: ingest.ingest('comments', files['comments'], **options))
+    follows = step('follows', load_follows, rng, args)
+    tokens = step('tokens', load_tokens, args.tokens)
+    print(json.dumps({
+        'users': args.users, 'tweets': tweets.rows, 'comments': args.comments, 'follows': follows,
+        'tokens': tokens, 'images': args.images, 'media_root': str(settings.MEDIA_ROOT), 'seed': args.seed,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
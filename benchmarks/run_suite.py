@@ -0,0 +1,305 @@
+"""
+Load-test suite for the whole stack: throughput and latency of every user-facing path, as JSON.
+
+    python benchmarks/generate_data.py --load        # once: the data set and API tokens
+    python benchmarks/run_suite.py --base-url http://localhost:8000
+    python benchmarks/run_suite.py --scenario search --scenario share --duration 60
+    python benchmarks/compare_results.py benchmarks/results/<before>.json benchmarks/results/<after>.json
+
+    # or everything inside the compose stack, with the local stand-ins
+    docker compose -f docker-compose.yml -f docker-compose.bench.yml up -d
+    docker compose -f docker-compose.yml -f docker-compose.bench.yml run --rm bench \\
+        python benchmarks/run_suite.py --base-url http://web:8000
+
+Scenarios run one after the other. Each is a closed loop like bench_http.py:
+--concurrency clients on keep-alive connections, each sending its next
+request once the previous one is answered; the first --warmup seconds are
+not counted.
+
+    feed_anon    GET /api/tweets/, anonymous (served from the response cache)
+    feed_user    GET /api/tweets/ as a user (no response cache)
+    timeline     GET /api/timeline/ (Redis home timelines, rebuilt on first read)
+    search       GET /api/tweets/search/?q=<one or two words>
+    post_media   POST /api/tweets/ with a 640x480 JPEG (queues the tweet pipeline)
+    share        POST /api/tweets/<id>/share/ on recent tweets, by their authors
+    graphql      POST /graphql/: 20 tweets with usernames and 3 comments each,
+                 anonymous like the web client (response cache)
+    ws_fanout    --ws-sockets notification sockets, one notification per user (ws_load.py;
+                 needs the notification publisher running)
+
+Users are the bench_<n> accounts with tokens from generate_data.py. The
+server must not rate-limit them: set THROTTLE_ANON_RATE and THROTTLE_USER_RATE
+very high (docker-compose.bench.yml does), or most answers are 429s.
+
+Results go to --out (default benchmarks/results/<UTC time>-<commit>.json): per
+scenario requests_per_second, error_rate, p50/p90/p99/max_ms and the status
+codes, plus the commit, whether the tree had local changes, the size of the
+data set and the options, so two runs can be compared (compare_results.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from bench_http import Connection, percentile  # noqa: E402
+from generate_data import WORDS, make_image  # noqa: E402
+from tweets.models import Tweet  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+BOUNDARY = 'bench-boundary-7MA4YWxkTrZu0gW'
+# What a browser sends back after loading the page: the CSRF cookie and the same value in a header
+CSRF_TOKEN = 'benchcsrftoken0123456789abcdefgh'
+CSRF = f'Cookie: csrftoken={CSRF_TOKEN}\r\nX-CSRFToken: {CSRF_TOKEN}\r\n'
+
+GRAPHQL_QUERY = json.dumps({'query': """
+    query Feed {
+      tweets(first: 20) {
+        edges { node { id content username sharesCount commentsCount comments(first: 3) { text user { username } } } }
+        pageInfo { hasNextPage endCursor }
+      }
+    }
+"""}).encode()
+
+
+def auth(token):
+    return f'Authorization: Token {token}\r\n'
+
+
+def search_terms(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 2)))
+
+
+def multipart(fields, files):
+    body = b''
+    for name, value in fields.items():
+        body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, (filename, content_type, content) in files.items():
+        body += (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode() + content + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+# --- SCENARIOS: setup(data) -> request(rng) -> (method, path, headers, body) ---
+
+def feed_anon(data):
+    return lambda rng: ('GET', '/api/tweets/', '', b'')
+
+
+def feed_user(data):
+    return lambda rng: ('GET', '/api/tweets/', auth(rng.choice(data['tokens'])), b'')
+
+
+def timeline(data):
+    return lambda rng: ('GET', '/api/timeline/', auth(rng.choice(data['tokens'])), b'')
+
+
+def search(data):
+    return lambda rng: ('GET', f'/api/tweets/search/?q={quote(search_terms(rng))}', '', b'')
+
+
+def post_media(data):
+    # A few different pictures, encoded once: the client must not be the bottleneck
+    images = [make_image(random.Random(seed)) for seed in range(8)]
+
+    def request(rng):
+        body = multipart(
+            {'content': f'{search_terms(rng)} (load test)'},
+            {'image': ('bench.jpg', 'image/jpeg', rng.choice(images))},
+        )
+        headers = auth(rng.choice(data['tokens'])) + f'Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n'
+        return 'POST', '/api/tweets/', headers, body
+    return request
+
+
+def share(data):
+    def request(rng):
+        tweet_id, token = rng.choice(data['shareable'])
+        return 'POST', f'/api/tweets/{tweet_id}/share/', auth(token), b''
+    return request
+
+
+def graphql(data):
+    return lambda rng: ('POST', '/graphql/', CSRF + 'Content-Type: application/json\r\n', GRAPHQL_QUERY)
+
+
+HTTP_SCENARIOS = {
+    'feed_anon': feed_anon,
+    'feed_user': feed_user,
+    'timeline': timeline,
+    'search': search,
+    'post_media': post_media,
+    'share': share,
+    'graphql': graphql,
+}
+SCENARIOS = list(HTTP_SCENARIOS) + ['ws_fanout']
+
+
+async def measure(base_url, request, args):
+    target = urlsplit(base_url)
+    host, port = target.hostname, target.port or 80
+    latencies, statuses, errors = [], Counter(), Counter()
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+
+    async def client(n):
+        rng = random.Random(args.seed + n)  # the same requests in the same order on every run
+        conn = Connection(host, port)
+        while time.perf_counter() < stop_at:
+            method, path, headers, body = request(rng)
+            sent = time.perf_counter()
+            try:
+                status, _ = await asyncio.wait_for(conn.request(method, path, headers, body), args.timeout)
+            except Exception as e:
+                conn.close()
+                if sent >= measure_from:
+                    errors[type(e).__name__] += 1
+                continue
+            if sent >= measure_from:
+                latencies.append(time.perf_counter() - sent)
+                statuses[status] += 1
+        conn.close()
+
+    await asyncio.gather(*[client(n) for n in range(args.concurrency)])
+
+    latencies.sort()
+    failed = sum(errors.values()) + sum(count for status, count in statuses.items() if status >= 400)
+    total = len(latencies) + sum(errors.values())
+    ms = lambda seconds: round(seconds * 1000, 1)  # noqa: E731
+    return {
+        'concurrency': args.concurrency,
+        'duration_seconds': args.duration,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / args.duration, 1),
+        'error_rate': round(failed / total, 4) if total else None,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'errors': dict(errors),
+        'p50_ms': ms(statistics.median(latencies)) if latencies else None,
+        'p90_ms': ms(percentile(latencies, 0.90)) if latencies else None,
+        'p99_ms': ms(percentile(latencies, 0.99)) if latencies else None,
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+
+async def ws_fanout(data, args):
+    import ws_load
+
+    options = argparse.Namespace(
+        url=args.ws_url, sockets=args.ws_sockets, concurrency=min(args.ws_sockets, 500),
+        timeout=args.timeout, hold=args.ws_hold,
+    )
+    return await ws_load.run(options, data['token_pairs'])
+
+
+# --- RUN METADATA ---
+
+def git(*command):
+    try:
+        return subprocess.run(['git', *command], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset_size():
+    # Planner estimates: COUNT(*) over 10M rows would take longer than some scenarios
+    tables = ['auth_user', 'tweets_tweet', 'tweets_comment', 'tweets_follow']
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)', [tables])
+        return dict(cursor.fetchall())
+
+
+def load_data(args):
+    pairs = list(
+        Token.objects.filter(user__username__startswith='bench_').order_by('user_id')
+        .values_list('user_id', 'key')[:args.users]
+    )
+    if not pairs:
+        sys.exit('No bench_<n> users with tokens: run benchmarks/generate_data.py --load first')
+    # Shares go to recent tweets, like real ones (the API only lets authors share their own)
+    keys = dict(pairs)
+    shareable = [
+        (tweet_id, keys[user_id]) for tweet_id, user_id in
+        Tweet.objects.filter(user_id__in=keys).order_by('-id').values_list('id', 'user_id')[:args.recent_tweets]
+    ]
+    return {'token_pairs': pairs, 'tokens': list(keys.values()), 'shareable': shareable}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--ws-url', help='default: ws://<base-url host>/ws/notifications/')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='repeat; default: all')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds sent but not counted')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--users', type=int, default=1000, help='bench users to log in as')
+    parser.add_argument('--recent-tweets', type=int, default=10000, help='tweets the share scenario picks from')
+    parser.add_argument('--ws-sockets', type=int, default=2000)
+    parser.add_argument('--ws-hold', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='', help='free text stored with the results, e.g. "prod profile"')
+    parser.add_argument('--out', help='result file (default: benchmarks/results/<UTC time>-<commit>.json)')
+    args = parser.parse_args()
+    args.ws_url = args.ws_url or f"ws://{urlsplit(args.base_url).netloc}/ws/notifications/"
+    scenarios = args.scenario or SCENARIOS
+
+    data = load_data(args)
+    commit = git('rev-parse', 'HEAD')
+    started = datetime.now(timezone.utc)
+    results = {
+        'commit': commit,
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')) if commit else None,
+        'label': args.label,
+        'started_at': started.isoformat(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'dataset': dataset_size(),
+        'options': {k: v for k, v in vars(args).items() if k not in ('out', 'label')},
+        'scenarios': {},
+    }
+
+    for name in scenarios:
+        print(f"▶️  {name}...", file=sys.stderr)
+        if name == 'ws_fanout':
+            result = asyncio.run(ws_fanout(data, args))
+        else:
+            result = asyncio.run(measure(args.base_url, HTTP_SCENARIOS[name](data), args))
+        results['scenarios'][name] = result
+        print(
+            f"   {result.get('requests_per_second', '-')} req/s, p99 {result.get('p99_ms', '-')} ms"
+            if name != 'ws_fanout' else
+            f"   {result['notifications_received']}/{result['notifications_expected']} delivered, "
+            f"p99 {result['delivery_p99_ms']} ms",
+            file=sys.stderr,
+        )
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{started:%Y%m%dT%H%M%SZ}-{(commit or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+WebSocket load test: hold N concurrent notification sockets and measure delivery.
+
+    # terminal 1-3: the ASGI server, the publisher and a local Redis
+    python manage.py runserver            # (daphne)
+    python manage.py run_notification_publisher
+    # terminal 4
+    python benchmarks/ws_load.py --sockets 10000 --users 1000 --hold 30
+
+Creates (or reuses) users `load_<n>` with DRF tokens, opens --sockets sockets
+spread round-robin over them, then queues one notification per user through
+the outbox (publisher.enqueue) and measures the time until every socket of
+that user received it. Results are printed as one JSON object.
+
+A minimal RFC 6455 client is built in, so nothing beyond the project's
+requirements is needed. Raise `ulimit -n` on the server for 10k sockets;
+the harness raises its own limit.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import statistics
+import struct
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from tweets import publisher  # noqa: E402
+
+
+class MiniWebSocket:
+    """Just enough of a WebSocket client: handshake, text frames, ping/pong, close."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, url):
+        parts = urlsplit(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        writer.write((
+            f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUpgrade: websocket\r\n'
+            f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+        ).encode())
+        response = await reader.readuntil(b'\r\n\r\n')
+        if not response.startswith(b'HTTP/1.1 101'):
+            writer.close()
+            raise ConnectionError(response.split(b'\r\n', 1)[0].decode())
+        return cls(reader, writer)
+
+    def _send(self, opcode, payload=b''):
+        mask = os.urandom(4)
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([0x80 | len(payload)])
+        else:
+            header += bytes([0x80 | 126]) + struct.pack('!H', len(payload))
+        self.writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    async def recv(self):
+        """Next text message, or None when the server closes."""
+        while True:
+            first, second = await self.reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('!H', await self.reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            opcode = first & 0x0F
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._send(0xA, payload)
+            elif opcode == 0x1:
+                return payload.decode()
+
+    async def close(self):
+        try:
+            self._send(0x8, struct.pack('!H', 1000))
+            await self.writer.drain()
+        finally:
+            self.writer.close()
+
+
+def make_tokens(count):
+    users = {u.username: u for u in User.objects.filter(username__startswith='load_')}
+    missing = [User(username=f'load_{i}') for i in range(count) if f'load_{i}' not in users]
+    for user in missing:
+        user.set_unusable_password()
+    User.objects.bulk_create(missing, batch_size=1000)
+    users = list(User.objects.filter(username__in=[f'load_{i}' for i in range(count)]).order_by('id'))
+    existing = set(Token.objects.filter(user__in=users).values_list('user_id', flat=True))
+    Token.objects.bulk_create(
+        [Token(user=u, key=Token.generate_key()) for u in users if u.id not in existing], batch_size=1000,
+    )
+    return list(Token.objects.filter(user__in=users).values_list('user_id', 'key'))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(args, tokens):
+    limit = asyncio.Semaphore(args.concurrency)
+    handshakes, failures, sockets = [], [], []
+
+    async def open_socket(user_id, key):
+        async with limit:
+            start = time.perf_counter()
+            try:
+                ws = await asyncio.wait_for(MiniWebSocket.connect(f'{args.url}?token={key}'), args.timeout)
+            except Exception as e:
+                failures.append(type(e).__name__)
+                return
+            handshakes.append(time.perf_counter() - start)
+            sockets.append((user_id, ws))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[open_socket(*tokens[i % len(tokens)]) for i in range(args.sockets)])
+    connect_time = time.perf_counter() - start
+
+    latencies = []
+
+    async def listen(ws):
+        while True:
+            message = await ws.recv()
+            if message is None:
+                return
+            body = json.loads(json.loads(message)['message'])
+            latencies.append(time.time() - body['sent'])
+
+    listeners = [asyncio.ensure_future(listen(ws)) for _, ws in sockets]
+    await asyncio.sleep(1)  # let presence settle
+
+    online_users = {user_id for user_id, _ in sockets}
+    for user_id in online_users:
+        publisher.enqueue(user_id, json.dumps({'type': 'load', 'sent': time.time()}))
+
+    await asyncio.sleep(args.hold)
+    for task in listeners:
+        task.cancel()
+    await asyncio.gather(*[ws.close() for _, ws in sockets], return_exceptions=True)
+
+    return {
+        'sockets_requested': args.sockets,
+        'sockets_open': len(sockets),
+        'connect_failures': len(failures),
+        'connect_errors': dict(Counter(failures)),
+        'connect_seconds': round(connect_time, 3),
+        'handshake_p50_ms': round(percentile(handshakes, 0.5) * 1000, 1) if handshakes else None,
+        'handshake_p99_ms': round(percentile(handshakes, 0.99) * 1000, 1) if handshakes else None,
+        'notifications_expected': len(sockets),
+        'notifications_received': len(latencies),
+        'delivery_p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'delivery_p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='ws://localhost:8000/ws/notifications/')
+    parser.add_argument('--sockets', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=500, help='handshakes in flight')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--hold', type=float, default=30, help='seconds to keep the sockets open')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.sockets + 1024)), hard))
+
+    tokens = make_tokens(args.users)
+    print(json.dumps(asyncio.run(run(args, tokens)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Cached token authentication (REST API and WebSockets).
+
+DRF's TokenAuthentication runs `authtoken_token JOIN auth_user` on every
+request. resolve_token() caches that in two levels:
+
+    process-local LRU   AUTH_TOKEN_LOCAL_MAX entries, AUTH_TOKEN_LOCAL_TTL seconds
+    Redis               auth:token:<sha256 of the key>, AUTH_TOKEN_CACHE_TTL seconds
+
+and only asks Postgres on a miss. Keys are hashed before they are used as
+Redis keys or published, so Redis never holds a usable token. The password
+hash isn't cached either: the user is rebuilt with it deferred (loaded, and
+saved, only if something asks for it).
+
+Revocation: deleting a token (logout, rotation, admin, user deletion) or
+saving a user (deactivated, renamed...) deletes the Redis entries and
+publishes on AUTH_REVOKE_CHANNEL. Every process listens on that channel in a
+background thread and drops its local copies; if the subscription breaks,
+the local cache is cleared when it comes back (messages may have been
+missed), and AUTH_TOKEN_LOCAL_TTL bounds how stale it can be meanwhile.
+
+A request that read the token row just before a logout committed must not put
+it back in the cache after the revocation. Every revocation takes a number
+from auth:revocations and stamps it on auth:revoked:token:<digest> and/or
+auth:revoked:user:<id>; a miss reads the counter BEFORE its DB query, and the
+fill (one Lua script) is refused if the token or its user was stamped since.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import redis
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .metrics import TOKEN_AUTH_LOOKUPS
+from .redis_client import get_redis
+
+TOKEN_KEY = 'auth:token:{}'
+USER_TOKENS_KEY = 'auth:user-tokens:{}'  # set of token digests cached for a user
+REVOCATIONS_KEY = 'auth:revocations'
+REVOKED_TOKEN_KEY = 'auth:revoked:token:{}'
+REVOKED_USER_KEY = 'auth:revoked:user:{}'
+AUTH_REVOKE_CHANNEL = 'auth:revoke'
+# Everything but the password hash, in model order (what Model.from_db() expects)
+USER_FIELDS = [f.attname for f in User._meta.concrete_fields if f.attname != 'password']
+DATETIME_FIELDS = {'last_login', 'date_joined'}
+
+# KEYS: token, user tokens, revoked token, revoked user. ARGV: counter before the DB query, fields, ttl, digest
+FILL_SCRIPT = """
+for i = 3, 4 do
+    local n = redis.call('GET', KEYS[i])
+    if n and tonumber(n) > tonumber(ARGV[1]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+# KEYS: counter, revoked markers. ARGV: ttl
+STAMP_SCRIPT = """
+local n = redis.call('INCR', KEYS[1])
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], n, 'EX', ARGV[1])
+end
+return n
+"""
+
+
+def digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class LocalTokenCache:
+    """A small thread-safe LRU of token digest -> user fields, with a TTL."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token_digest):
+        with self._lock:
+            entry = self._entries.get(token_digest)
+            if entry is None:
+                return None
+            expires, fields = entry
+            if expires < time.monotonic():
+                del self._entries[token_digest]
+                return None
+            self._entries.move_to_end(token_digest)
+            return fields
+
+    def set(self, token_digest, fields):
+        with self._lock:
+            self._entries[token_digest] = (time.monotonic() + self.ttl, fields)
+            self._entries.move_to_end(token_digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, token_digest):
+        with self._lock:
+            self._entries.pop(token_digest, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for token_digest in [d for d, (_, f) in self._entries.items() if f['id'] == user_id]:
+                del self._entries[token_digest]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = None
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def local_cache():
+    global _local
+    if _local is None:
+        _local = LocalTokenCache(settings.AUTH_TOKEN_LOCAL_MAX, settings.AUTH_TOKEN_LOCAL_TTL)
+    return _local
+
+
+def _apply_revocation(message):
+    kind, _, value = message.partition(':')
+    if kind == 'token':
+        local_cache().discard(value)
+    elif kind == 'user':
+        local_cache().discard_user(int(value))
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(settings.REDIS_URL).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(AUTH_REVOKE_CHANNEL)
+            # Whatever was revoked while we weren't subscribed is unknown: start over
+            local_cache().clear()
+            for message in pubsub.listen():
+                _apply_revocation(message['data'].decode())
+        except Exception as e:
+            print(f"❌ [Auth] Revocation listener lost Redis, retrying: {e}")
+            local_cache().clear()
+            time.sleep(1)
+
+
+def start_revocation_listener():
+    """One daemon thread per process (started on first use, i.e. after a fork)."""
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name='token-revocation', daemon=True)
+            _listener.start()
+
+
+def _user_fields(user):
+    return {
+        name: getattr(user, name).isoformat() if name in DATETIME_FIELDS and getattr(user, name) else getattr(user, name)
+        for name in USER_FIELDS
+    }
+
+
+def _build_user(fields):
+    # from_db(): a regular saved instance; fields not given (password) are deferred
+    values = [
+        datetime.fromisoformat(fields[name]) if name in DATETIME_FIELDS and fields[name] else fields[name]
+        for name in USER_FIELDS
+    ]
+    return User.from_db('default', USER_FIELDS, values)
+
+
+def resolve_token(key):
+    """The user of a token (active or not), or None if the token doesn't exist."""
+    start_revocation_listener()
+    token_digest = digest(key)
+
+    fields = local_cache().get(token_digest)
+    if fields is not None:
+        TOKEN_AUTH_LOOKUPS.labels('local').inc()
+        return _build_user(fields)
+
+    client = get_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.get(TOKEN_KEY.format(token_digest))
+        pipe.get(REVOCATIONS_KEY)
+        raw, revocations = pipe.execute()
+    except redis.RedisError as e:
+        print(f"❌ [Auth] Token cache unavailable, asking the DB: {e}")
+        client, raw = None, None
+    if raw is not None:
+        fields = json.loads(raw)
+        local_cache().set(token_digest, fields)
+        TOKEN_AUTH_LOOKUPS.labels('redis').inc()
+        return _build_user(fields)
+
+    TOKEN_AUTH_LOOKUPS.labels('db').inc()
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        return None
+    fields = _user_fields(token.user)
+    filled = True
+    if client is not None:
+        try:
+            filled = client.register_script(FILL_SCRIPT)(
+                keys=[
+                    TOKEN_KEY.format(token_digest), USER_TOKENS_KEY.format(token.user_id),
+                    REVOKED_TOKEN_KEY.format(token_digest), REVOKED_USER_KEY.format(token.user_id),
+                ],
+                args=[int(revocations or 0), json.dumps(fields), settings.AUTH_TOKEN_CACHE_TTL, token_digest],
+            )
+        except redis.RedisError:
+            pass
+    # Revoked while we were reading it: good enough for this request, not for the cache
+    if filled:
+        local_cache().set(token_digest, fields)
+    return _build_user(fields)
+
+
+def _revoke(messages, keys, markers):
+    for message in messages:
+        _apply_revocation(message)
+    try:
+        client = get_redis()
+        pipe = client.pipeline()
+        # Stamped first: a fill that read the DB before this can't land after it
+        client.register_script(STAMP_SCRIPT)(
+            keys=[REVOCATIONS_KEY, *markers], args=[settings.AUTH_TOKEN_CACHE_TTL], client=pipe,
+        )
+        if keys:
+            pipe.delete(*keys)
+        for message in messages:
+            pipe.publish(AUTH_REVOKE_CHANNEL, message)
+        pipe.execute()
+    except redis.RedisError as e:
+        # Other processes forget it within AUTH_TOKEN_LOCAL_TTL, Redis within AUTH_TOKEN_CACHE_TTL
+        print(f"❌ [Auth] Could not publish a token revocation: {e}")
+
+
+def revoke_token(key):
+    token_digest = digest(key)
+    _revoke([f'token:{token_digest}'], [TOKEN_KEY.format(token_digest)], [REVOKED_TOKEN_KEY.format(token_digest)])
+
+
+def revoke_user(user_id):
+    """Forgets every cached token of a user (their cached fields are out of date)."""
+    try:
+        digests = [d.decode() for d in get_redis().smembers(USER_TOKENS_KEY.format(user_id))]
+    except redis.RedisError:
+        digests = []
+    _revoke(
+        [f'user:{user_id}'], [TOKEN_KEY.format(d) for d in digests] + [USER_TOKENS_KEY.format(user_id)],
+        [REVOKED_USER_KEY.format(user_id)],
+    )
+
+
+def on_change(revoke, *args):
+    # Now, and again after the commit: a request that read the old row before the
+    # commit may have put it back in the cache in between
+    revoke(*args)
+    transaction.on_commit(lambda: revoke(*args))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication (Authorization: Token <key>) through resolve_token()."""
+
+    def authenticate_credentials(self, key):
+        user = resolve_token(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        token = Token(key=key, user_id=user.id)
+        token.user = user
+        return user, token
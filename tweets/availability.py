@@ -0,0 +1,90 @@
+"""
+"Is this username/email free?" for the signup form, which asks on every keystroke.
+
+Most names typed are free, so they are answered by a Bloom filter in Redis
+(bloom.py) without touching Postgres: "definitely not taken" is certain. Only
+a "maybe" (the name exists, or a ~AVAILABILITY_BLOOM_ERROR_RATE false
+positive) is confirmed in the DB, with the UPPER() unique indexes of
+migration 0013. The filter holds the same normalized (upper-cased) values
+those indexes compare, so "John" and "john" hit the same bits.
+
+Kept up to date by signals.py (every saved user is added before the
+transaction commits, so a new name is never reported free) and rebuilt daily
+from the DB (rebuild_availability_filters), which drops stale bits of renamed
+or deleted users. Deploys build the filters that don't exist yet right after
+`migrate` (`manage.py rebuild_availability_filters --missing`, see
+docker-compose.yml). Until then, or if Redis is down, every check goes to the DB.
+"""
+import redis
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .bloom import RedisBloomFilter
+from .metrics import AVAILABILITY_CHECKS
+
+KINDS = ('username', 'email')
+
+_filters = {}
+
+
+def get_filter(kind):
+    if kind not in _filters:
+        _filters[kind] = RedisBloomFilter(
+            f'availability:{kind}',
+            capacity=settings.AVAILABILITY_BLOOM_CAPACITY,
+            error_rate=settings.AVAILABILITY_BLOOM_ERROR_RATE,
+            shards=settings.AVAILABILITY_BLOOM_SHARDS,
+        )
+    return _filters[kind]
+
+
+def normalize(value):
+    return value.upper()
+
+
+def taken_queryset(kind, value):
+    if kind == 'username':
+        return User.objects.filter(username__iexact=value)
+    # email <> '' lets Postgres use the partial index (users without an email have '')
+    return User.objects.filter(email__iexact=value).exclude(email='')
+
+
+def is_taken(kind, value):
+    try:
+        maybe = get_filter(kind).might_contain(normalize(value))
+    except redis.RedisError as e:
+        print(f"❌ [Availability] Bloom filter unavailable, asking the DB: {e}")
+        maybe = None
+    if maybe is False:
+        AVAILABILITY_CHECKS.labels('bloom', 'free').inc()
+        return False
+    taken = taken_queryset(kind, value).exists()
+    AVAILABILITY_CHECKS.labels('db', 'taken' if taken else 'free').inc()
+    return taken
+
+
+def record(user):
+    """Adds a user's username and email (call it whenever they may have changed)."""
+    try:
+        get_filter('username').add(normalize(user.username))
+        if user.email:
+            get_filter('email').add(normalize(user.email))
+    except redis.RedisError as e:
+        # Harmless while it lasts: the next rebuild reads the DB
+        print(f"❌ [Availability] Could not add user #{user.pk} to the Bloom filter: {e}")
+
+
+def record_many(usernames, emails):
+    """record() for users inserted in bulk (ingest.py)."""
+    try:
+        get_filter('username').add_many(normalize(name) for name in usernames)
+        get_filter('email').add_many(normalize(email) for email in emails if email)
+    except redis.RedisError as e:
+        print(f"❌ [Availability] Could not add {len(usernames)} users to the Bloom filter: {e}")
+
+
+def rebuild(kind):
+    """Refills one filter from the DB. Returns how many values were read."""
+    field = 'username' if kind == 'username' else 'email'
+    values = User.objects.exclude(**{field: ''}).values_list(field, flat=True).iterator(chunk_size=10000)
+    return get_filter(kind).rebuild(normalize(value) for value in values)
@@ -0,0 +1,95 @@
+import time
+import uuid
+
+from .redis_client import get_redis
+
+# KEYS: pending list, processing list, leases (zset), ARGV: batch size, now, lease deadline
+CLAIM_SCRIPT = """
+-- Batches whose worker died (lease expired) go back to the front first
+for _, stale in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[2])) do
+    local items = redis.call('LRANGE', stale, 0, -1)
+    for i = #items, 1, -1 do
+        redis.call('LPUSH', KEYS[1], items[i])
+    end
+    redis.call('DEL', stale)
+    redis.call('ZREM', KEYS[3], stale)
+end
+local batch = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #batch > 0 then
+    redis.call('LTRIM', KEYS[1], #batch, -1)
+    redis.call('RPUSH', KEYS[2], unpack(batch))
+    redis.call('ZADD', KEYS[3], ARGV[3], KEYS[2])
+end
+return batch
+"""
+
+# KEYS: pending list, processing list, leases (zset)
+REQUEUE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[1], items[i])
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[3], KEYS[2])
+return #items
+"""
+
+
+class RedisBatchQueue:
+    """
+    A tiny shared buffer of pending IDs, stored as a Redis list.
+
+    Producers `push()` an ID; consumers `drain()` it in batches. A consumer waits
+    up to `max_wait` seconds for the batch to fill, so a burst of uploads handled
+    by different workers ends up in one batch instead of N single-item ones.
+    Every producer also drains, so an ID can never be left behind in the list.
+
+    A batch isn't popped, it's MOVED into the consumer's own processing list and
+    only deleted once the consumer asks for the next one. If the consumer raises,
+    the batch goes back to the front of the buffer when the generator is closed
+    (drain inside `contextlib.closing()`, so that happens right away); if the
+    worker dies, its processing list is put back by the next drain() after LEASE seconds.
+    """
+
+    POLL_INTERVAL = 0.01
+    # Longer than any batch takes (one model.predict + the saves)
+    LEASE = 300
+
+    def __init__(self, key, client=None):
+        self.key = key
+        self.leases_key = f'{key}:leases'
+        self.client = client or get_redis()
+
+    def push(self, item_id):
+        self.client.rpush(self.key, item_id)
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+    def drain(self, batch_size, max_wait):
+        """Yields lists of up to `batch_size` IDs until the buffer is empty."""
+        processing = f'{self.key}:processing:{uuid.uuid4().hex}'
+        keys = [self.key, processing, self.leases_key]
+        claim = self.client.register_script(CLAIM_SCRIPT)
+        while True:
+            deadline = time.monotonic() + max_wait
+            # Only wait while something is pending: an empty buffer means we're done
+            while 0 < len(self) < batch_size and time.monotonic() < deadline:
+                time.sleep(self.POLL_INTERVAL)
+
+            # Atomic, so two workers never get the same ID
+            now = time.time()
+            batch = claim(keys=keys, args=[batch_size, now, now + self.LEASE])
+            if not batch:
+                return
+            try:
+                yield [int(item_id) for item_id in batch]
+            except BaseException:
+                # The consumer failed (or stopped) mid-batch: someone else will do it
+                self.client.register_script(REQUEUE_SCRIPT)(keys=keys)
+                raise
+            # Back for more: the batch is done
+            pipe = self.client.pipeline()
+            pipe.delete(processing)
+            pipe.zrem(self.leases_key, processing)
+            pipe.execute()
@@ -0,0 +1,119 @@
+import hashlib
+import math
+
+from .redis_client import get_redis
+
+# Sets the item's bits in the live shard and, while a rebuild is running, in the
+# shard being built too. A filter that was never built stays missing (not "empty"),
+# so it can't claim a name is free before it knows every existing one.
+ADD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for i = 1, #ARGV do
+            redis.call('SETBIT', key, ARGV[i], 1)
+        end
+    end
+end
+"""
+
+# 1: every bit is set (maybe there), 0: one is not (definitely not), -1: not built
+CHECK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+for i = 1, #ARGV do
+    if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+        return 0
+    end
+end
+return 1
+"""
+
+
+class RedisBloomFilter:
+    """
+    A Bloom filter in Redis bitmaps: `might_contain()` is either "definitely
+    not added" or "maybe", with about `error_rate` false positives once
+    `capacity` items are in.
+
+    The bits are split over `shards` keys (an item only ever touches one), so
+    no single key grows past a few MB, shards spread over a Redis Cluster
+    (the {hash tag} keeps a shard and its rebuild copy in the same slot), and
+    every add or check is ONE atomic script call on one key.
+
+    Items can't be removed: a stale bit is only a false positive, which callers
+    confirm anyway. rebuild() starts over from the source of truth.
+    """
+
+    def __init__(self, name, capacity, error_rate, shards=16, client=None):
+        self.name = name
+        self.shards = shards
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.shard_bits = math.ceil(bits / shards)
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self.client = client or get_redis()
+        self._add = self.client.register_script(ADD_SCRIPT)
+        self._check = self.client.register_script(CHECK_SCRIPT)
+
+    def key(self, shard):
+        return f'bloom:{{{self.name}:{shard}}}'
+
+    def build_key(self, shard):
+        return f'{self.key(shard)}:build'
+
+    def _locate(self, item):
+        # Double hashing: k positions out of two 64-bit hashes; a third picks the shard
+        digest = hashlib.blake2b(item.encode(), digest_size=24).digest()
+        h1, h2, h3 = (int.from_bytes(digest[i:i + 8], 'little') for i in (0, 8, 16))
+        h2 |= 1
+        return h3 % self.shards, [(h1 + i * h2) % self.shard_bits for i in range(self.hashes)]
+
+    def add(self, item):
+        shard, positions = self._locate(item)
+        self._add(keys=[self.key(shard), self.build_key(shard)], args=positions)
+
+    def add_many(self, items):
+        """add() for a batch of items, in one round trip."""
+        pipe = self.client.pipeline(transaction=False)
+        for item in items:
+            shard, positions = self._locate(item)
+            self._add(keys=[self.key(shard), self.build_key(shard)], args=positions, client=pipe)
+        pipe.execute()
+
+    def might_contain(self, item):
+        """True/False, or None while the filter has never been built."""
+        shard, positions = self._locate(item)
+        found = self._check(keys=[self.key(shard)], args=positions)
+        return None if found == -1 else bool(found)
+
+    def is_built(self):
+        return self.client.exists(*(self.key(shard) for shard in range(self.shards))) == self.shards
+
+    def rebuild(self, items, batch_size=10000):
+        """
+        Fills a fresh copy from `items` (an iterable, e.g. a DB cursor) and swaps it
+        in shard by shard. add() also writes to the copy while this runs, so items
+        added during the rebuild are never lost. Returns how many items were read.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for shard in range(self.shards):
+            # Allocate the whole bitmap up front: the key now exists, so add() writes to it
+            pipe.delete(self.build_key(shard))
+            pipe.setbit(self.build_key(shard), self.shard_bits - 1, 0)
+        pipe.execute()
+
+        count = 0
+        for count, item in enumerate(items, 1):
+            shard, positions = self._locate(item)
+            # One BITFIELD for all k bits of an item instead of k SETBITs
+            args = []
+            for position in positions:
+                args += ['SET', 'u1', position, 1]
+            pipe.execute_command('BITFIELD', self.build_key(shard), *args)
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+
+        for shard in range(self.shards):
+            self.client.rename(self.build_key(shard), self.key(shard))
+        return count
@@ -0,0 +1,240 @@
+"""
+Response cache for anonymous reads (feed pages, tweet detail, GraphQL).
+
+Each cached response is two Redis keys:
+    resp:<viewer>:<kind>:<hash>         the pickled payload (lives RESPONSE_CACHE_STALE_TTL)
+    resp:<viewer>:<kind>:<hash>:fresh   a marker (lives RESPONSE_CACHE_FRESH_TTL)
+
+Invalidation only deletes the `:fresh` markers of the responses that contain
+the changed tweet (tracked in resp:deps:tweet:<id>), or of first pages when a
+new tweet is posted. Keyset cursors make every other page stable.
+
+A response computed while one of ITS tweets was invalidated is stored but not
+marked fresh. Every invalidation takes a number from resp:invalidations and
+writes it to resp:gen:tweet:<id> (or resp:gen:head); the response is marked
+fresh only if none of its deps has a number above the one read before computing.
+Invalidations of other tweets don't matter.
+
+Stampede protection (lock-or-serve-stale): when a response is stale, ONE
+request takes a short lock and recomputes it, everyone else keeps getting the
+stale payload until it is done.
+"""
+import hashlib
+import pickle
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .metrics import RESPONSE_CACHE_EVICTIONS, RESPONSE_CACHE_REQUESTS
+
+HEAD_DEPS_KEY = 'resp:deps:head'
+HEAD_GENERATION_KEY = 'resp:gen:head'
+INVALIDATIONS_KEY = 'resp:invalidations'
+GRAPHQL_GENERATION_KEY = 'resp:graphql:generation'
+LOCK_TIMEOUT = 10     # seconds
+WAIT_TIMEOUT = 1.0    # how long a request without any payload waits for the lock holder
+POLL_INTERVAL = 0.02
+
+# KEYS: invalidation counter, generation key of the deps. ARGV: ttl
+BUMP_SCRIPT = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[2], n, 'EX', ARGV[1])
+return n
+"""
+
+# KEYS: fresh marker, generation keys of the deps. ARGV: counter before computing, ttl
+MARK_FRESH_SCRIPT = """
+for i = 2, #KEYS do
+    local n = redis.call('GET', KEYS[i])
+    if n and tonumber(n) > tonumber(ARGV[1]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[2])
+return 1
+"""
+
+
+def _conn():
+    return get_redis_connection('default')
+
+
+def tweet_deps_key(tweet_id):
+    return f'resp:deps:tweet:{tweet_id}'
+
+
+def tweet_generation_key(tweet_id):
+    return f'resp:gen:tweet:{tweet_id}'
+
+
+def viewer_class(request, user=None):
+    """
+    Which group of viewers can share one cached response, or None to skip caching.
+    Only anonymous viewers for now: for them `is_owner` is always False.
+    Async views pass `user` (from `await request.auser()`).
+    """
+    user = user if user is not None else getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    return None
+
+
+def make_key(kind, viewer, *parts):
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()
+    return f'resp:{viewer}:{kind}:{digest}'
+
+
+def graphql_generation():
+    # GraphQL responses can contain any tweet, so they are invalidated all at once
+    return int(_conn().get(GRAPHQL_GENERATION_KEY) or 0)
+
+
+def _begin(key, kind):
+    """
+    First step of a lookup. Returns (state, value, invalidations):
+      'hit'     -> value is the (fresh or stale) cached value
+      'compute' -> we hold the lock and must compute + store it
+      'wait'    -> someone else holds the lock and there is nothing to serve yet
+    """
+    conn = _conn()
+    payload, fresh = conn.mget(key, key + ':fresh')
+    if payload is not None and fresh is not None:
+        RESPONSE_CACHE_REQUESTS.labels(kind, 'hit').inc()
+        return 'hit', pickle.loads(payload), None
+
+    if conn.set(key + ':lock', 1, nx=True, ex=LOCK_TIMEOUT):
+        RESPONSE_CACHE_REQUESTS.labels(kind, 'miss').inc()
+        return 'compute', None, int(conn.get(INVALIDATIONS_KEY) or 0)
+
+    # Someone else is already recomputing this response
+    if payload is not None:
+        RESPONSE_CACHE_REQUESTS.labels(kind, 'stale').inc()
+        return 'hit', pickle.loads(payload), None
+    return 'wait', None, None
+
+
+def _wait(key, kind):
+    """Polls briefly for the lock holder's result. Returns ('hit', value) or ('uncached', None)."""
+    conn = _conn()
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        payload = conn.get(key)
+        if payload is not None:
+            RESPONSE_CACHE_REQUESTS.labels(kind, 'hit').inc()
+            return 'hit', pickle.loads(payload)
+    RESPONSE_CACHE_REQUESTS.labels(kind, 'miss').inc()
+    return 'uncached', None
+
+
+def _finish(key, value, deps, head, cacheable, invalidations):
+    conn = _conn()
+    try:
+        if cacheable is None or cacheable(value):
+            _store(conn, key, value, deps(value) if deps else (), head, invalidations)
+    finally:
+        conn.delete(key + ':lock')
+
+
+def _release(key):
+    _conn().delete(key + ':lock')
+
+
+def get_or_compute(key, kind, compute, deps=None, head=False, cacheable=None):
+    """
+    Returns the cached value for `key`, or computes and stores it.
+
+    deps(value) -> tweet IDs the value contains (to invalidate it precisely).
+    head=True: the value is a first page, so new tweets invalidate it.
+    cacheable(value) -> False to skip storing (e.g. error responses).
+    """
+    state, value, invalidations = _begin(key, kind)
+    if state == 'wait':
+        state, value = _wait(key, kind)
+    if state == 'hit':
+        return value
+    if state == 'uncached':
+        return compute()
+
+    try:
+        value = compute()
+    except BaseException:
+        _release(key)
+        raise
+    _finish(key, value, deps, head, cacheable, invalidations)
+    return value
+
+
+async def aget_or_compute(key, kind, compute, deps=None, head=False, cacheable=None):
+    """get_or_compute() for async views: `compute` is a coroutine function."""
+    state, value, invalidations = await sync_to_async(_begin, thread_sensitive=False)(key, kind)
+    if state == 'wait':
+        state, value = await sync_to_async(_wait, thread_sensitive=False)(key, kind)
+    if state == 'hit':
+        return value
+    if state == 'uncached':
+        return await compute()
+
+    try:
+        value = await compute()
+    except BaseException:
+        await sync_to_async(_release, thread_sensitive=False)(key)
+        raise
+    await sync_to_async(_finish, thread_sensitive=False)(key, value, deps, head, cacheable, invalidations)
+    return value
+
+
+def _store(conn, key, value, tweet_ids, head, invalidations_before):
+    pipe = conn.pipeline()
+    pipe.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=settings.RESPONSE_CACHE_STALE_TTL)
+    for tweet_id in tweet_ids:
+        pipe.sadd(tweet_deps_key(tweet_id), key)
+        pipe.expire(tweet_deps_key(tweet_id), settings.RESPONSE_CACHE_STALE_TTL)
+    if head:
+        pipe.sadd(HEAD_DEPS_KEY, key)
+    pipe.execute()
+
+    # If one of our tweets was invalidated while we were computing, our value may
+    # already be out of date: keep it as a stale fallback, but don't mark it fresh.
+    # Checked and set in one script, or an invalidation could slip in between.
+    generations = [tweet_generation_key(tweet_id) for tweet_id in tweet_ids]
+    if head:
+        generations.append(HEAD_GENERATION_KEY)
+    conn.register_script(MARK_FRESH_SCRIPT)(
+        keys=[key + ':fresh', *generations], args=[invalidations_before, settings.RESPONSE_CACHE_FRESH_TTL],
+    )
+
+
+def _expire(conn, deps_key, generation_key, reason, graphql):
+    keys = conn.smembers(deps_key)
+    pipe = conn.pipeline()
+    # The generation lives as long as the payloads, longer than any computation that read the old data
+    conn.register_script(BUMP_SCRIPT)(
+        keys=[INVALIDATIONS_KEY, generation_key], args=[settings.RESPONSE_CACHE_STALE_TTL], client=pipe,
+    )
+    if graphql:
+        pipe.incr(GRAPHQL_GENERATION_KEY)
+    pipe.delete(deps_key, *[k + b':fresh' for k in keys])
+    pipe.execute()
+    if keys:
+        RESPONSE_CACHE_EVICTIONS.labels(reason).inc(len(keys))
+
+
+def invalidate_tweet(tweet_id, reason='tweet', graphql=True):
+    """
+    The tweet changed (content, ai_tags, comments, shares...) or was deleted.
+    graphql=False when the change doesn't show in GraphQL responses (see types.py).
+    """
+    _expire(_conn(), tweet_deps_key(tweet_id), tweet_generation_key(tweet_id), reason, graphql)
+
+
+def invalidate_head(reason='new_tweet'):
+    """A new tweet was posted: first pages of the feed are out of date."""
+    _expire(_conn(), HEAD_DEPS_KEY, HEAD_GENERATION_KEY, reason, graphql=True)
+
+
+def invalidate_graphql():
+    """For changes only GraphQL shows as they are, e.g. shares_count once flushed to the DB."""
+    _conn().incr(GRAPHQL_GENERATION_KEY)
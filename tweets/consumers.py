@@ -1,13 +1,34 @@
 import json
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from . import notifications, presence, ratelimit
+from .metrics import RATE_LIMITED
+from .publisher import group_name
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        # Get the user from the scope (Authenticated via Token later)
-        # For simplicity, we will rely on the frontend sending the user ID in the URL for now
-        # Real-world apps use Middleware to decode the Token in headers.
-        self.user_id = self.scope['url_route']['kwargs']['user_id']
-        self.room_group_name = f'notifications_{self.user_id}'
+        # scope['user'] comes from TokenAuthMiddleware (?token=<DRF token>) or the session
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        # Old URL with the id in it (ws/notifications/<user_id>/): only your own notifications
+        url_user_id = self.scope['url_route']['kwargs'].get('user_id')
+        if url_user_id is not None and int(url_user_id) != user.id:
+            await self.close(code=4403)
+            return
+
+        # Reconnect storms spend the same budget as the REST API (see ratelimit.py)
+        scope, identity = ratelimit.identify(user, None)
+        if not (await ratelimit.ahit(scope, identity, 'ws_connect')).allowed:
+            RATE_LIMITED.labels('websocket', scope).inc()
+            await self.close(code=4429)
+            return
+
+        self.user_id = user.id
+        self.room_group_name = group_name(self.user_id)
 
         # Join the user's personal group
         await self.channel_layer.group_add(
@@ -15,20 +36,45 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+        # Online from now on: the publisher sends to this user again. Registered
+        # before accept(), so the user is online by the time the client sees the
+        # socket open (group messages wait in the channel until connect() returns)
+        await presence.registry.add(self.user_id, self.channel_name)
         await self.accept()
 
+        # Reconnecting with ?cursor=<id of the last notification seen>: send what was missed.
+        # Done AFTER joining the group, so nothing falls in between (the client skips
+        # ids it already has, in case one arrives both ways).
+        cursor = parse_qs(self.scope.get('query_string', b'').decode()).get('cursor')
+        if cursor and cursor[0].isdigit():
+            await self.send(text_data=json.dumps(await self.replay(int(cursor[0]))))
+
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return  # rejected in connect()
+        await presence.registry.remove(self.channel_name)
         # Leave group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    # Receive message from the group (Internal Django Signal)
+    @database_sync_to_async
+    def replay(self, cursor):
+        from .serializers import NotificationSerializer
+        rows, more = notifications.replay(self.user_id, cursor)
+        return {
+            'replay': NotificationSerializer(rows, many=True).data,
+            'more': more,  # fetch the rest from /api/notifications/
+            'unread': notifications.unread_count(self.user_id),
+        }
+
+    # Receive message from the group (sent by publisher.py)
     async def send_notification(self, event):
         message = event['message']
 
-        # Send message to WebSocket (Frontend)
+        # Send message to WebSocket (Frontend), with the inbox row and unread count if any
         await self.send(text_data=json.dumps({
-            'message': message
-        }))
\ No newline at end of file
+            'message': message,
+            **event.get('extra', {}),
+        }))
@@ -0,0 +1,107 @@
+"""
+Write-behind share counter.
+
+A share is one atomic HINCRBY on a Redis hash (no DB row lock, no lost updates).
+The Celery beat task `flush_share_counts` periodically moves the pending deltas
+into Tweet.shares_count with a single `shares_count = shares_count + CASE ...`
+UPDATE per chunk. Reads add whatever is still pending in Redis.
+"""
+import uuid
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from . import cache
+from .redis_client import get_redis
+
+PENDING_KEY = 'shares:pending'
+FLUSHING_KEY = 'shares:flushing'  # deltas taken by a flush that has not finished yet
+FLUSH_ID_KEY = 'shares:flushing:id'  # which flush they belong to (a ShareFlush row once applied)
+FLUSH_LOCK_KEY = 'shares:flush-lock'
+FLUSH_LOCK_TIMEOUT = 60  # seconds
+FLUSH_CHUNK_SIZE = 500
+
+
+def incr_share(tweet_id):
+    """Records one share. Returns the number of shares not yet flushed to the DB."""
+    client = get_redis()
+    pipe = client.pipeline()
+    pipe.hincrby(PENDING_KEY, tweet_id, 1)
+    pipe.hget(FLUSHING_KEY, tweet_id)
+    pending, flushing = pipe.execute()
+    return pending + int(flushing or 0)
+
+
+def pending_shares(tweet_ids):
+    """{tweet_id: delta} for shares not yet in the DB (one round-trip for the whole list)."""
+    if not tweet_ids:
+        return {}
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hmget(PENDING_KEY, tweet_ids)
+    pipe.hmget(FLUSHING_KEY, tweet_ids)
+    pending, flushing = pipe.execute()
+    return {
+        tweet_id: int(p or 0) + int(f or 0)
+        for tweet_id, p, f in zip(tweet_ids, pending, flushing)
+    }
+
+
+def merge_pending_shares(tweets):
+    """Adds the pending deltas to `tweet.shares_count` in memory (once per object)."""
+    todo = [tweet for tweet in tweets if not getattr(tweet, '_shares_merged', False)]
+    deltas = pending_shares([tweet.id for tweet in todo])
+    for tweet in todo:
+        tweet.shares_count += deltas.get(tweet.id, 0)
+        tweet._shares_merged = True
+    return tweets
+
+
+def flush_shares():
+    """
+    Moves pending deltas into the DB. Returns the number of tweets updated.
+
+    RENAME swaps the hash out atomically, so shares that arrive during the flush
+    land in a fresh `shares:pending` and are picked up next time. If a previous
+    flush died before deleting `shares:flushing`, it is retried first: its id is
+    recorded (ShareFlush) in the same transaction as the UPDATE, so deltas that
+    did reach the DB are not applied again.
+    """
+    from .models import ShareFlush, Tweet
+
+    client = get_redis()
+    # Only one flusher at a time (the flush id covers a lock that expired mid-flush)
+    lock = client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        return 0
+    try:
+        if not client.exists(FLUSHING_KEY):
+            if not client.exists(PENDING_KEY):
+                return 0
+            client.rename(PENDING_KEY, FLUSHING_KEY)
+        # Kept until the hash is deleted: a retry reuses it
+        client.set(FLUSH_ID_KEY, uuid.uuid4().hex, nx=True)
+        flush_id = uuid.UUID(client.get(FLUSH_ID_KEY).decode())
+
+        deltas = {int(k): int(v) for k, v in client.hgetall(FLUSHING_KEY).items() if int(v)}
+        items = list(deltas.items())
+        with transaction.atomic():
+            _, applying = ShareFlush.objects.get_or_create(id=flush_id)
+            if applying:
+                # Only the last flush can ever be retried
+                ShareFlush.objects.exclude(id=flush_id).delete()
+                for i in range(0, len(items), FLUSH_CHUNK_SIZE):
+                    chunk = items[i:i + FLUSH_CHUNK_SIZE]
+                    Tweet.objects.filter(id__in=[tweet_id for tweet_id, _ in chunk]).update(
+                        shares_count=F('shares_count') + Case(
+                            *[When(id=tweet_id, then=Value(delta)) for tweet_id, delta in chunk],
+                            default=Value(0),
+                        )
+                    )
+        client.delete(FLUSHING_KEY, FLUSH_ID_KEY)
+        if not applying:
+            return 0
+        if items:
+            cache.invalidate_graphql()
+        return len(items)
+    finally:
+        lock.release()
@@ -0,0 +1,233 @@
+"""
+Guard rails and metrics for the GraphQL endpoint (registered in schema.py).
+
+1. QueryCostRule: a validation rule that estimates how many fields a query can
+   resolve BEFORE running it. Each field costs 1, times the size of every list
+   above it (the `first` argument, or its default). Queries over
+   settings.GRAPHQL_MAX_COST are rejected. Depth is capped separately with
+   Strawberry's QueryDepthLimiter (settings.GRAPHQL_MAX_DEPTH).
+
+2. PersistedQueries (the Apollo "automatic persisted queries" protocol): the
+   client sends `extensions.persistedQuery.sha256Hash`. The first time it also
+   sends the query text; once it has been parsed and validated, the document is
+   kept in an in-process LRU and later requests with only the hash skip the
+   parse and validate steps. An unknown hash answers `PersistedQueryNotFound`
+   so the client retries with the full text.
+
+3. ResolverMetrics: Prometheus histograms of resolver timings per operation.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from inspect import isawaitable
+
+from django.conf import settings
+from graphql import GraphQLError, get_named_type, get_operation_ast, parse
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphql.validation import ValidationRule
+from strawberry.extensions import AddValidationRules, SchemaExtension
+
+from .metrics import GRAPHQL_OPERATION_SECONDS, GRAPHQL_RESOLVER_SECONDS
+
+# --- 1. STATIC COST ANALYSIS ---
+
+def _list_size(node, field_def):
+    """How many items a field can return, from its `first` argument."""
+    if 'first' not in field_def.args:
+        return 1
+    for argument in node.arguments or ():
+        if argument.name.value != 'first':
+            continue
+        value = argument.value
+        if value.kind == 'int_value':
+            return max(0, int(value.value))
+        if value.kind == 'variable':
+            # The document is validated once for all variable values, and a declared
+            # default says nothing about the value sent: assume the worst
+            return settings.GRAPHQL_MAX_LIST_SIZE
+    default = field_def.args['first'].default_value
+    return default if isinstance(default, int) else settings.GRAPHQL_MAX_LIST_SIZE
+
+
+class QueryCostRule(ValidationRule):
+    def enter_operation_definition(self, node, *args):
+        root = self.context.schema.get_root_type(node.operation)
+        cost = self._cost(node.selection_set, root, 1, set())
+        if cost > settings.GRAPHQL_MAX_COST:
+            self.report_error(GraphQLError(
+                f'Query is too expensive: estimated cost {cost} exceeds the limit of '
+                f'{settings.GRAPHQL_MAX_COST}. Ask for fewer items (first) or fewer nested fields.',
+                node,
+            ))
+
+    def _cost(self, selection_set, parent_type, multiplier, fragments):
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_def = getattr(parent_type, 'fields', {}).get(selection.name.value)
+                if field_def is None:
+                    continue  # __typename, introspection or unknown fields (reported by other rules)
+                total += multiplier
+                if selection.selection_set:
+                    size = _list_size(selection, field_def)
+                    total += self._cost(
+                        selection.selection_set, get_named_type(field_def.type), multiplier * size, fragments,
+                    )
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.context.schema.get_type(selection.type_condition.name.value)
+                total += self._cost(selection.selection_set, fragment_type, multiplier, fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.context.get_fragment(name)
+                if fragment is None or name in fragments:
+                    continue  # cycles are reported by NoFragmentCyclesRule
+                fragment_type = self.context.schema.get_type(fragment.type_condition.name.value)
+                total += self._cost(fragment.selection_set, fragment_type, multiplier, fragments | {name})
+        return total
+
+
+class QueryCostLimiter(AddValidationRules):
+    def __init__(self):
+        super().__init__([QueryCostRule])
+
+
+# --- 2. PERSISTED QUERIES ---
+
+class DocumentLRU:
+    """sha256 -> parsed and validated DocumentNode, shared by all requests of the process."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            document = self._documents.get(digest)
+            if document is not None:
+                self._documents.move_to_end(digest)
+            return document
+
+    def put(self, digest, document):
+        with self._lock:
+            self._documents[digest] = document
+            self._documents.move_to_end(digest)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+    def __len__(self):
+        return len(self._documents)
+
+
+persisted_documents = DocumentLRU(settings.GRAPHQL_PERSISTED_QUERY_CACHE_SIZE)
+
+
+def persisted_hash(operation_extensions):
+    if not isinstance(operation_extensions, dict):
+        return None
+    persisted = operation_extensions.get('persistedQuery')
+    if not isinstance(persisted, dict) or persisted.get('version', 1) != 1:
+        return None
+    return persisted.get('sha256Hash')
+
+
+def operation_type(body):
+    """
+    'query', 'mutation' or 'subscription': what a POST body would run, from its
+    parsed (or persisted) document. None if that can't be told: batches, unknown
+    hashes, syntax errors... the request then fails or is handled normally.
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    digest = persisted_hash(data.get('extensions'))
+    document = persisted_documents.get(digest) if digest else None
+    if document is None:
+        if not isinstance(data.get('query'), str):
+            return None
+        try:
+            document = parse(data['query'])
+        except GraphQLError:
+            return None
+    operation_name = data.get('operationName')
+    operation = get_operation_ast(document, operation_name if isinstance(operation_name, str) else None)
+    return operation.operation.value if operation else None
+
+
+class PersistedQueries(SchemaExtension):
+    def on_operation(self):
+        context = self.execution_context
+        digest = persisted_hash(context.operation_extensions)
+        if digest:
+            if context.query:
+                if hashlib.sha256(context.query.encode()).hexdigest() != digest:
+                    raise GraphQLError('provided sha does not match query')
+            else:
+                document = persisted_documents.get(digest)
+                if document is None:
+                    raise GraphQLError('PersistedQueryNotFound', extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+                # Already parsed and validated: an empty error list makes Strawberry skip validation
+                context.graphql_document = document
+                context.pre_execution_errors = []
+        yield
+
+    def on_validate(self):
+        yield
+        context = self.execution_context
+        digest = persisted_hash(context.operation_extensions)
+        # Only documents that passed validation (cost and depth included) are kept
+        if digest and context.query and not context.pre_execution_errors:
+            persisted_documents.put(digest, context.graphql_document)
+
+
+# --- 3. RESOLVER METRICS ---
+
+def _operation_label(execution_context):
+    # Only persisted operations keep their name, so clients can't create unbounded label values
+    if persisted_hash(execution_context.operation_extensions):
+        return execution_context.operation_name or 'anonymous'
+    return 'adhoc'
+
+
+class ResolverMetrics(SchemaExtension):
+    """
+    Times every root field and every async (DataLoader / DB) resolver. Plain
+    attribute lookups are not timed: they are nearly free and very numerous.
+    """
+
+    def on_operation(self):
+        start = time.perf_counter()
+        yield
+        GRAPHQL_OPERATION_SECONDS.labels(_operation_label(self.execution_context)).observe(
+            time.perf_counter() - start
+        )
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        is_root = info.path.prev is None
+        start = time.perf_counter()
+        result = _next(root, info, *args, **kwargs)
+        if not isawaitable(result) and not is_root:
+            return result
+
+        labels = (_operation_label(self.execution_context), f'{info.parent_type.name}.{info.field_name}')
+        if not isawaitable(result):
+            GRAPHQL_RESOLVER_SECONDS.labels(*labels).observe(time.perf_counter() - start)
+            return result
+
+        async def timed():
+            try:
+                return await result
+            finally:
+                GRAPHQL_RESOLVER_SECONDS.labels(*labels).observe(time.perf_counter() - start)
+        return timed()
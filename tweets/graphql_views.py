@@ -0,0 +1,76 @@
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from strawberry.django.views import AsyncGraphQLView
+
+from . import cache, ratelimit
+from .authentication import resolve_token
+from .graphql_extensions import operation_type
+from .loaders import GraphQLContext
+from .metrics import RATE_LIMITED
+
+
+async def request_user(request):
+    """
+    `Authorization: Token <key>` (same cached resolver as the REST API and
+    ws_auth.py), else the session user. A wrong token means AnonymousUser.
+    """
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword.lower() == 'token' and key.strip():
+        user = await sync_to_async(resolve_token)(key.strip())
+        return user if user is not None and user.is_active else AnonymousUser()
+    return await request.auser()
+
+
+class CachedGraphQLView(AsyncGraphQLView):
+    """
+    Async GraphQLView with request-scoped DataLoaders in the context
+    (info.context.loaders), that answers anonymous queries from the response cache.
+    The key is the raw request body (query + variables), plus a generation
+    number that new tweets and changes GraphQL shows bump (see cache.py).
+    """
+
+    async def get_context(self, request, response):
+        return GraphQLContext(request=request, response=response)
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = request.user = await request_user(request)
+
+        # From the document, not the text: 'mutation' can be in a variable, or a query's name.
+        # GET can only run queries (Strawberry refuses the rest).
+        operation = operation_type(request.body) if request.method == 'POST' else None
+
+        # Same budget as the REST API (see ratelimit.py); cached answers count too
+        scope, identity = ratelimit.identify(user, ratelimit.client_ip(request))
+        decision = await ratelimit.ahit(scope, identity, 'write' if operation == 'mutation' else 'graphql')
+        if not decision.allowed:
+            RATE_LIMITED.labels('graphql', scope).inc()
+            wait = math.ceil(decision.retry_after)
+            response = JsonResponse(
+                {'errors': [{'message': f'Request was throttled. Expected available in {wait} seconds.',
+                             'extensions': {'code': 'RATE_LIMITED', 'retryAfter': wait}}]},
+                status=429,
+            )
+            response['Retry-After'] = str(wait)
+            return response
+
+        viewer = cache.viewer_class(request, user)
+        # Only plain queries are cached: never mutations, batches or unknown persisted hashes
+        if viewer is None or operation != 'query':
+            return await super().dispatch(request, *args, **kwargs)
+
+        generation = await sync_to_async(cache.graphql_generation, thread_sensitive=False)()
+        key = cache.make_key('graphql', viewer, generation, request.body)
+
+        async def compute():
+            response = await super(CachedGraphQLView, self).dispatch(request, *args, **kwargs)
+            return response.status_code, response['Content-Type'], response.content
+
+        status, content_type, content = await cache.aget_or_compute(
+            key, 'graphql', compute,
+            # Never cache errors
+            cacheable=lambda value: value[0] == 200 and b'"errors"' not in value[2],
+        )
+        return HttpResponse(content, status=status, content_type=content_type)
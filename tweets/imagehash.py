@@ -0,0 +1,127 @@
+"""
+Perceptual image hashes: near-duplicate detection and "similar images".
+
+dhash() shrinks an image to 9x8 grey pixels and keeps one bit per pair of
+neighbours (is the left one brighter?). Resizing, recompression, small crops
+or a watermark only flip a few of the 64 bits, so the Hamming distance between
+two hashes says how alike two images look.
+
+Every tweet image gets an ImageHash row (process_tweet_image). A tweet whose
+image is within IMAGE_DUPLICATE_DISTANCE bits of an already classified one
+reuses its ai_tags instead of running the model again (tags_of_duplicate).
+
+Search without comparing against every row (multi-index hashing): the hash is
+cut in BANDS bands of 16 bits, each with a B-tree index. If two hashes are at
+most d bits apart, at least one band differs by at most d // BANDS bits
+(pigeonhole), so the candidates are the rows where some band is one of the
+values within d // BANDS bits of ours: exact band lookups, a few hundred index
+probes at most, whatever the size of the table. The exact distance is then
+computed in SQL on those candidates only (bit_count, Postgres 14+), so only the
+`limit` closest rows come back: a band shared by a million near-identical
+memes costs a scan of them in Postgres, not a million rows in Python.
+"""
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import F, Func, IntegerField, Q
+from PIL import Image
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def dhash(img):
+    """64-bit difference hash of a PIL image (unsigned int)."""
+    small = img.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = small.tobytes()  # one byte per pixel, row by row
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def to_db(value):
+    # Unsigned 64-bit -> signed BIGINT
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_db(value):
+    return value & ((1 << 64) - 1)
+
+
+def distance(a, b):
+    return (from_db(a) ^ from_db(b)).bit_count()
+
+
+def bands(value):
+    value = from_db(value)
+    return [(value >> (BAND_BITS * i)) & BAND_MASK for i in range(BANDS)]
+
+
+def _neighbours(band, flips):
+    """Every band value within `flips` bits of `band` (itself included)."""
+    values = {band}
+    for n in range(1, flips + 1):
+        for bits in combinations(range(BAND_BITS), n):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.add(flipped)
+    return values
+
+
+def _candidates(value, max_distance):
+    from .models import ImageHash
+
+    if max_distance > settings.IMAGE_SIMILAR_MAX_DISTANCE:
+        raise ValueError(f'max_distance is at most {settings.IMAGE_SIMILAR_MAX_DISTANCE}')
+    flips = max_distance // BANDS
+    query = Q()
+    for i, band in enumerate(bands(value)):
+        query |= Q(**{f'band{i}__in': _neighbours(band, flips)})
+    return ImageHash.objects.filter(query)
+
+
+def record(tweet_id, value):
+    """Stores (or replaces) the hash of a tweet's image."""
+    from .models import ImageHash
+
+    ImageHash.objects.update_or_create(
+        tweet_id=tweet_id,
+        defaults={'hash': to_db(value), **{f'band{i}': band for i, band in enumerate(bands(value))}},
+    )
+
+
+def _within(value, max_distance):
+    """The candidates within max_distance bits, annotated with `distance`, closest first."""
+    return (
+        _candidates(value, max_distance)
+        .annotate(distance=Func(
+            F('hash').bitxor(to_db(value)), template='bit_count((%(expressions)s)::bit(64))',
+            output_field=IntegerField(),
+        ))
+        .filter(distance__lte=max_distance)
+        .order_by('distance', 'tweet_id')
+    )
+
+
+def find_similar(value, max_distance, exclude=None, limit=20):
+    """[(distance, tweet_id)] of the images within max_distance bits, closest first."""
+    rows = _within(value, max_distance)
+    if exclude is not None:
+        rows = rows.exclude(tweet_id=exclude)
+    return list(rows.values_list('distance', 'tweet_id')[:limit])
+
+
+def tags_of_duplicate(value, exclude=None):
+    """ai_tags of the closest already-classified near-duplicate, or None."""
+    rows = (
+        _within(value, settings.IMAGE_DUPLICATE_DISTANCE)
+        .filter(tweet__ai_tags__isnull=False).exclude(tweet__ai_tags='')
+    )
+    if exclude is not None:
+        rows = rows.exclude(tweet_id=exclude)
+    return rows.values_list('tweet__ai_tags', flat=True).first()
@@ -0,0 +1,408 @@
+"""
+Bulk loading of users, tweets and comments from JSONL or CSV files
+(`manage.py bulk_ingest`), for seeding and migrations.
+
+Going through the API costs a request, a few queries and a Celery pipeline per
+tweet. Here every batch of `batch_size` records is one transaction:
+
+    1. COPY the records into a temporary staging table (ON COMMIT DELETE ROWS)
+    2. resolve authors given by username:  UPDATE staging ... FROM auth_user
+    3. INSERT ... SELECT FROM staging, skipping duplicates and rows whose user
+       or tweet doesn't exist, RETURNING the new rows
+    4. move the checkpoint (IngestCheckpoint) to the end of the batch in the file
+
+The file is streamed, so memory is bounded by one batch whatever its size. The
+checkpoint is written in the batch's transaction: after a crash or a Ctrl-C,
+running the same command again resumes exactly after the last committed batch.
+
+What the API would have done per row, done per batch instead:
+  - users: added to the availability Bloom filters (availability.record_many)
+  - tweets: the search trigger still fills search_vector; the first feed pages
+    are invalidated once at the end. Moderation, image variants/tags and video
+    transcoding are either scheduled in chunks at the lowest priority
+    (pipeline='schedule') or left for `manage.py schedule_pipeline` (pipeline='defer').
+    Bulk tweets are NOT fanned out: home timelines that already exist in Redis
+    only get them when rebuilt (timeline.rebuild_timeline).
+  - comments: comments_count of their tweets is bumped in the same statement,
+    and their cached responses are invalidated once per tweet after the commit.
+
+Tweets get increasing ids in file order, and timelines/keyset pagination assume
+ids grow with time: load them oldest first. Users and tweets may also keep their
+ids from another system (an `id` column), so comments can point at them.
+"""
+import csv
+import json
+import os
+from collections import namedtuple
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+from . import availability, cache
+from .models import IngestCheckpoint, Tweet
+
+PIPELINE_CHUNK_SIZE = 1000   # tweet ids per moderate_tweets task
+PIPELINE_PRIORITY = 9        # lowest: live traffic on the same queues goes first
+
+
+class IngestError(Exception):
+    pass
+
+
+# columns: the fields accepted in the files (staging table columns and their types)
+# sql: statements run on the filled staging table; the last one RETURNs the new rows
+Kind = namedtuple('Kind', ['table', 'columns', 'sql'])
+
+# Usernames are unique whatever the case (0013), and UPPER(username) is that index
+RESOLVE_USERNAMES = """
+    UPDATE {staging} s SET user_id = u.id FROM auth_user u
+     WHERE s.user_id IS NULL AND UPPER(u.username::text) = UPPER(s.username)
+"""
+
+BUMP_SEQUENCE = """
+    SELECT setval(%(sequence)s, GREATEST((SELECT max(id) FROM {table}), (SELECT last_value FROM {sequence})))
+"""
+
+KINDS = {
+    'users': Kind('auth_user', {
+        'id': 'bigint',
+        'username': 'text',
+        'email': 'text',
+        'password': 'text',
+        'first_name': 'text',
+        'last_name': 'text',
+        'is_active': 'boolean',
+        'date_joined': 'timestamptz',
+    }, ["""
+        INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name,
+                               email, is_staff, is_active, date_joined)
+        SELECT COALESCE(s.id, nextval(pg_get_serial_sequence('auth_user', 'id'))),
+               COALESCE(s.password, '!' || md5(random()::text)), false, s.username,
+               COALESCE(s.first_name, ''), COALESCE(s.last_name, ''), COALESCE(s.email, ''),
+               false, COALESCE(s.is_active, true), COALESCE(s.date_joined, now())
+          FROM {staging} s
+         WHERE s.username IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING id, username, email
+    """]),
+    'tweets': Kind('tweets_tweet', {
+        'id': 'bigint',
+        'user_id': 'bigint',
+        'username': 'text',
+        'content': 'text',
+        'image': 'text',
+        'video': 'text',
+        'ai_tags': 'text',
+        'shares_count': 'integer',
+        'created_at': 'timestamptz',
+    }, [RESOLVE_USERNAMES, """
+        INSERT INTO tweets_tweet (id, user_id, content, image, video, image_variants, video_renditions,
+                                  created_at, shares_count, comments_count, ai_tags)
+        SELECT COALESCE(s.id, nextval(pg_get_serial_sequence('tweets_tweet', 'id'))),
+               s.user_id, COALESCE(s.content, ''), s.image, s.video, '{{}}', '{{}}',
+               COALESCE(s.created_at, now()), COALESCE(s.shares_count, 0), 0, s.ai_tags
+          FROM (SELECT * FROM {staging} ORDER BY created_at NULLS LAST) s
+         WHERE EXISTS (SELECT 1 FROM auth_user u WHERE u.id = s.user_id)
+        ON CONFLICT DO NOTHING
+        RETURNING id, image, video
+    """]),
+    'comments': Kind('tweets_comment', {
+        'user_id': 'bigint',
+        'username': 'text',
+        'tweet_id': 'bigint',
+        'text': 'text',
+        'created_at': 'timestamptz',
+    }, [RESOLVE_USERNAMES, """
+        WITH inserted AS (
+            INSERT INTO tweets_comment (user_id, tweet_id, text, created_at)
+            SELECT s.user_id, s.tweet_id, s.text, COALESCE(s.created_at, now())
+              FROM (SELECT * FROM {staging} ORDER BY created_at NULLS LAST) s
+             WHERE s.text IS NOT NULL
+               AND EXISTS (SELECT 1 FROM auth_user u WHERE u.id = s.user_id)
+               AND EXISTS (SELECT 1 FROM tweets_tweet t WHERE t.id = s.tweet_id)
+            RETURNING id, tweet_id
+        ), counted AS (
+            UPDATE tweets_tweet t SET comments_count = t.comments_count + c.n
+              FROM (SELECT tweet_id, count(*) AS n FROM inserted GROUP BY tweet_id) c
+             WHERE t.id = c.tweet_id
+        )
+        SELECT id, tweet_id FROM inserted
+    """]),
+}
+
+
+def staging_table(kind):
+    return f'ingest_{kind}'
+
+
+def detect_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+# --- READERS: (record, byte offset just after it), starting at a byte offset ---
+
+def read_jsonl(f, offset):
+    f.seek(offset)
+    for line in f:
+        offset += len(line)
+        if line.strip():
+            yield json.loads(line), offset
+
+
+def read_csv(f, offset):
+    header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+    offset = max(offset, f.tell())
+    f.seek(offset)
+    position = [offset]
+
+    def lines():
+        # csv.reader pulls lines one by one (more for a quoted multi-line field),
+        # so after each record `position` is exactly where the next one starts
+        for line in f:
+            position[0] += len(line)
+            yield line.decode('utf-8')
+
+    for row in csv.reader(lines()):
+        if row:
+            # Empty CSV cells are missing values, like absent JSON keys
+            yield {name: value for name, value in zip(header, row) if value != ''}, position[0]
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+def _is_hash(password):
+    # Only hashes of an algorithm in PASSWORD_HASHERS: 'pa$$word' is a password
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return False
+    return True
+
+
+def to_row(kind, record, columns):
+    unknown = record.keys() - columns.keys()
+    if unknown:
+        raise IngestError(f"Unknown {kind} field(s): {', '.join(sorted(unknown))}")
+    password = record.get('password')
+    if password and not password.startswith('!') and not _is_hash(password):
+        # A raw password (slow, on purpose): export hashes (algorithm$...) when you can
+        record['password'] = make_password(password)
+    return [record.get(name) for name in columns]
+
+
+# --- LOADING ---
+
+def _load_batch(kind, rows):
+    """COPY + INSERT of one batch, in the caller's transaction. Returns the new rows."""
+    spec = KINDS[kind]
+    staging = staging_table(kind)
+    with connection.cursor() as cursor:
+        definition = ', '.join(f'{name} {type_}' for name, type_ in spec.columns.items())
+        cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS {staging} ({definition}) ON COMMIT DELETE ROWS')
+        # Empty anyway after a commit, but not if we run inside a bigger transaction
+        cursor.execute(f'TRUNCATE {staging}')
+        with cursor.copy(f"COPY {staging} ({', '.join(spec.columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+        for sql in spec.sql:
+            cursor.execute(sql.format(staging=staging))
+        inserted = cursor.fetchall()
+        if kind in ('users', 'tweets') and any(row[0] is not None for row in rows):
+            # Explicit ids don't advance the sequence: move it past them
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [spec.table, 'id'])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(BUMP_SEQUENCE.format(table=spec.table, sequence=sequence), {'sequence': sequence})
+    return inserted
+
+
+def _checkpoint(name, kind, path, restart):
+    checkpoint, created = IngestCheckpoint.objects.get_or_create(
+        name=name, defaults={'kind': kind, 'source': path},
+    )
+    if restart and not created:
+        checkpoint.delete()
+        return _checkpoint(name, kind, path, False)
+    if (checkpoint.kind, checkpoint.source) != (kind, path):
+        raise IngestError(
+            f"Checkpoint '{name}' belongs to {checkpoint.kind} from {checkpoint.source}, not {kind} from {path}"
+        )
+    return checkpoint
+
+
+def search_indexes():
+    return [index for index in Tweet._meta.indexes if isinstance(index, GinIndex)]
+
+
+def drop_search_indexes():
+    with connection.cursor() as cursor:
+        for index in search_indexes():
+            cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(index.name)}')
+
+
+def create_search_indexes():
+    with connection.cursor() as cursor:
+        cursor.execute("SET maintenance_work_mem = '512MB'")
+        with connection.schema_editor() as editor:
+            for index in search_indexes():
+                editor.add_index(Tweet, index)
+        cursor.execute('RESET maintenance_work_mem')
+
+
+def ingest(kind, path, fmt=None, batch_size=10000, pipeline='schedule', checkpoint=None, restart=False,
+           defer_indexes=False, log=print):
+    """
+    Loads a JSONL/CSV file of `kind` ('users', 'tweets', 'comments'), resuming
+    from its checkpoint (by default named after the kind and the file).
+    Returns the IngestCheckpoint.
+
+    defer_indexes (tweets): drops the full-text and trigram GIN indexes during
+    the load and builds them once at the end (GIN inserts are most of the cost
+    of a row, and grow with the index), but search is slow and typo matching
+    gone until then: for seeding, or a maintenance window.
+    """
+    if kind not in KINDS:
+        raise IngestError(f"Unknown kind '{kind}' (expected one of {', '.join(KINDS)})")
+    path = os.path.abspath(path)
+    columns = KINDS[kind].columns
+    checkpoint = _checkpoint(checkpoint or f'{kind}:{path}', kind, path, restart)
+    if checkpoint.finished_at:
+        log(f"✅ {checkpoint.name} was already loaded ({checkpoint.rows} {kind})")
+        return checkpoint
+    if checkpoint.offset:
+        log(f"⏩ Resuming {checkpoint.name} at byte {checkpoint.offset} ({checkpoint.rows} {kind} loaded)")
+
+    defer_indexes = defer_indexes and kind == 'tweets'
+    if defer_indexes:
+        drop_search_indexes()
+    try:
+        with open(path, 'rb') as f:
+            records = READERS[fmt or detect_format(path)](f, checkpoint.offset)
+            done = False
+            while not done:
+                rows, end = [], checkpoint.offset
+                for record, end in records:
+                    rows.append(to_row(kind, record, columns))
+                    if len(rows) == batch_size:
+                        break
+                else:
+                    done = True
+                if rows:
+                    _commit_batch(kind, rows, end, checkpoint, pipeline)
+                    log(f"📥 {checkpoint.rows} {kind} loaded, {checkpoint.skipped} skipped")
+    finally:
+        if defer_indexes:
+            # Even if the load failed: the indexes must not stay missing
+            log("🔨 Building the search indexes...")
+            create_search_indexes()
+
+    checkpoint.finished_at = timezone.now()
+    if checkpoint.pipeline == IngestCheckpoint.NONE and checkpoint.first_id is not None:
+        checkpoint.pipeline = IngestCheckpoint.SCHEDULED
+    checkpoint.save()
+    if kind == 'tweets':
+        cache.invalidate_head(reason='bulk_ingest')
+    return checkpoint
+
+
+def add_id_ranges(ranges, ids):
+    """Merges `ids` into sorted [[first, last], ...] runs (a sequence-numbered load stays one run)."""
+    runs = [list(run) for run in ranges]
+    for tweet_id in sorted(ids):
+        if runs and runs[-1][0] <= tweet_id <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], tweet_id)
+        else:
+            runs.append([tweet_id, tweet_id])
+    merged = []
+    for first, last in sorted(runs):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+def _commit_batch(kind, rows, end, checkpoint, pipeline):
+    with transaction.atomic():
+        # Also stops two runs of the same checkpoint from loading a batch twice
+        offset = IngestCheckpoint.objects.select_for_update().values_list('offset', flat=True).get(pk=checkpoint.pk)
+        if offset != checkpoint.offset:
+            raise IngestError(f"Checkpoint '{checkpoint.name}' moved: is another bulk_ingest loading it?")
+
+        inserted = _load_batch(kind, rows)
+
+        if kind == 'users' and inserted:
+            # Before the commit, like signals.py: a new name is never reported free
+            availability.record_many([row[1] for row in inserted], [row[2] for row in inserted])
+        if kind == 'tweets' and inserted:
+            ids = [row[0] for row in inserted]
+            checkpoint.first_id = min(ids + [checkpoint.first_id or min(ids)])
+            checkpoint.last_id = max(ids + [checkpoint.last_id or 0])
+            checkpoint.id_ranges = add_id_ranges(checkpoint.id_ranges, ids)
+            if pipeline == 'defer':
+                # Even if this run never finishes: schedule_pipeline picks it up
+                checkpoint.pipeline = IngestCheckpoint.DEFERRED
+            else:
+                transaction.on_commit(lambda: schedule_pipeline(
+                    ids, [row[0] for row in inserted if row[1]], [row[0] for row in inserted if row[2]],
+                ))
+        if kind == 'comments' and inserted:
+            # New comments_count and comment preview
+            tweet_ids = sorted({row[1] for row in inserted})
+            transaction.on_commit(lambda: [cache.invalidate_tweet(tweet_id, reason='comment') for tweet_id in tweet_ids])
+
+        checkpoint.offset = end
+        checkpoint.rows += len(inserted)
+        checkpoint.skipped += len(rows) - len(inserted)
+        checkpoint.save()
+
+
+# --- THE POST-CREATE PIPELINE, IN BULK ---
+
+def schedule_pipeline(tweet_ids, image_ids, video_ids):
+    """What process_new_tweet does, minus the fan-out, for many tweets at once."""
+    from .tasks import moderate_tweets, process_tweet_image, transcode_video
+
+    for i in range(0, len(tweet_ids), PIPELINE_CHUNK_SIZE):
+        moderate_tweets.apply_async((tweet_ids[i:i + PIPELINE_CHUNK_SIZE],), priority=PIPELINE_PRIORITY)
+    for tweet_id in image_ids:
+        process_tweet_image.apply_async((tweet_id,), priority=PIPELINE_PRIORITY)
+    if video_ids:
+        # Shown as "processing" right away, like schedule_transcode()
+        Tweet.objects.filter(id__in=video_ids).update(video_renditions={'status': 'processing'})
+        for tweet_id in video_ids:
+            transcode_video.apply_async((tweet_id,), priority=PIPELINE_PRIORITY)
+
+
+def schedule_deferred(checkpoint, batch_size=PIPELINE_CHUNK_SIZE * 10, log=print):
+    """Schedules the pipeline of the tweets a `pipeline='defer'` run loaded. Returns how many."""
+    # Checkpoints written before id_ranges only know the bounds
+    ranges = checkpoint.id_ranges or [[checkpoint.first_id, checkpoint.last_id]]
+    # Media that was already processed (e.g. by an interrupted earlier run of this) is left alone
+    tweets = Tweet.objects.annotate(
+        image_todo=ExpressionWrapper(Q(image__gt='', image_variants={}), output_field=BooleanField()),
+        video_todo=ExpressionWrapper(Q(video__gt='', video_renditions={}), output_field=BooleanField()),
+    ).order_by('id')
+    count = 0
+    for first, last in ranges:
+        last_id = first - 1
+        while True:
+            batch = list(
+                tweets.filter(id__gt=last_id, id__lte=last).values_list('id', 'image_todo', 'video_todo')[:batch_size]
+            )
+            if not batch:
+                break
+            schedule_pipeline(
+                [tweet_id for tweet_id, _, _ in batch],
+                [tweet_id for tweet_id, image, _ in batch if image],
+                [tweet_id for tweet_id, _, video in batch if video],
+            )
+            count += len(batch)
+            last_id = batch[-1][0]
+            log(f"📤 Pipeline scheduled for {count} tweets...")
+    checkpoint.pipeline = IngestCheckpoint.SCHEDULED
+    checkpoint.save(update_fields=['pipeline', 'updated_at'])
+    return count
@@ -0,0 +1,64 @@
+"""
+Request-scoped DataLoaders for the GraphQL schema.
+
+Resolvers call `info.context.loaders.<name>.load(key)` instead of walking
+relations one object at a time. Strawberry resolves the whole level of the
+query before the loaders run, so every key asked for is fetched with ONE
+`IN (...)` query (users, tweets) or ONE windowed query (comments), whatever
+the number of tweets in the page.
+
+A new Loaders() is created for every request (see GraphQLContext), so nothing
+is cached between requests or users.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from strawberry.dataloader import DataLoader
+from strawberry.django.context import StrawberryDjangoContext
+
+from .models import Comment, Tweet
+
+
+def _by_id(model, ids):
+    found = model.objects.in_bulk(ids)
+    return [found.get(pk) for pk in ids]
+
+
+def _comments_by_tweet(keys):
+    """keys are (tweet_id, first): the newest `first` comments of each tweet."""
+    by_first = defaultdict(set)
+    for tweet_id, first in keys:
+        by_first[first].add(tweet_id)
+
+    found = defaultdict(list)
+    # One query per distinct `first` (normally just one for the whole request)
+    for first, tweet_ids in by_first.items():
+        if first <= 0:
+            continue
+        rows = (
+            Comment.objects.filter(tweet_id__in=tweet_ids)
+            .annotate(row=Window(
+                RowNumber(), partition_by=[F('tweet_id')], order_by=[F('created_at').desc(), F('id').desc()],
+            ))
+            .filter(row__lte=first)
+            .order_by('tweet_id', 'row')
+        )
+        for comment in rows:
+            found[(comment.tweet_id, first)].append(comment)
+    return [found[key] for key in keys]
+
+
+class Loaders:
+    def __init__(self):
+        self.users = DataLoader(load_fn=sync_to_async(lambda ids: _by_id(User, ids)))
+        self.tweets = DataLoader(load_fn=sync_to_async(lambda ids: _by_id(Tweet, ids)))
+        self.comments_by_tweet = DataLoader(load_fn=sync_to_async(_comments_by_tweet))
+
+
+@dataclass
+class GraphQLContext(StrawberryDjangoContext):
+    loaders: Loaders = field(default_factory=Loaders)
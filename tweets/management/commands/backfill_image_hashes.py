@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from tweets import imagehash
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = 'Hashes the images of tweets posted before perceptual hashes existed (see tweets/imagehash.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        last_id = 0
+        while True:
+            # Keyset over the primary key: no OFFSET, and rows hashed meanwhile are skipped
+            batch = list(
+                Tweet.objects.filter(id__gt=last_id, image_hash__isnull=True).exclude(image='').exclude(image=None)
+                .order_by('id').only('id', 'image')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for tweet in batch:
+                try:
+                    with tweet.image.open('rb') as f:
+                        img = Image.open(f)
+                        img.draft('RGB', (256, 256))  # 9x8 is all we need: decode JPEGs at 1/8 scale
+                        imagehash.record(tweet.id, imagehash.dhash(img))
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'❌ Tweet #{tweet.id}: {e}')
+            last_id = batch[-1].id
+            self.stdout.write(f'🔎 {done} image(s) hashed...')
+        self.stdout.write(self.style.SUCCESS(f'✅ {done} image(s) hashed, {failed} failed'))
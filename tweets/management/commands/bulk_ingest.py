@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets import ingest
+
+
+class Command(BaseCommand):
+    help = 'Streams a JSONL/CSV file of users, tweets or comments into Postgres with COPY (see tweets/ingest.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(ingest.KINDS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(ingest.READERS), help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--pipeline', choices=['schedule', 'defer'], default='schedule',
+            help='tweets: schedule moderation/image/video tasks per batch, or leave them for schedule_pipeline',
+        )
+        parser.add_argument(
+            '--defer-indexes', action='store_true',
+            help='tweets: drop the search GIN indexes while loading and build them at the end (seeding only)',
+        )
+        parser.add_argument('--checkpoint', help='default: <kind>:<absolute path>')
+        parser.add_argument('--restart', action='store_true', help='forget the checkpoint and load from the start')
+
+    def handle(self, *args, **options):
+        try:
+            checkpoint = ingest.ingest(
+                options['kind'], options['path'],
+                fmt=options['format'],
+                batch_size=options['batch_size'],
+                pipeline=options['pipeline'],
+                checkpoint=options['checkpoint'],
+                restart=options['restart'],
+                defer_indexes=options['defer_indexes'],
+                log=self.stdout.write,
+            )
+        except (ingest.IngestError, OSError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {checkpoint.name}: {checkpoint.rows} {checkpoint.kind} loaded, {checkpoint.skipped} skipped'
+        ))
+        if checkpoint.pipeline == checkpoint.DEFERRED:
+            self.stdout.write(f'⏸️  Pipeline deferred: manage.py schedule_pipeline "{checkpoint.name}"')
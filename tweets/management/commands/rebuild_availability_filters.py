@@ -0,0 +1,29 @@
+import redis
+from django.core.management.base import BaseCommand
+
+from tweets import availability
+
+
+class Command(BaseCommand):
+    help = 'Builds the username/email Bloom filters from the DB (see tweets/availability.py); also runs daily on Celery beat'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='only the filters that were never built (or were evicted): cheap enough for every deploy',
+        )
+
+    def handle(self, *args, **options):
+        for kind in availability.KINDS:
+            try:
+                if options['missing'] and availability.get_filter(kind).is_built():
+                    self.stdout.write(f'{kind} filter already built')
+                    continue
+                count = availability.rebuild(kind)
+            except redis.RedisError as e:
+                if not options['missing']:
+                    raise
+                # Don't hold a deploy back: checks go to the DB until the daily rebuild
+                self.stderr.write(f'❌ {kind} filter not built, Redis unavailable: {e}')
+                continue
+            self.stdout.write(self.style.SUCCESS(f'✅ {kind} filter built from {count} users'))
@@ -0,0 +1,16 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from tweets import publisher
+
+
+class Command(BaseCommand):
+    help = 'Publishes queued notifications to the WebSockets of online users (see tweets/publisher.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.stdout.write('📣 Notification publisher started')
+        asyncio.run(publisher.run(options['batch_size']))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets import ingest
+from tweets.models import IngestCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Schedules moderation/image/video tasks for tweets loaded by bulk_ingest --pipeline defer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('checkpoint', nargs='*', help='default: every deferred checkpoint')
+
+    def handle(self, *args, **options):
+        checkpoints = IngestCheckpoint.objects.filter(pipeline=IngestCheckpoint.DEFERRED)
+        if options['checkpoint']:
+            checkpoints = checkpoints.filter(name__in=options['checkpoint'])
+            if len(checkpoints) != len(set(options['checkpoint'])):
+                raise CommandError('Unknown checkpoint, or its pipeline is not deferred')
+        for checkpoint in checkpoints:
+            count = ingest.schedule_deferred(checkpoint, log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'✅ {checkpoint.name}: pipeline scheduled for {count} tweets'))
@@ -0,0 +1,165 @@
+"""
+Responsive image derivatives.
+
+The uploaded original is never modified. For each width in
+settings.IMAGE_VARIANT_WIDTHS we write a WebP and a JPEG copy to
+`tweet_images/variants/<tweet_id>/<name>.<ext>` and record their storage
+names and sizes in Tweet.image_variants, e.g.
+
+    {"feed": {"width": 600, "height": 450,
+              "webp": "tweet_images/variants/7/feed.webp",
+              "jpeg": "tweet_images/variants/7/feed.jpg"}, ...}
+
+Paths are deterministic, so running it twice just overwrites the same files.
+
+The bottom of the file streams stored media with HTTP Range support (video
+seeking, resumed downloads), see views.serve_media.
+"""
+import asyncio
+import io
+import mimetypes
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from PIL import Image, ImageOps
+
+FORMATS = {
+    # key: (Pillow format, file extension, save options)
+    'webp': ('WEBP', 'webp', {'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+}
+
+
+def variant_path(tweet_id, name, ext):
+    return f'tweet_images/variants/{tweet_id}/{name}.{ext}'
+
+
+def open_for_variants(img_or_file, max_width):
+    """
+    Opens an image ready for downscaling: JPEGs are decoded at reduced scale
+    with draft() (much faster than a full decode), EXIF rotation is applied,
+    and the result is plain RGB.
+    """
+    img = img_or_file if isinstance(img_or_file, Image.Image) else Image.open(img_or_file)
+    if img.format == 'JPEG' and img.width > max_width:
+        # draft() picks the smallest DCT scale that is still >= the requested size.
+        # Ask for a square so the result is big enough even after an EXIF rotation.
+        img.draft('RGB', (max_width, max_width))
+    img = ImageOps.exif_transpose(img)
+    return img.convert('RGB')
+
+
+def decode_original(field_file):
+    """Decodes an uploaded image ONCE into RGB pixels, ready for every variant size."""
+    max_width = max(settings.IMAGE_VARIANT_WIDTHS.values())
+    with field_file.open('rb') as f:
+        # convert() inside open_for_variants loads the pixels, so the file can be closed
+        return open_for_variants(Image.open(f), max_width)
+
+
+def build_variants(tweet_id, img):
+    """Writes every variant for an RGB image and returns the image_variants dict."""
+    variants = {}
+    # Largest first, so each smaller size is resized from the previous one
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS.items(), key=lambda item: -item[1])
+    current = img
+    for name, width in widths:
+        if current.width > width:
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.LANCZOS)
+
+        variant = {'width': current.width, 'height': current.height}
+        for key, (pil_format, ext, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            # A freshly created image carries no EXIF/GPS metadata, so nothing leaks
+            current.save(buffer, pil_format, quality=settings.IMAGE_VARIANT_QUALITY[key], **options)
+            path = variant_path(tweet_id, name, ext)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variant[key] = default_storage.save(path, ContentFile(buffer.getvalue()))
+        variants[name] = variant
+    return variants
+
+
+def _storage_url(path):
+    # Variant paths are built by variant_path() (plain ASCII), so on local disk the
+    # URL is just MEDIA_URL + path: skip the urljoin() of FileSystemStorage.url(),
+    # which is most of the cost on big feed pages. Other storages may sign URLs.
+    storage = storages['default']
+    if isinstance(storage, FileSystemStorage):
+        return storage.base_url + path
+    return storage.url(path)
+
+
+def variant_urls(image_variants, request=None):
+    """Turns stored variant paths into (absolute) URLs for the API."""
+    result = {}
+    for name, variant in (image_variants or {}).items():
+        result[name] = dict(variant)
+        for key in FORMATS:
+            if key in variant:
+                url = _storage_url(variant[key])
+                result[name][key] = request.build_absolute_uri(url) if request else url
+    return result
+
+
+# --- RANGED MEDIA SERVING ---
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# HLS renditions (see video.py); not in every system's mime.types
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a `Range: bytes=...` header, or None for the whole
+    file. Multiple ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:  # "bytes=-500": the last 500 bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def iter_file_range(path, start, length):
+    """The bytes of path[start:start + length], MEDIA_BLOCK_SIZE at a time (WSGI)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(settings.MEDIA_BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+async def aiter_file_range(path, start, length):
+    """
+    Same for ASGI. Django turns a SYNC iterator into a list before sending it over
+    ASGI (the whole video in memory), so the reads run in a thread instead.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = await asyncio.to_thread(f.read, min(settings.MEDIA_BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
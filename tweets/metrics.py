@@ -0,0 +1,141 @@
+"""
+Custom Prometheus metrics. /metrics serves the default registry (or the merged
+multiprocess one, see PROMETHEUS_MULTIPROC_DIR), so anything defined here shows
+up there automatically, plus the Celery queue gauges of CeleryQueueCollector.
+"""
+import json
+import time
+
+import redis
+from django.conf import settings
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# --- RESPONSE CACHE (cache.py) ---
+RESPONSE_CACHE_REQUESTS = Counter(
+    'tweets_response_cache_requests_total',
+    'Response cache lookups by result (hit, miss, stale)',
+    ['kind', 'result'],
+)
+RESPONSE_CACHE_EVICTIONS = Counter(
+    'tweets_response_cache_evictions_total',
+    'Cached responses invalidated because the data behind them changed',
+    ['reason'],
+)
+
+# --- GRAPHQL (graphql_extensions.py) ---
+# `operation` is the operation name for persisted queries, 'adhoc' otherwise
+GRAPHQL_OPERATION_SECONDS = Histogram(
+    'tweets_graphql_operation_seconds',
+    'Time to run a whole GraphQL operation',
+    ['operation'],
+)
+GRAPHQL_RESOLVER_SECONDS = Histogram(
+    'tweets_graphql_resolver_seconds',
+    'Time spent in root and async (DataLoader/DB) resolvers',
+    ['operation', 'field'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+
+# --- WEBSOCKETS (presence.py, publisher.py) ---
+WEBSOCKET_CONNECTIONS = Gauge(
+    'tweets_websocket_connections',
+    'Open notification WebSockets in this process',
+    multiprocess_mode='livesum',  # summed over the ASGI workers (PROMETHEUS_MULTIPROC_DIR)
+)
+NOTIFICATIONS_PUBLISHED = Counter(
+    'tweets_notifications_published_total',
+    'Notifications taken from the outbox, by result (sent, offline)',
+    ['result'],
+)
+
+# --- SIGNUP AVAILABILITY CHECKS (availability.py) ---
+# `source` bloom = answered by the Bloom filter alone, db = confirmed in Postgres
+AVAILABILITY_CHECKS = Counter(
+    'tweets_availability_checks_total',
+    'Username/email availability checks by who answered and the answer',
+    ['source', 'result'],
+)
+
+# --- TOKEN AUTHENTICATION (authentication.py) ---
+# `source`: local = process LRU, redis = shared cache, db = authtoken_token JOIN auth_user
+TOKEN_AUTH_LOOKUPS = Counter(
+    'tweets_token_auth_lookups_total',
+    'API/WebSocket token resolutions by where the user came from',
+    ['source'],
+)
+
+# --- RATE LIMITING (ratelimit.py) ---
+RATE_LIMITED = Counter(
+    'tweets_rate_limited_total',
+    'Requests/connections refused by the rate limiter',
+    ['surface', 'scope'],  # surface: rest, graphql, websocket
+)
+
+# --- CELERY QUEUES (read from the broker at scrape time) ---
+class CeleryQueueCollector:
+    """
+    Depth and age of the oldest message of every CELERY_QUEUE_METRICS queue,
+    to size the worker pool of each one. The broker keeps one Redis list per
+    queue and priority (`<queue>`, `<queue>:<priority>`); messages are pushed
+    on the left, so the oldest of each list is its last item, stamped with
+    `sent_at` when it was published (backend/celery.py).
+
+    Not registered in a registry: it's read from the broker, the same for every
+    process, so the /metrics view adds it once (tweets/views.py).
+    """
+
+    def __init__(self, broker_url=None, queues=None):
+        self.broker_url = broker_url or settings.CELERY_BROKER_URL
+        self.queues = queues or settings.CELERY_QUEUE_METRICS
+        self._client = None
+
+    def _keys(self, queue):
+        options = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+        sep = options.get('sep', ':')
+        return [queue] + [f'{queue}{sep}{p}' for p in options.get('priority_steps', []) if p]
+
+    def collect(self):
+        depth = GaugeMetricFamily(
+            'tweets_celery_queue_depth', 'Messages waiting in a Celery queue (all priorities)', labels=['queue'],
+        )
+        age = GaugeMetricFamily(
+            'tweets_celery_queue_oldest_seconds', 'How long the oldest waiting message has been queued',
+            labels=['queue'],
+        )
+        try:
+            if self._client is None:
+                # A broker that doesn't answer must not hang the scrape
+                self._client = redis.Redis.from_url(self.broker_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            pipe = self._client.pipeline(transaction=False)
+            for queue in self.queues:
+                for key in self._keys(queue):
+                    pipe.llen(key)
+                    pipe.lindex(key, -1)
+            results = iter(pipe.execute())
+        except redis.RedisError as e:
+            print(f"❌ [Metrics] Could not read the Celery queues: {e}")
+            return
+
+        now = time.time()
+        for queue in self.queues:
+            total, oldest = 0, None
+            for _ in self._keys(queue):
+                length, last = next(results), next(results)
+                total += length
+                sent_at = self._sent_at(last)
+                if sent_at is not None and (oldest is None or sent_at < oldest):
+                    oldest = sent_at
+            depth.add_metric([queue], total)
+            age.add_metric([queue], max(0.0, now - oldest) if oldest else 0.0)
+        yield depth
+        yield age
+
+    @staticmethod
+    def _sent_at(raw):
+        if not raw:
+            return None
+        try:
+            return float(json.loads(raw)['headers']['sent_at'])
+        except (ValueError, KeyError, TypeError):
+            return None  # published before the stamp existed
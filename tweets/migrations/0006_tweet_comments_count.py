@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0005_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='comments_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['tweet', '-created_at', '-id'], name='comment_tweet_created_id_desc'),
+        ),
+        # Backfill the counter for existing tweets
+        migrations.RunSQL(
+            """
+            UPDATE tweets_tweet SET comments_count = counts.n
+            FROM (SELECT tweet_id, COUNT(*) AS n FROM tweets_comment GROUP BY tweet_id) AS counts
+            WHERE counts.tweet_id = tweets_tweet.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
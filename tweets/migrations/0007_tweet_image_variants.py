@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0006_tweet_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Keeps tweets_tweet.search_vector in sync on every write (ORM, bulk_update, COPY...)
+SEARCH_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION tweets_tweet_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.ai_tags, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT username FROM auth_user WHERE id = NEW.user_id), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tweets_tweet_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF content, ai_tags, user_id ON tweets_tweet
+    FOR EACH ROW EXECUTE FUNCTION tweets_tweet_search_vector_update();
+"""
+
+DROP_SEARCH_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS tweets_tweet_search_vector_trigger ON tweets_tweet;
+DROP FUNCTION IF EXISTS tweets_tweet_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0007_tweet_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='tweet',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='tweet_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['content'], name='tweet_content_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(SEARCH_TRIGGER_SQL, reverse_sql=DROP_SEARCH_TRIGGER_SQL),
+        # Backfill: touching content fires the trigger for existing rows
+        migrations.RunSQL(
+            "UPDATE tweets_tweet SET content = content",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0010_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='video_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
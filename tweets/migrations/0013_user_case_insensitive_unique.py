@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:40
+
+from django.conf import settings
+from django.db import migrations
+
+# username__iexact / email__iexact compile to UPPER("col"::text) = UPPER(%s): these
+# expression indexes turn the sequential scans of the availability check and of
+# signup validation into index lookups, and make "John" vs "john" a DB-level conflict.
+# Users without an email have '' (not NULL), so the email index skips them; queries
+# add email <> '' so the planner can use it (see availability.py).
+# CONCURRENTLY: auth_user stays writable while the indexes are built.
+#
+# Existing accounts that differ only in case would make the build fail, and a failed
+# CONCURRENTLY build leaves an INVALID index behind (that IF NOT EXISTS then keeps):
+# check_duplicates() refuses to start with a list of them, and drops such leftovers.
+CREATE_INDEXES_SQL = [
+    'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS auth_user_username_upper_uniq '
+    'ON auth_user (UPPER(username::text))',
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS auth_user_email_upper_uniq "
+    "ON auth_user (UPPER(email::text)) WHERE email <> ''",
+]
+
+# (column, index, condition)
+UNIQUE_COLUMNS = [
+    ('username', 'auth_user_username_upper_uniq', 'TRUE'),
+    ('email', 'auth_user_email_upper_uniq', "email <> ''"),
+]
+SHOWN_DUPLICATES = 20
+
+DROP_INDEXES_SQL = [
+    'DROP INDEX CONCURRENTLY IF EXISTS auth_user_username_upper_uniq',
+    'DROP INDEX CONCURRENTLY IF EXISTS auth_user_email_upper_uniq',
+]
+
+
+def check_duplicates(apps, schema_editor):
+    problems = []
+    with schema_editor.connection.cursor() as cursor:
+        for column, index, condition in UNIQUE_COLUMNS:
+            cursor.execute(
+                f'SELECT array_agg({column} ORDER BY id) FROM auth_user WHERE {condition} '
+                f'GROUP BY UPPER({column}::text) HAVING count(*) > 1 LIMIT %s',
+                [SHOWN_DUPLICATES],
+            )
+            problems += [f"  {column}: {', '.join(names)}" for (names,) in cursor.fetchall()]
+
+            cursor.execute(
+                'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE c.relname = %s AND NOT i.indisvalid', [index],
+            )
+            if cursor.fetchone():
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+    if problems:
+        raise RuntimeError(
+            'auth_user has accounts that differ only in case, so the case-insensitive unique indexes '
+            f'can\'t be built (first {SHOWN_DUPLICATES} per column):\n' + '\n'.join(problems) +
+            '\nRename or merge them (e.g. in `manage.py shell`), then run migrate again.'
+        )
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('tweets', '0012_imagehash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [migrations.RunPython(check_duplicates, migrations.RunPython.noop)] + [
+        migrations.RunSQL(sql=sql, reverse_sql=reverse)
+        for sql, reverse in zip(CREATE_INDEXES_SQL, DROP_INDEXES_SQL)
+    ]
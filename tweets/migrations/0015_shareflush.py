@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0014_ingestcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShareFlush',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import migrations
+
+# The search vector holds the author's username (see 0008): a rename re-indexes their tweets.
+# Touching user_id fires tweets_tweet_search_vector_trigger, which reads the new username.
+RENAME_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION tweets_user_rename_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE tweets_tweet SET user_id = user_id WHERE user_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tweets_user_rename_search_vector_trigger
+    AFTER UPDATE OF username ON auth_user
+    FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username)
+    EXECUTE FUNCTION tweets_user_rename_search_vector_update();
+"""
+
+DROP_RENAME_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS tweets_user_rename_search_vector_trigger ON auth_user;
+DROP FUNCTION IF EXISTS tweets_user_rename_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0016_ingestcheckpoint_id_ranges'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(RENAME_TRIGGER_SQL, reverse_sql=DROP_RENAME_TRIGGER_SQL),
+        # Renames made before the trigger existed: tweets whose vector lacks the current username
+        migrations.RunSQL(
+            """
+            UPDATE tweets_tweet t SET user_id = user_id
+              FROM auth_user u
+             WHERE u.id = t.user_id
+               AND NOT coalesce(t.search_vector @@ plainto_tsquery('simple', u.username), false)
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,105 @@
+"""
+Per-process registry for the AI models used by the Celery workers.
+
+Building MobileNetV2 (and importing TensorFlow) takes seconds, so we do it once
+per worker process and reuse the warm model for every task afterwards.
+TensorFlow is imported lazily so the web process never pays for it.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+INPUT_SIZE = (224, 224)  # MobileNetV2 input resolution
+
+
+def _load_mobilenet_v2():
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+    # This takes time the first run as it downloads ~14MB
+    return MobileNetV2(weights='imagenet')
+
+
+class StubModel:
+    """
+    Local stand-in for the classifier (AI_MODEL=stub), for load tests and
+    machines without TensorFlow: tags from the dominant colour of the image,
+    after AI_STUB_SECONDS per image, so the `images` queue still does work
+    that takes about as long as the real model on a CPU.
+    """
+    COLOURS = {
+        'red': (200, 40, 40), 'green': (40, 160, 60), 'blue': (40, 80, 200), 'yellow': (220, 200, 40),
+        'white': (235, 235, 235), 'black': (20, 20, 20), 'grey': (128, 128, 128), 'brown': (120, 80, 40),
+    }
+
+    def predict_tags(self, pixel_arrays, top):
+        time.sleep(settings.AI_STUB_SECONDS * len(pixel_arrays))
+        names = list(self.COLOURS)
+        palette = np.array([self.COLOURS[name] for name in names], dtype=np.float32)
+        tags = []
+        for pixels in pixel_arrays:
+            distances = np.linalg.norm(palette - pixels.reshape(-1, 3).mean(axis=0), axis=1)
+            tags.append([names[i] for i in np.argsort(distances)[:top]])
+        return tags
+
+
+# name -> loader. Add new models here (AI_MODEL picks one).
+MODEL_LOADERS = {
+    'mobilenet_v2': _load_mobilenet_v2,
+    'stub': StubModel,
+}
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_model(name=None):
+    """Returns the warm model for this process, loading it on first use."""
+    name = name or settings.AI_MODEL
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                model = _models[name] = MODEL_LOADERS[name]()
+    return model
+
+
+def is_loaded(name=None):
+    return (name or settings.AI_MODEL) in _models
+
+
+def load_pixels(img_or_path):
+    """
+    Decodes an image (path or PIL image) into a 224x224x3 float array.
+    Matches keras `load_img(target_size=(224, 224))`, which resizes with NEAREST.
+    """
+    if isinstance(img_or_path, Image.Image):
+        img = img_or_path.convert('RGB')
+    else:
+        # Closes the file handle (and frees the decoder) as soon as we have the pixels
+        with Image.open(img_or_path) as opened:
+            img = opened.convert('RGB')
+    img = img.resize(INPUT_SIZE, Image.NEAREST)
+    return np.asarray(img, dtype=np.float32)
+
+
+def predict_tags(pixel_arrays, top=3):
+    """
+    Runs ONE model.predict over a stacked batch and returns a list of tag lists
+    (e.g. [['tabby', 'tiger cat', 'Egyptian cat'], ...]) in input order.
+    """
+    if not pixel_arrays:
+        return []
+    if settings.AI_MODEL == 'stub':
+        return get_model().predict_tags(pixel_arrays, top)
+
+    from tensorflow.keras.applications.mobilenet_v2 import preprocess_input, decode_predictions
+
+    batch = preprocess_input(np.stack(pixel_arrays))
+    preds = get_model().predict(batch, batch_size=len(pixel_arrays), verbose=0)
+    return [
+        [label.replace('_', ' ') for _, label, _ in results]
+        for results in decode_predictions(preds, top=top)
+    ]
@@ -1,6 +1,22 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
+class TweetQuerySet(models.QuerySet):
+    def with_comment_preview(self, size=None):
+        """
+        Attaches the latest `size` comments of each tweet as `tweet.latest_comments`.
+        Django turns the sliced Prefetch into ONE query with ROW_NUMBER() OVER
+        (PARTITION BY tweet_id), so a tweet with 50k comments still loads only `size`.
+        """
+        size = size or settings.COMMENT_PREVIEW_SIZE
+        latest = Comment.objects.select_related('user').order_by('-created_at', '-id')[:size]
+        return self.prefetch_related(models.Prefetch('comments', queryset=latest, to_attr='latest_comments'))
+
 class Tweet(models.Model):
     # 1. Who posted this?
     # on_delete=models.CASCADE: If user is deleted, delete their tweets too.
@@ -14,6 +30,13 @@ class Tweet(models.Model):
     # upload_to tells Django which folder INSIDE 'media' to put these files.
     image = models.ImageField(upload_to='tweet_images/', blank=True, null=True)
     video = models.FileField(upload_to='tweet_videos/', blank=True, null=True)
+
+    # Resized copies of `image` written by the resize_image task (see media.py)
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    # Capped-bitrate MP4s, HLS playlists and a poster of `video`, written by the
+    # transcode_video task (see video.py). {} until it runs.
+    video_renditions = models.JSONField(default=dict, blank=True)
     
     # 4. Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -23,13 +46,60 @@ class Tweet(models.Model):
     # (In a massive app, this would be a separate table, but this is fine for now).
     shares_count = models.IntegerField(default=0)
 
+    # Denormalized so feeds never COUNT comments (kept in sync by signals.py)
+    comments_count = models.IntegerField(default=0)
+
     # We will store the AI tags here (e.g., "Persian Cat, Sofa")
     ai_tags = models.CharField(max_length=255, blank=True, null=True)
+
+    # Full-text search document: content (A) + ai_tags (B) + username (C).
+    # Filled by a Postgres trigger on every INSERT/UPDATE (see migration 0008),
+    # so bulk writes and COPY keep it up to date too.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TweetQuerySet.as_manager()
     
+    class Meta:
+        indexes = [
+            # "Latest tweets by these authors" (fan-out-on-read for big accounts)
+            models.Index(fields=['user', '-id'], name='tweet_user_id_desc'),
+            # Keyset pagination of the global feed (see pagination.py)
+            models.Index(fields=['-created_at', '-id'], name='tweet_created_id_desc'),
+            # Full-text search, and trigram matching for typos (see search.py)
+            GinIndex(fields=['search_vector'], name='tweet_search_vector_gin'),
+            GinIndex(fields=['content'], opclasses=['gin_trgm_ops'], name='tweet_content_trgm'),
+        ]
+
     def __str__(self):
         # Show the first 20 chars of the tweet in Admin
         return f"{self.user.username}: {self.content[:20]}..."
     
+class CommentQuerySet(models.QuerySet):
+    def uncount(self):
+        """
+        Takes these comments off their tweets' comments_count (ONE grouped UPDATE)
+        and expires the tweets' cached responses once the transaction commits.
+        Call it BEFORE deleting them.
+        """
+        from . import cache
+
+        per_tweet = self.order_by().values('tweet_id').annotate(n=models.Count('id'))
+        tweet_ids = [row['tweet_id'] for row in per_tweet]
+        if not tweet_ids:
+            return
+        Tweet.objects.filter(id__in=tweet_ids).update(comments_count=models.F('comments_count') - models.Subquery(
+            per_tweet.filter(tweet_id=models.OuterRef('id')).values('n')
+        ))
+        transaction.on_commit(lambda: [cache.invalidate_tweet(tweet_id, reason='comment') for tweet_id in tweet_ids])
+
+    def delete(self):
+        # The API, the admin and the shell delete comments one by one or through a queryset.
+        # A tweet's comments cascading away with it skip both (the Collector deletes them
+        # with ONE raw DELETE, there's no counter left to fix), so nothing here is a signal.
+        with transaction.atomic():
+            self.uncount()
+            return super().delete()
+
 class Comment(models.Model):
     # Link to the User who commented
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -40,5 +110,158 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination (see pagination.py)
+            models.Index(fields=['-created_at', '-id'], name='comment_created_id_desc'),
+            # Latest comments of one tweet (preview + /api/tweets/{id}/comments/)
+            models.Index(fields=['tweet', '-created_at', '-id'], name='comment_tweet_created_id_desc'),
+        ]
+
+    objects = CommentQuerySet.as_manager()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            Comment.objects.filter(pk=self.pk).uncount()
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user.username} on Tweet {self.tweet.id}"
+
+class Follow(models.Model):
+    # follower -> following ("follower" sees "following"'s tweets in their home timeline)
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+    following = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'following'], name='unique_follow'),
+            models.CheckConstraint(condition=~models.Q(follower=models.F('following')), name='no_self_follow'),
+        ]
+
+    def __str__(self):
+        return f"{self.follower.username} follows {self.following.username}"
+
+class Notification(models.Model):
+    # One row per COALESCED burst: 50 comments on a tweet within the window = 1 row (see notifications.py)
+    COMMENT = 'comment'
+    AI_UPDATE = 'ai_update'
+    KIND_CHOICES = [(COMMENT, 'Comment'), (AI_UPDATE, 'AI tags')]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    text = models.CharField(max_length=255)
+    actors = models.JSONField(default=list, blank=True)  # first few usernames, in order
+    count = models.PositiveIntegerField(default=1)       # events merged into this row
+    data = models.JSONField(default=dict, blank=True)    # e.g. {"tweets": [{"tweet_id": 1, "tags": "..."}]}
+    created_at = models.DateTimeField(auto_now_add=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Inbox pages (keyset) and replay since a cursor (id > cursor)
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_inbox'),
+            # Unread counts only touch unread rows
+            models.Index(fields=['recipient'], condition=models.Q(read_at__isnull=True), name='notification_unread'),
+        ]
+
+    def __str__(self):
+        return f"To {self.recipient.username}: {self.text}"
+
+class Upload(models.Model):
+    # A resumable chunked upload (see uploads.py). The chunks are written straight into
+    # the final storage object, which is attached to a tweet once the upload is complete.
+    IMAGE = 'image'
+    VIDEO = 'video'
+    KIND_CHOICES = [(IMAGE, 'Image'), (VIDEO, 'Video')]
+
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    ATTACHED = 'attached'
+    STATUS_CHOICES = [(UPLOADING, 'Uploading'), (COMPLETE, 'Complete'), (ATTACHED, 'Attached to a tweet')]
+
+    # Random id: it's in the URL, so it must not be guessable
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)  # bytes received so far
+    storage_name = models.CharField(max_length=255)
+    backend_state = models.JSONField(default=dict, blank=True)  # e.g. the S3 multipart UploadId + part ETags
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Abandoned uploads are expired by a periodic task (see uploads.expire)
+            models.Index(fields=['created_at'], condition=~models.Q(status='attached'), name='upload_pending'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.filename} ({self.offset}/{self.size})"
+
+class ImageHash(models.Model):
+    # 64-bit perceptual hash (dHash) of a tweet's image: near-duplicates (reposted memes,
+    # recompressed or resized copies) are a few bits apart. See imagehash.py.
+    tweet = models.OneToOneField(Tweet, on_delete=models.CASCADE, primary_key=True, related_name='image_hash')
+    hash = models.BigIntegerField()  # signed: Postgres has no unsigned 64-bit integers
+    # The hash cut in four 16-bit bands, each indexed (multi-index hashing): two hashes
+    # within 3 bits of each other share at least one band exactly
+    band0 = models.IntegerField()
+    band1 = models.IntegerField()
+    band2 = models.IntegerField()
+    band3 = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band0'], name='imagehash_band0'),
+            models.Index(fields=['band1'], name='imagehash_band1'),
+            models.Index(fields=['band2'], name='imagehash_band2'),
+            models.Index(fields=['band3'], name='imagehash_band3'),
+        ]
+
+    def __str__(self):
+        return f"Tweet {self.tweet_id}: {self.hash & (2 ** 64 - 1):016x}"
+
+class IngestCheckpoint(models.Model):
+    # Progress of one bulk_ingest run (see ingest.py). Updated in the same transaction
+    # as each batch, so a resumed run never loads a row twice nor skips one.
+    NONE = 'none'
+    SCHEDULED = 'scheduled'
+    DEFERRED = 'deferred'
+    PIPELINE_CHOICES = [(NONE, 'Not run'), (SCHEDULED, 'Scheduled'), (DEFERRED, 'Deferred')]
+
+    name = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=20)          # users, tweets, comments
+    source = models.CharField(max_length=1024)      # the file being loaded
+    offset = models.BigIntegerField(default=0)      # bytes of it already loaded
+    rows = models.BigIntegerField(default=0)        # rows inserted
+    skipped = models.BigIntegerField(default=0)     # rows refused (duplicates, unknown user/tweet)
+    # Tweet ids inserted, for a deferred pipeline (schedule_pipeline)
+    first_id = models.BigIntegerField(null=True, blank=True)
+    last_id = models.BigIntegerField(null=True, blank=True)
+    # ...exactly: [[first, last], ...] runs of them, merged. Tweets posted during the
+    # load, or loaded by another run with explicit ids, fall between the runs.
+    id_ranges = models.JSONField(default=list, blank=True)
+    pipeline = models.CharField(max_length=10, choices=PIPELINE_CHOICES, default=NONE)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.rows} {self.kind} ({self.offset} bytes)"
+
+
+class ShareFlush(models.Model):
+    # The share flush (see counters.py) whose deltas are in the DB: written in the same
+    # transaction as its UPDATE, so a retried flush never applies them twice
+    id = models.UUIDField(primary_key=True)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return f"{self.user.username} on Tweet {self.tweet.id}"
\ No newline at end of file
+        return f"Share flush {self.id}"
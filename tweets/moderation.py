@@ -0,0 +1,93 @@
+"""
+Bad-word moderation.
+
+The lexicon is compiled ONCE into a single regex shaped like a trie
+(e.g. ["bad", "ban", "spam"] -> (?:ba(?:d|n)|spam)), so the regex engine never
+retries thousands of alternatives at each position. One `sub()` call finds and
+censors every match in a single pass, case-insensitively and only on whole
+words ("badge" is left alone).
+
+The lexicon comes from settings.MODERATION_BAD_WORDS plus an optional file
+(settings.MODERATION_LEXICON_FILE, one term per line). get_engine() recompiles
+automatically when either changes, so editing the file is enough to reload.
+"""
+import os
+import re
+
+from django.conf import settings
+
+
+def _trie_regex(words):
+    """Builds a regex source for `words` that shares common prefixes."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True  # end of a word
+
+    def build(node):
+        branches = []
+        optional = '' in node
+        for char in sorted(k for k in node if k):
+            branches.append(re.escape(char) + build(node[char]))
+        if not branches:
+            return ''
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if optional else group
+
+    return build(trie)
+
+
+class ModerationEngine:
+    def __init__(self, words):
+        # casefold() so "HATE", "Hate" and "hate" are the same term
+        self.words = sorted({w.strip().casefold() for w in words if w and w.strip()})
+        if self.words:
+            # (?<!\w) / (?!\w) instead of \b: also correct for terms starting/ending with symbols
+            self.pattern = re.compile(r'(?<!\w)' + _trie_regex(self.words) + r'(?!\w)', re.IGNORECASE)
+        else:
+            self.pattern = None
+
+    def find(self, text):
+        """Returns [(term, start, end), ...] for every match."""
+        if not self.pattern or not text:
+            return []
+        return [(m.group().casefold(), m.start(), m.end()) for m in self.pattern.finditer(text)]
+
+    def censor(self, text):
+        """Returns (censored_text, number_of_matches)."""
+        if not self.pattern or not text:
+            return text, 0
+        return self.pattern.subn(lambda m: '*' * len(m.group()), text)
+
+
+def load_lexicon():
+    words = list(settings.MODERATION_BAD_WORDS)
+    path = settings.MODERATION_LEXICON_FILE
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            words += [line for line in f.read().splitlines() if not line.startswith('#')]
+    return words
+
+
+_engine = None
+_engine_version = None
+
+
+def _lexicon_version():
+    path = settings.MODERATION_LEXICON_FILE
+    mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+    return tuple(settings.MODERATION_BAD_WORDS), path, mtime
+
+
+def get_engine():
+    """Returns the compiled engine for this process, rebuilding it if the lexicon changed."""
+    global _engine, _engine_version
+    version = _lexicon_version()
+    if _engine is None or version != _engine_version:
+        _engine = ModerationEngine(load_lexicon())
+        _engine_version = version
+    return _engine
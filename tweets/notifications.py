@@ -0,0 +1,182 @@
+"""
+Notification inbox with coalescing.
+
+record() is what signals and tasks call: it only adds the event to a Redis
+buffer for its group (recipient + kind + tweet), and the FIRST event of a
+group schedules it to be flushed NOTIFICATION_COALESCE_WINDOW seconds later.
+
+flush_due() (Celery beat, every NOTIFICATION_FLUSH_INTERVAL) turns every due
+group into ONE Notification row, e.g. 50 comments in a few seconds become
+"@a, @b and 48 others commented on your tweet", then queues ONE WebSocket push
+per row through publisher.py. Rows are written even if the user is offline,
+so nothing is lost: the consumer replays them on reconnect (?cursor=<last id>).
+
+Redis keys per group:
+    notif:events:<group>   first MAX_EVENTS events (JSON), for names and data
+    notif:count:<group>    number of events
+    notif:actors:<group>   distinct actors (set), for "and N others"
+    notif:due              sorted set: group -> time to flush it
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db.models import Count
+
+from . import publisher
+from .redis_client import get_redis
+
+EVENTS_KEY = 'notif:events:{}'
+COUNT_KEY = 'notif:count:{}'
+ACTORS_KEY = 'notif:actors:{}'
+DUE_KEY = 'notif:due'
+FLUSH_LOCK_KEY = 'notif:flush-lock'
+FLUSH_LOCK_TIMEOUT = 60  # seconds
+MAX_EVENTS = 50   # kept per group (the count keeps going)
+MAX_ACTORS = 10   # usernames stored on the row
+FLUSH_BATCH = 1000  # groups per flush
+
+
+def group_key(recipient_id, kind, tweet_id=None):
+    return f'{recipient_id}:{kind}:{tweet_id or 0}'
+
+
+def record(recipient_id, kind, tweet_id=None, actor=None, data=None):
+    """Buffers one event. One pipelined round-trip, safe to call on the request path."""
+    group = group_key(recipient_id, kind, tweet_id)
+    event = json.dumps({'actor': actor, 'data': data})
+    pipe = get_redis().pipeline()
+    pipe.rpush(EVENTS_KEY.format(group), event)
+    pipe.ltrim(EVENTS_KEY.format(group), 0, MAX_EVENTS - 1)
+    pipe.incr(COUNT_KEY.format(group))
+    if actor:
+        pipe.sadd(ACTORS_KEY.format(group), actor)
+    # NX: the window starts with the first event, later ones don't push it back
+    pipe.zadd(DUE_KEY, {group: time.time() + settings.NOTIFICATION_COALESCE_WINDOW}, nx=True)
+    pipe.execute()
+
+
+def _mention(names):
+    return ', '.join(f'@{name}' for name in names)
+
+
+def render(kind, events, count, distinct_actors):
+    """The text of a coalesced notification."""
+    actors = list(dict.fromkeys(e['actor'] for e in events if e['actor']))
+    if kind == 'comment':
+        if count == 1:
+            return f"@{actors[0]} commented: {events[0]['data']['text'][:20]}..."
+        if distinct_actors == 1:
+            return f"@{actors[0]} left {count} comments on your tweet"
+        if distinct_actors == 2:
+            return f"@{actors[0]} and @{actors[1]} commented on your tweet"
+        return f"{_mention(actors[:2])} and {distinct_actors - 2} others commented on your tweet"
+    if count == 1:
+        return f"AI tagged your tweet: {events[0]['data']['tags']}"
+    return f"AI tagged {count} of your tweets"
+
+
+def _take(client, groups):
+    """Atomically removes the buffers of `groups` (MULTI): events recorded later start a new group."""
+    pipe = client.pipeline()
+    for group in groups:
+        pipe.lrange(EVENTS_KEY.format(group), 0, -1)
+        pipe.get(COUNT_KEY.format(group))
+        pipe.smembers(ACTORS_KEY.format(group))
+        pipe.delete(EVENTS_KEY.format(group), COUNT_KEY.format(group), ACTORS_KEY.format(group))
+    pipe.zrem(DUE_KEY, *groups)
+    results = pipe.execute()
+    return [
+        (group, results[i * 4], int(results[i * 4 + 1] or 0), results[i * 4 + 2])
+        for i, group in enumerate(groups)
+    ]
+
+
+def _put_back(client, taken):
+    """Undoes _take when the rows couldn't be written: merged with whatever was recorded since."""
+    pipe = client.pipeline()
+    for group, events, count, actors in taken:
+        if events:
+            # Ours are older: they go in front, and the trim keeps the oldest
+            pipe.lpush(EVENTS_KEY.format(group), *reversed(events))
+            pipe.ltrim(EVENTS_KEY.format(group), 0, MAX_EVENTS - 1)
+        pipe.incrby(COUNT_KEY.format(group), count)
+        if actors:
+            pipe.sadd(ACTORS_KEY.format(group), *actors)
+        pipe.zadd(DUE_KEY, {group: time.time()}, nx=True)
+    pipe.execute()
+
+
+def flush_due(now=None):
+    """Writes every group whose window is over and queues one push per row. Returns the rows."""
+    from django.contrib.auth.models import User
+
+    from .models import Notification, Tweet
+    from .serializers import NotificationSerializer
+
+    client = get_redis()
+    # One flusher at a time, or a group could be written twice
+    lock = client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT, blocking=False)
+    if not lock.acquire():
+        return []
+    try:
+        groups = [g.decode() for g in client.zrangebyscore(DUE_KEY, '-inf', now or time.time(), 0, FLUSH_BATCH)]
+        if not groups:
+            return []
+
+        taken = _take(client, groups)
+        parsed = []
+        for group, events, count, actors in taken:
+            if events:
+                recipient_id, kind, tweet_id = group.split(':')
+                parsed.append((int(recipient_id), kind, int(tweet_id), events, count, len(actors)))
+        # The tweet (or the recipient) may have been deleted during the window: one
+        # dangling FK would fail the whole bulk_create, everybody's rows with it
+        tweet_ids = set(Tweet.objects.filter(id__in={p[2] for p in parsed if p[2]}).values_list('id', flat=True))
+        user_ids = set(User.objects.filter(id__in={p[0] for p in parsed}).values_list('id', flat=True))
+
+        rows = []
+        for recipient_id, kind, tweet_id, events, count, distinct_actors in parsed:
+            if recipient_id not in user_ids or (tweet_id and tweet_id not in tweet_ids):
+                continue
+            events = [json.loads(e) for e in events]
+            actors = list(dict.fromkeys(e['actor'] for e in events if e['actor']))
+            data = {'tweets': [e['data'] for e in events]} if kind == Notification.AI_UPDATE else {}
+            rows.append(Notification(
+                recipient_id=recipient_id, kind=kind, tweet_id=tweet_id or None,
+                text=render(kind, events, count, distinct_actors)[:255],
+                actors=actors[:MAX_ACTORS], count=count, data=data,
+            ))
+
+        try:
+            rows = Notification.objects.bulk_create(rows)
+        except Exception:
+            # e.g. a tweet deleted since the check above: keep the buffers for the next flush
+            _put_back(client, taken)
+            raise
+        unread = dict(
+            Notification.objects.filter(recipient_id__in={n.recipient_id for n in rows}, read_at__isnull=True)
+            .values_list('recipient_id').annotate(n=Count('id'))
+        )
+        for row in rows:
+            publisher.enqueue(
+                row.recipient_id, row.text,
+                notification=NotificationSerializer(row).data, unread=unread.get(row.recipient_id, 0),
+            )
+        return rows
+    finally:
+        lock.release()
+
+
+def replay(user_id, cursor, limit=None):
+    """Notifications created after `cursor` (a notification id), oldest first. Returns (rows, more)."""
+    from .models import Notification
+
+    limit = limit or settings.NOTIFICATION_REPLAY_LIMIT
+    rows = list(Notification.objects.filter(recipient_id=user_id, id__gt=cursor).order_by('id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def unread_count(user_id):
+    from .models import Notification
+    return Notification.objects.filter(recipient_id=user_id, read_at__isnull=True).count()
@@ -0,0 +1,100 @@
+"""
+Keyset ("seek") pagination on (created_at, id).
+
+Page-number pagination runs a COUNT(*) and an OFFSET scan that gets slower the
+deeper a client scrolls. Here the cursor remembers the last row we sent, and the
+next page starts right after it using the (created_at, id) index, so every
+page costs the same.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns (created_at, id). Raises ValueError on garbage."""
+    try:
+        created_at, obj_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(obj_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_page(queryset, cursor, size):
+    """
+    Returns (items, next_cursor) for a newest-first page of `size` rows after `cursor`.
+    The queryset is re-ordered by (-created_at, -id) to match the index.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, obj_id = decode_cursor(cursor)
+        # "created_at <= X" bounds the index scan; the OR only breaks ties inside it
+        queryset = queryset.filter(
+            Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=obj_id))
+        )
+
+    # Fetch one extra row to know if there is a next page (no COUNT needed)
+    items = list(queryset[:size + 1])
+    has_next = len(items) > size
+    items = items[:size]
+    next_cursor = encode_cursor(items[-1]) if has_next else None
+    return items, next_cursor
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            items, self.next_cursor = keyset_page(
+                queryset,
+                request.query_params.get(self.cursor_query_param),
+                self.get_page_size(request),
+            )
+        except ValueError:
+            raise NotFound('Invalid cursor')
+        return items
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
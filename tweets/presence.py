@@ -0,0 +1,94 @@
+"""
+Presence registry: which users have a WebSocket open right now.
+
+The notification publisher only calls group_send() for users who are online,
+so nobody pays for messages that no socket will ever receive.
+
+Every socket is a member of `presence:<user_id>`, a sorted set scored by its
+expiry time (several tabs = several members). Keys are per user, so the
+registry is spread over the whole keyspace (and every shard of a Redis
+Cluster) instead of one hot key. Each ASGI process refreshes ALL of its sockets
+with one pipelined heartbeat every PRESENCE_TTL / 3 seconds; if a process dies,
+its sockets simply expire.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+
+from .metrics import WEBSOCKET_CONNECTIONS
+from .redis_client import get_async_redis
+
+PRESENCE_KEY = 'presence:{}'
+
+
+def _touch(pipe, sockets, now):
+    expires = now + settings.PRESENCE_TTL
+    for channel_name, user_id in sockets:
+        key = PRESENCE_KEY.format(user_id)
+        pipe.zadd(key, {channel_name: expires})
+        pipe.zremrangebyscore(key, '-inf', now)  # sockets of dead processes
+        pipe.expire(key, settings.PRESENCE_TTL)
+
+
+class PresenceRegistry:
+    """The sockets of THIS process (channel_name -> user_id) and their heartbeat."""
+
+    def __init__(self):
+        self.sockets = {}
+        self._heartbeat = None
+
+    async def add(self, user_id, channel_name):
+        self.sockets[channel_name] = user_id
+        WEBSOCKET_CONNECTIONS.inc()
+        pipe = get_async_redis().pipeline(transaction=False)
+        _touch(pipe, [(channel_name, user_id)], time.time())
+        await pipe.execute()
+        self._start_heartbeat()
+
+    async def remove(self, channel_name):
+        user_id = self.sockets.pop(channel_name, None)
+        if user_id is None:
+            return
+        WEBSOCKET_CONNECTIONS.dec()
+        await get_async_redis().zrem(PRESENCE_KEY.format(user_id), channel_name)
+        if not self.sockets and self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    def _start_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        if self._heartbeat is None or self._heartbeat.done() or self._heartbeat.get_loop() is not loop:
+            self._heartbeat = loop.create_task(self._beat())
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_TTL / 3)
+            try:
+                await self.refresh()
+            except Exception as e:  # keep beating: a Redis hiccup must not log everyone out
+                print(f"❌ [Presence] Heartbeat failed: {e}")
+
+    async def refresh(self):
+        """Extends every local socket in one round-trip (10k sockets = one pipeline)."""
+        if not self.sockets:
+            return
+        pipe = get_async_redis().pipeline(transaction=False)
+        _touch(pipe, list(self.sockets.items()), time.time())
+        await pipe.execute()
+
+
+registry = PresenceRegistry()
+
+
+async def online_users(user_ids):
+    """The subset of `user_ids` with at least one live socket (one round-trip)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    now = time.time()
+    pipe = get_async_redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.zcount(PRESENCE_KEY.format(user_id), now, '+inf')
+    counts = await pipe.execute()
+    return {user_id for user_id, count in zip(user_ids, counts) if count}
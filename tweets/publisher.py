@@ -0,0 +1,81 @@
+"""
+Notification publisher.
+
+Code that notifies a user (signals, Celery tasks) only calls enqueue(): one
+RPUSH onto `notifications:outbox`, instead of a blocking group_send() inside
+the HTTP request. `python manage.py run_notification_publisher` drains the
+outbox in batches on an asyncio loop: one pipelined presence lookup per batch,
+then group_send() concurrently, only for users who have a socket open.
+"""
+import asyncio
+import json
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import presence
+from .metrics import NOTIFICATIONS_PUBLISHED
+from .redis_client import get_async_redis, get_redis
+
+OUTBOX_KEY = 'notifications:outbox'
+
+
+def group_name(user_id):
+    # The personal group every socket of the user joins (see NotificationConsumer)
+    return f'notifications_{user_id}'
+
+
+def enqueue(user_id, message, **extra):
+    """`extra` (e.g. notification=..., unread=...) is sent along with the message."""
+    get_redis().rpush(OUTBOX_KEY, json.dumps({'user_id': user_id, 'message': message, 'extra': extra}))
+
+
+async def publish(notifications):
+    """Sends a batch to the users that are online. Returns how many were sent."""
+    online = await presence.online_users({n['user_id'] for n in notifications})
+    layer = get_channel_layer()
+    sends = [
+        layer.group_send(group_name(n['user_id']), {
+            'type': 'send_notification', 'message': n['message'], 'extra': n.get('extra') or {},
+        })
+        for n in notifications if n['user_id'] in online
+    ]
+    await asyncio.gather(*sends)
+    NOTIFICATIONS_PUBLISHED.labels('sent').inc(len(sends))
+    NOTIFICATIONS_PUBLISHED.labels('offline').inc(len(notifications) - len(sends))
+    return len(sends)
+
+
+async def _pop(batch_size):
+    # LPOP with a count is atomic, so several publishers never send the same message
+    items = await get_async_redis().lpop(OUTBOX_KEY, batch_size)
+    return [json.loads(item) for item in items or []]
+
+
+async def drain(batch_size=None):
+    """Publishes everything currently in the outbox. Returns the number sent."""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    sent = 0
+    while batch := await _pop(batch_size):
+        sent += await publish(batch)
+    return sent
+
+
+async def run(batch_size=None):
+    """Forever: block until something arrives, then publish whatever is queued in batches."""
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    client = get_async_redis()
+    while True:
+        batch = []
+        try:
+            item = await client.blpop(OUTBOX_KEY, timeout=5)
+            if item is None:
+                continue
+            batch = [json.loads(item[1])]
+            if batch_size > 1:
+                batch += await _pop(batch_size - 1)
+            await publish(batch)
+        except Exception as e:
+            # Keep running: a Redis restart must not stop notifications for good
+            print(f"❌ [Publisher] Could not publish {len(batch)} notifications: {e}")
+            await asyncio.sleep(1)
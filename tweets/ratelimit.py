@@ -0,0 +1,140 @@
+"""
+Rate limiting for REST, GraphQL and WebSocket connects, with one shared budget.
+
+GCRA (generic cell rate algorithm): a rate of N per period means one "cell"
+every period / N, with bursts of up to N. The whole state of a client is ONE
+number in Redis, its theoretical arrival time (TAT):
+
+    rl:<scope>:<identity>   e.g. rl:user:user:42, rl:anon:203.0.113.7
+
+A request costing c cells is allowed if TAT + c * interval - burst <= now;
+TAT then moves forward by c * interval. The check and the update are one Lua
+script (atomic across every web process) using the Redis clock, so app
+servers with drifting clocks still agree. Compared with DRF's throttles there
+is no per-request history list to read and rewrite.
+
+Rates are DRF's DEFAULT_THROTTLE_RATES ('anon' by client IP, 'user' by user
+id). Each request spends RATE_LIMIT_COSTS[<kind>] cells: a read 1, posting
+media much more. Views pick their kind with `throttle_costs` ({action: kind})
+or `get_throttle_cost(request)`.
+
+If Redis is unreachable, requests are let through (and logged): the limiter
+protects the service, it must not take it down.
+"""
+import math
+import weakref
+from collections import namedtuple
+
+import redis
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import RATE_LIMITED
+from .redis_client import get_async_redis, get_redis
+
+KEY = 'rl:{}:{}'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# ARGV: interval (ms per cell), burst (ms), cost (cells). Returns {allowed, retry_after_ms, remaining}
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval * cost
+local allow_at = new_tat - burst
+if now < allow_at then
+    return {0, math.ceil(allow_at - now), math.floor((burst - (tat - now)) / interval)}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, 0, math.floor((burst - (new_tat - now)) / interval)}
+"""
+
+Decision = namedtuple('Decision', ['allowed', 'retry_after', 'remaining'])  # retry_after in seconds
+ALLOWED = Decision(True, 0, None)
+
+_scripts = weakref.WeakKeyDictionary()  # client -> its registered script
+
+
+def parse_rate(rate):
+    """'100/day' -> (100, 86400)."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period[0]]
+
+
+def _args(scope, cost):
+    limit, period = parse_rate(api_settings.DEFAULT_THROTTLE_RATES[scope])
+    interval = period * 1000 / limit
+    return [interval, interval * limit, settings.RATE_LIMIT_COSTS[cost]]
+
+
+def _decision(result):
+    allowed, retry_after, remaining = result
+    return Decision(bool(allowed), int(retry_after) / 1000, max(0, int(remaining)))
+
+
+def identify(user, client_ip):
+    """(scope, identity): logged-in users by id, everyone else by IP."""
+    if user is not None and user.is_authenticated:
+        return 'user', f'user:{user.pk}'
+    return 'anon', client_ip or 'unknown'
+
+
+def hit(scope, identity, cost):
+    """Spends `cost` (a RATE_LIMIT_COSTS kind) of the identity's budget, if it can."""
+    client = get_redis()
+    if client not in _scripts:
+        _scripts[client] = client.register_script(GCRA_SCRIPT)
+    try:
+        return _decision(_scripts[client](keys=[KEY.format(scope, identity)], args=_args(scope, cost)))
+    except redis.RedisError as e:
+        print(f"❌ [RateLimit] Redis unavailable, letting the request through: {e}")
+        return ALLOWED
+
+
+async def ahit(scope, identity, cost):
+    """hit() for async code (GraphQL view, WebSocket consumer)."""
+    client = get_async_redis()
+    if client not in _scripts:
+        _scripts[client] = client.register_script(GCRA_SCRIPT)
+    try:
+        return _decision(await _scripts[client](keys=[KEY.format(scope, identity)], args=_args(scope, cost)))
+    except redis.RedisError as e:
+        print(f"❌ [RateLimit] Redis unavailable, letting the request through: {e}")
+        return ALLOWED
+
+
+def client_ip(request):
+    # DRF's logic (X-Forwarded-For behind NUM_PROXIES proxies, else REMOTE_ADDR)
+    return BaseThrottle().get_ident(request)
+
+
+class GCRARateThrottle(BaseThrottle):
+    """DRF throttle over hit(): replaces AnonRateThrottle + UserRateThrottle."""
+
+    def get_cost(self, request, view):
+        if hasattr(view, 'get_throttle_cost'):
+            cost = view.get_throttle_cost(request)
+            if cost:
+                return cost
+        cost = getattr(view, 'throttle_costs', {}).get(getattr(view, 'action', None))
+        if cost:
+            return cost
+        return 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+
+    def allow_request(self, request, view):
+        scope, identity = identify(request.user, self.get_ident(request))
+        self.decision = hit(scope, identity, self.get_cost(request, view))
+        if not self.decision.allowed:
+            RATE_LIMITED.labels('rest', scope).inc()
+        return self.decision.allowed
+
+    def wait(self):
+        return math.ceil(self.decision.retry_after)
@@ -0,0 +1,42 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """
+    Returns a process-wide Redis client for app data (not the Celery broker).
+    redis-py keeps its own connection pool, so one client per process is enough.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """
+    Async twin of get_redis() for consumers and the notification publisher.
+    asyncio connections belong to the event loop that opened them, so there is
+    one client per running loop.
+
+    Thousands of sockets can touch presence at the same moment, so the pool
+    makes callers wait for a free connection instead of failing with
+    "Too many connections" (the default pool raises at 100).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            settings.REDIS_URL, max_connections=settings.REDIS_ASYNC_MAX_CONNECTIONS,
+        )
+        client = _async_clients[loop] = redis.asyncio.Redis(connection_pool=pool)
+    return client
@@ -2,5 +2,8 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    # The user comes from the token (?token=...), not from the URL
+    re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+    # Old URL, kept for existing clients (must match the authenticated user)
     re_path(r'ws/notifications/(?P<user_id>\d+)/$', consumers.NotificationConsumer.as_asgi()),
-]
\ No newline at end of file
+]
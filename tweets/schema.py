@@ -1,19 +1,47 @@
 import strawberry
-from typing import List
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from strawberry.extensions import QueryDepthLimiter
+from strawberry.types import Info
+from typing import Optional
+from .graphql_extensions import PersistedQueries, QueryCostLimiter, ResolverMetrics
 from .models import Tweet
-from .types import TweetType
+from .pagination import encode_cursor, keyset_page
+from .types import PageInfo, TweetConnection, TweetEdge, TweetType
+
+MAX_PAGE_SIZE = 50
 
 @strawberry.type
 class Query:
-    # 1. Get All Tweets
+    # 1. Get Tweets, one page at a time: tweets(first: 10, after: "<endCursor>")
     @strawberry.field
-    def tweets(self) -> List[TweetType]:
-        # We use select_related just like in REST to optimize DB queries
-        return Tweet.objects.select_related('user').prefetch_related('comments__user').order_by('-created_at')
+    async def tweets(self, first: int = 10, after: Optional[str] = None) -> TweetConnection:
+        # Only the tweets here: users and comments are batched by the DataLoaders (see loaders.py)
+        # An invalid `after` raises ValueError('Invalid cursor'), reported as a GraphQL error
+        items, next_cursor = await sync_to_async(keyset_page)(
+            Tweet.objects.all(), after, max(1, min(first, MAX_PAGE_SIZE)),
+        )
+
+        return TweetConnection(
+            edges=[TweetEdge(cursor=encode_cursor(tweet), node=tweet) for tweet in items],
+            page_info=PageInfo(has_next_page=next_cursor is not None, end_cursor=next_cursor),
+        )
 
     # 2. Get Single Tweet
     @strawberry.field
-    def tweet(self, id: int) -> TweetType:
-        return Tweet.objects.get(id=id)
+    async def tweet(self, info: Info, id: int) -> TweetType:
+        tweet = await info.context.loaders.tweets.load(id)
+        if tweet is None:
+            raise Tweet.DoesNotExist('Tweet matching query does not exist.')
+        return tweet
 
-schema = strawberry.Schema(query=Query)
\ No newline at end of file
+schema = strawberry.Schema(
+    query=Query,
+    # Classes/factories: Strawberry builds new instances for every request
+    extensions=[
+        PersistedQueries,
+        lambda: QueryDepthLimiter(max_depth=settings.GRAPHQL_MAX_DEPTH),
+        QueryCostLimiter,
+        ResolverMetrics,
+    ],
+)
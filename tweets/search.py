@@ -0,0 +1,61 @@
+"""
+Tweet search on Postgres full-text search.
+
+`Tweet.search_vector` (content A, ai_tags B, username C) is kept up to date by a
+trigger and indexed with GIN, so a search is an index lookup instead of the
+`ILIKE '%term%'` sequential scan DRF's SearchFilter produced. When the query
+matches nothing (usually a typo), we fall back to trigram similarity on the
+content, which is also GIN-indexed.
+"""
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, TrigramWordSimilarity,
+)
+from django.db.models import CharField, F, Value
+from rest_framework.filters import BaseFilterBackend
+
+SEARCH_CONFIG = 'english'
+HEADLINE_OPTIONS = {'start_sel': '<mark>', 'stop_sel': '</mark>', 'max_words': 35, 'min_words': 15}
+
+
+def make_query(text):
+    # websearch syntax, like a search engine: "exact phrase", -exclude, this OR that
+    return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+
+def ranked_search(queryset, text, offset, limit):
+    """
+    Returns (tweets, mode) for one page of results, best match first.
+    Each tweet is annotated with `rank` and `headline` (matches wrapped in <mark>).
+    mode is 'fulltext', or 'fuzzy' when falling back to trigram matching.
+    """
+    query = make_query(text)
+    results = list(
+        queryset.filter(search_vector=query)
+        .annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline('content', query, config=SEARCH_CONFIG, **HEADLINE_OPTIONS),
+        )
+        .order_by('-rank', '-id')[offset:offset + limit]
+    )
+    if results or offset:
+        return results, 'fulltext'
+
+    # Nothing matched (usually a typo): `<%` (trigram_word_similar) can use the gin_trgm_ops index
+    fuzzy = list(
+        queryset.filter(content__trigram_word_similar=text)
+        .annotate(rank=TrigramWordSimilarity(text, 'content'), headline=Value(None, output_field=CharField()))
+        .order_by('-rank', '-id')[:limit]
+    )
+    return fuzzy, 'fuzzy'
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Drop-in for SearchFilter on ?search=: same parameter, but uses the GIN index."""
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return queryset.filter(search_vector=make_query(text))
@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Tweet, Comment
+from . import counters, media, video
+from .models import Tweet, Comment, Notification, Upload
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 
@@ -13,9 +18,19 @@ class UserInfoSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
+    # Case-insensitive, like the availability check: "John" and "john" are the same
+    # account (UPPER() unique indexes, migration 0013)
+    username = serializers.CharField(
+        max_length=150,
+        validators=[
+            UnicodeUsernameValidator(),
+            UniqueValidator(queryset=User.objects.all(), lookup='iexact', message="A user with that username already exists."),
+        ]
+    )
+
     email = serializers.EmailField(
         required=False,
-        validators=[UniqueValidator(queryset=User.objects.all(), message="This email is already in use.")]
+        validators=[UniqueValidator(queryset=User.objects.exclude(email=''), lookup='iexact', message="This email is already in use.")]
     )
 
     class Meta:
@@ -23,7 +38,12 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['username', 'password', 'email']
 
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(**validated_data)
+        except IntegrityError:
+            # Someone signed up with the same name between validation and INSERT
+            raise serializers.ValidationError({'username': ["A user with that username or email already exists."]})
         return user
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -35,23 +55,215 @@ class CommentSerializer(serializers.ModelSerializer):
         # We make 'tweet' read-only so we don't have to send it when just reading
         extra_kwargs = {'tweet': {'required': False}}
 
+def _iso_datetime(value, tz):
+    # Same output as DRF's DateTimeField with the default ISO_8601 format
+    if tz is not None:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+class TweetListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Fetch the pending (not yet flushed) share deltas for the whole page at once
+        tweets = list(data.all() if hasattr(data, 'all') else data)
+        counters.merge_pending_shares(tweets)
+        # Lists are read-only: skip the per-field machinery (see TweetSerializer.represent_many)
+        return self.child.represent_many(tweets)
+
 class TweetSerializer(serializers.ModelSerializer):
     # ReadOnlyField: We want to display the username, 
     # but we don't want the user to be able to edit it.
     username = serializers.ReadOnlyField(source='user.username')
 
-    # NESTED SERIALIZER: This puts the actual comment data inside the Tweet JSON
-    # read_only=True means we cannot CREATE comments via the Tweet API (we will use a separate endpoint)
-    comments = CommentSerializer(many=True, read_only=True)
+    # NESTED SERIALIZER: Only a short preview of the newest comments (see COMMENT_PREVIEW_SIZE).
+    # The full list is paginated at /api/tweets/{id}/comments/
+    comments = serializers.SerializerMethodField()
+    comments_count = serializers.ReadOnlyField()
     is_owner = serializers.SerializerMethodField()
+    # Resized copies: {"thumb": {"width", "height", "webp", "jpeg"}, "feed": ..., "full": ...}
+    image_variants = serializers.SerializerMethodField()
+    # {"status": "processing"} until transcoded, then {"status": "ready", "poster", "hls", "mp4": {...}}
+    video_renditions = serializers.SerializerMethodField()
+    # Finished chunked uploads (see uploads.py), instead of sending the file with this request
+    image_upload = serializers.PrimaryKeyRelatedField(
+        queryset=Upload.objects.filter(kind=Upload.IMAGE), write_only=True, required=False,
+    )
+    video_upload = serializers.PrimaryKeyRelatedField(
+        queryset=Upload.objects.filter(kind=Upload.VIDEO), write_only=True, required=False,
+    )
 
     class Meta:
         model = Tweet
-        fields = ['id', 'username', 'content', 'image', 'video', 'shares_count', 'comments', 'created_at','is_owner','ai_tags']
+        fields = ['id', 'username', 'content', 'image', 'video', 'image_variants', 'video_renditions', 'shares_count', 'comments', 'comments_count', 'created_at','is_owner','ai_tags', 'image_upload', 'video_upload']
+        read_only_fields = ['shares_count']
         # 'user' is not here because we will assign it automatically in the View
+        list_serializer_class = TweetListSerializer
+
+    def validate(self, attrs):
+        request = self.context.get('request')
+        for field in ('image', 'video'):
+            upload = attrs.get(f'{field}_upload')
+            if upload is None:
+                continue
+            if request is None or upload.user_id != request.user.id or upload.status != Upload.COMPLETE:
+                raise serializers.ValidationError({f'{field}_upload': 'No finished upload with this id.'})
+            if attrs.get(field):
+                raise serializers.ValidationError({field: f'Send either {field} or {field}_upload, not both.'})
+        return attrs
+
+    def _attach_uploads(self, validated_data):
+        # The stored object becomes the tweet's file as is: no copy, no re-upload
+        for field in ('image', 'video'):
+            upload = validated_data.pop(f'{field}_upload', None)
+            if upload is None:
+                continue
+            # Claimed with a conditional UPDATE, so one upload can't end up in two tweets
+            if not Upload.objects.filter(id=upload.id, status=Upload.COMPLETE).update(status=Upload.ATTACHED):
+                raise serializers.ValidationError({f'{field}_upload': 'This upload is already attached.'})
+            validated_data[field] = upload.storage_name
+
+    @transaction.atomic
+    def create(self, validated_data):
+        self._attach_uploads(validated_data)
+        return super().create(validated_data)
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        self._attach_uploads(validated_data)
+        # Only write the columns the client sent, so counters that are updated
+        # in the background (shares_count, comments_count) are never overwritten
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+    def to_representation(self, instance):
+        # shares_count = DB value + shares still waiting in Redis
+        counters.merge_pending_shares([instance])
+        return super().to_representation(instance)
+
+    # --- FAST READ PATH FOR LISTS ---
+    # Building a dict per row by hand gives exactly the same output as
+    # to_representation() (test_fast_list_serialization_matches_drf), without
+    # going through every Field object and SerializerMethodField per row.
+
+    def represent_many(self, tweets):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        viewer_id = user.id if user is not None and user.is_authenticated else None
+        build_url = request.build_absolute_uri if request is not None else (lambda url: url)
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+
+        def datetime(value):
+            return _iso_datetime(value, tz)
+
+        def file_url(field_file):
+            return build_url(field_file.url) if field_file else None
+
+        def comment_row(comment):
+            return {
+                'id': comment.id,
+                'username': comment.user.username,
+                'tweet': comment.tweet_id,
+                'text': comment.text,
+                'created_at': datetime(comment.created_at),
+            }
+
+        rows = []
+        for tweet in tweets:
+            row = {
+                'id': tweet.id,
+                'username': tweet.user.username,
+                'content': tweet.content,
+                'image': file_url(tweet.image),
+                'video': file_url(tweet.video),
+                'image_variants': media.variant_urls(tweet.image_variants, request),
+                'video_renditions': video.rendition_urls(tweet.video_renditions, request),
+                'shares_count': tweet.shares_count,
+                'comments': [comment_row(c) for c in self._preview(tweet)],
+                'comments_count': tweet.comments_count,
+                'created_at': datetime(tweet.created_at),
+                'is_owner': viewer_id is not None and tweet.user_id == viewer_id,
+                'ai_tags': tweet.ai_tags,
+            }
+            self.extra_row_fields(tweet, row)
+            rows.append(row)
+        return rows
+
+    def extra_row_fields(self, tweet, row):
+        """Hook for subclasses that add fields to Meta.fields."""
+
+    def _preview(self, obj):
+        # Loaded in bulk by Tweet.objects.with_comment_preview() for lists
+        comments = getattr(obj, 'latest_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('user').order_by('-created_at', '-id')[:settings.COMMENT_PREVIEW_SIZE]
+        return comments
+
+    def get_comments(self, obj):
+        return CommentSerializer(self._preview(obj), many=True, context=self.context).data
+
+    def get_image_variants(self, obj):
+        return media.variant_urls(obj.image_variants, self.context.get('request'))
+
+    def get_video_renditions(self, obj):
+        return video.rendition_urls(obj.video_renditions, self.context.get('request'))
 
     def get_is_owner(self, obj):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
             return request.user == obj.user
-        return False
\ No newline at end of file
+        return False
+
+class TweetSearchResultSerializer(TweetSerializer):
+    # Annotated by search.ranked_search()
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta(TweetSerializer.Meta):
+        fields = TweetSerializer.Meta.fields + ['rank', 'headline']
+
+    def extra_row_fields(self, tweet, row):
+        row['rank'] = float(tweet.rank)
+        row['headline'] = tweet.headline
+
+class SimilarTweetSerializer(TweetSerializer):
+    # Hamming distance between the image hashes, set by TweetViewSet.similar
+    distance = serializers.IntegerField(read_only=True)
+
+    class Meta(TweetSerializer.Meta):
+        fields = TweetSerializer.Meta.fields + ['distance']
+
+    def extra_row_fields(self, tweet, row):
+        row['distance'] = tweet.distance
+
+class NotificationSerializer(serializers.ModelSerializer):
+    read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'text', 'actors', 'count', 'tweet', 'data', 'created_at', 'read']
+        read_only_fields = fields
+
+    def get_read(self, obj):
+        return obj.read_at is not None
+
+class UploadSerializer(serializers.ModelSerializer):
+    # Every PUT must carry exactly this many bytes (the last chunk: whatever is left)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'kind', 'filename', 'content_type', 'size', 'offset', 'chunk_size', 'status', 'created_at']
+        read_only_fields = ['offset', 'status', 'created_at']
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def validate(self, attrs):
+        limit = settings.UPLOAD_MAX_SIZE[attrs['kind']]
+        if not 0 < attrs['size'] <= limit:
+            raise serializers.ValidationError({'size': f'Must be between 1 and {limit} bytes.'})
+        return attrs
@@ -1,29 +1,88 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Comment
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from . import authentication, availability, cache, notifications
+from .models import Comment, Tweet
+
+# --- RESPONSE CACHE INVALIDATION (see cache.py) ---
+
+# Tweet columns GraphQL returns (types.TweetType): saves of anything else, e.g. the
+# image variants or ai_tags written by the workers, leave the GraphQL cache alone
+GRAPHQL_TWEET_FIELDS = {'content', 'user', 'user_id', 'created_at', 'shares_count', 'comments_count'}
+
+@receiver(post_save, sender=Tweet)
+def invalidate_tweet_responses(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        cache.invalidate_head()
+    else:
+        graphql = update_fields is None or bool(GRAPHQL_TWEET_FIELDS & set(update_fields))
+        cache.invalidate_tweet(instance.id, graphql=graphql)
+
+@receiver(post_delete, sender=Tweet)
+def invalidate_deleted_tweet_responses(sender, instance, **kwargs):
+    cache.invalidate_tweet(instance.id, reason='delete')
+
+@receiver(post_save, sender=Comment)
+def invalidate_commented_tweet_responses(sender, instance, **kwargs):
+    # The comment preview and comments_count of the tweet changed
+    # (deletes are handled by CommentQuerySet.uncount(), see models.py)
+    cache.invalidate_tweet(instance.tweet_id, reason='comment')
+
+# --- COMMENT COUNTER ---
+# Single-column UPDATE ... SET comments_count = comments_count ± 1 (no read, no race)
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        Tweet.objects.filter(id=instance.tweet_id).update(comments_count=F('comments_count') + 1)
+
+# No post_delete receiver on Comment: it would stop the Collector from deleting a
+# tweet's comments with one DELETE (N loads + N UPDATEs on a row that's going away).
+# Comment.delete() / CommentQuerySet.delete() fix the counter instead, and a deleted
+# user's comments on OTHER people's tweets are taken off here:
+@receiver(pre_delete, sender=User)
+def uncount_deleted_user_comments(sender, instance, **kwargs):
+    Comment.objects.filter(user=instance).exclude(tweet__user=instance).uncount()
 
 @receiver(post_save, sender=Comment)
 def send_comment_notification(sender, instance, created, **kwargs):
     if created:
         # instance is the Comment object
         # We want to notify the OWNER of the tweet
-        tweet_owner_id = instance.tweet.user.id
+        tweet_owner_id = instance.tweet.user_id
         
         # Don't notify if you commented on your own tweet
-        if instance.user.id == tweet_owner_id:
+        if instance.user_id == tweet_owner_id:
             return
 
-        channel_layer = get_channel_layer()
-        group_name = f'notifications_{tweet_owner_id}'
-        
-        message = f"@{instance.user.username} commented: {instance.text[:20]}..."
-
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'send_notification', # Matches function name in Consumer
-                'message': message
-            }
-        )
\ No newline at end of file
+        actor = instance.user.username
+        tweet_id, text = instance.tweet_id, instance.text
+
+        # Just a few Redis writes once the comment is committed: bursts are merged
+        # into one inbox row + one push (see notifications.py), not sent from this request
+        transaction.on_commit(lambda: notifications.record(
+            tweet_owner_id, 'comment', tweet_id=tweet_id, actor=actor, data={'text': text[:100]},
+        ))
+
+# --- SIGNUP AVAILABILITY (Bloom filter, see availability.py) ---
+# Added right away, not on commit: a name must never look free once it may be taken
+
+@receiver(post_save, sender=User)
+def add_user_to_availability_filters(sender, instance, **kwargs):
+    availability.record(instance)
+
+# --- TOKEN CACHE REVOCATION (see authentication.py) ---
+# Logout, rotation, admin and cascades all delete the Token row
+
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(sender, instance, **kwargs):
+    authentication.on_change(authentication.revoke_token, instance.key)
+
+@receiver(post_save, sender=User)
+def revoke_changed_user_tokens(sender, instance, created, **kwargs):
+    # Deactivated, renamed...: cached copies of the user are out of date
+    if not created:
+        authentication.on_change(authentication.revoke_user, instance.id)
@@ -1,21 +1,59 @@
-import json
+from contextlib import closing
+
 from celery import shared_task
-from PIL import Image
-import time
-import os
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.db import transaction
 import numpy as np
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import json
+from . import cache, imagehash, media, ml, notifications, video
+from .batching import RedisBatchQueue
+from .moderation import get_engine
+from .redis_client import get_redis
 
 # We import the model INSIDE the task to avoid "Circular Import" errors
 # (Because models.py might eventually import tasks.py)
 
 @shared_task
-def notify_followers(username, content):
-    print(f"🚀 [Background] Sending notifications for {username}...")
-    time.sleep(2) # Simulate delay
-    print(f"✅ [Background] Notifications sent!")
+def notify_followers(tweet_id):
+    from .models import Tweet
+    from . import timeline
+
+    try:
+        tweet = Tweet.objects.get(id=tweet_id)
+    except Tweet.DoesNotExist:
+        return
+
+    # Fan-out-on-write: push the tweet ID into every follower's home timeline
+    print(f"🚀 [Background] Fanning out Tweet #{tweet_id}...")
+    count = timeline.fan_out(tweet)
+    print(f"✅ [Background] Tweet #{tweet_id} pushed to {count} timeline(s)")
+    return count
+
+@shared_task
+def flush_share_counts():
+    # Runs on Celery beat (CELERY_BEAT_SCHEDULE): Redis share deltas -> Tweet.shares_count
+    from .counters import flush_shares
+    return flush_shares()
+
+@shared_task
+def flush_notifications():
+    # Runs on Celery beat: coalesced notification bursts -> inbox rows + one push each
+    return len(notifications.flush_due())
+
+@shared_task
+def expire_uploads():
+    # Runs on Celery beat: chunked uploads that were abandoned or never attached to a tweet
+    from . import uploads
+    return uploads.expire()
+
+@shared_task
+def rebuild_availability_filters():
+    # Runs on Celery beat (daily): fresh filters from the DB, without the stale bits
+    # of renamed/deleted users (see availability.py)
+    from . import availability
+    for kind in availability.KINDS:
+        count = availability.rebuild(kind)
+        print(f"🌸 [Availability] {kind} filter rebuilt from {count} users")
 
 @shared_task
 def moderate_content(tweet_id):
@@ -23,121 +61,303 @@ def moderate_content(tweet_id):
     
     # 1. Get the tweet from DB
     try:
-        tweet = Tweet.objects.get(id=tweet_id)
+        tweet = Tweet.objects.only('id', 'content').get(id=tweet_id)
         print(f"🧐 [Moderation] Checking Tweet #{tweet_id}...")
     except Tweet.DoesNotExist:
         return
 
-    # 2. Define Bad Words
-    BAD_WORDS = ['bad', 'stupid', 'hate', 'spam']
-    
-    # 3. Check and Replace
-    original_text = tweet.content.lower()
-    is_dirty = False
-    
-    for word in BAD_WORDS:
-        if word in original_text:
-            # Replace the bad word with asterisks (case insensitive replace is harder, doing simple replace here)
-            tweet.content = tweet.content.replace(word, '*' * len(word))
-            is_dirty = True
-
-    # 4. Save only if we changed something
-    if is_dirty:
-        tweet.save()
-        print(f"⚠️ [Moderation] Censored bad words in Tweet #{tweet_id}")
+    # 2. Check and Replace (one pass, whole words, any case - see moderation.py)
+    tweet.content, matches = get_engine().censor(tweet.content)
+
+    # 3. Save only if we changed something (and only the content column)
+    if matches:
+        tweet.save(update_fields=['content'])
+        print(f"⚠️ [Moderation] Censored {matches} bad word(s) in Tweet #{tweet_id}")
     else:
         print(f"✅ [Moderation] Tweet #{tweet_id} is clean.")
 
+@shared_task
+def moderate_tweets(tweet_ids):
+    """
+    Batch version of moderate_content: moderates a backlog of tweets in one
+    worker invocation and writes the censored ones with a single bulk UPDATE.
+    """
+    from .models import Tweet
+
+    engine = get_engine()
+    censored = []
+    for tweet in Tweet.objects.filter(id__in=tweet_ids).only('id', 'content').iterator(chunk_size=500):
+        tweet.content, matches = engine.censor(tweet.content)
+        if matches:
+            censored.append(tweet)
+
+    Tweet.objects.bulk_update(censored, ['content'], batch_size=500)
+    # bulk_update sends no post_save signals, so expire cached responses here
+    for tweet in censored:
+        cache.invalidate_tweet(tweet.id, reason='moderation')
+    print(f"⚠️ [Moderation] {len(censored)} of {len(tweet_ids)} tweet(s) censored")
+    return len(censored)
+
 @shared_task
 def resize_image(tweet_id):
     from .models import Tweet
     
-    tweet = Tweet.objects.get(id=tweet_id)
+    tweet = Tweet.objects.only('id', 'image').get(id=tweet_id)
     
     # 1. Check if there is an image
     if not tweet.image:
         return "No Image"
 
-    print(f"🎨 [Image] Resizing image for Tweet #{tweet_id}...")
+    print(f"🎨 [Image] Building variants for Tweet #{tweet_id}...")
 
-    # 2. Open the image using Pillow (PIL)
-    # tweet.image.path gives the full location on the hard drive
-    img_path = tweet.image.path
-    
-    with Image.open(img_path) as img:
-        # 3. Resize logic (Max width 800px, keep aspect ratio)
-        if img.height > 800 or img.width > 800:
-            output_size = (800, 800)
-            img.thumbnail(output_size)
-            
-            # 4. Overwrite the original file
-            img.save(img_path)
-            print(f"✅ [Image] Resized successfully.")
-        else:
-            print(f"✅ [Image] Image was already small enough.")
+    # 2. Decode once (fast JPEG draft mode), then write every size in WebP + JPEG.
+    # The original upload is left untouched.
+    img = media.decode_original(tweet.image)
+    tweet.image_variants = media.build_variants(tweet.id, img)
+
+    # 3. Record the variant paths and sizes
+    tweet.save(update_fields=['image_variants'])
+    print(f"✅ [Image] Wrote {', '.join(tweet.image_variants)} variants.")
+    return tweet.image_variants
+
+CLASSIFY_QUEUE_KEY = 'ai:classify:pending'
+PIXELS_KEY = 'ai:pixels:{}'
+PIXELS_TTL = 600  # seconds; the classifier normally picks them up within AI_BATCH_MAX_WAIT
+
+@worker_process_init.connect
+def warm_up_models(**kwargs):
+    # Load MobileNetV2 once per worker process (after the fork), not once per task
+    if not settings.AI_WARM_ON_START:
+        return
+    try:
+        ml.get_model()
+        print(f"🤖 [AI] Model loaded and warm.")
+    except Exception as e:
+        print(f"❌ [AI Error] Could not warm up model: {e}")
+
+def notify_ai_update(tweet):
+    # Goes to the owner's inbox; tags of several tweets finished together become one notification
+    try:
+        notifications.record(tweet.user_id, 'ai_update', data={'tweet_id': tweet.id, 'tags': tweet.ai_tags})
+    except Exception as e:
+        print(f"❌ [AI Error] Could not notify user of Tweet #{tweet.id}: {e}")
+
+def stash_pixels(tweet_id, pixels):
+    # Hand the already-decoded 224x224 input to whichever worker classifies the batch,
+    # so the image file is not opened and decoded a second time (uint8 = 150KB)
+    get_redis().set(PIXELS_KEY.format(tweet_id), pixels.astype(np.uint8).tobytes(), ex=PIXELS_TTL)
+
+def pop_stashed_pixels(tweet_ids):
+    pipe = get_redis().pipeline()
+    for tweet_id in tweet_ids:
+        pipe.getdel(PIXELS_KEY.format(tweet_id))
+    shape = ml.INPUT_SIZE + (3,)
+    return {
+        tweet_id: np.frombuffer(raw, dtype=np.uint8).reshape(shape).astype(np.float32)
+        for tweet_id, raw in zip(tweet_ids, pipe.execute()) if raw
+    }
 
 @shared_task
 def classify_image(tweet_id):
+    # 1. Put the tweet in the shared "pending" buffer
+    # 2. Drain the buffer in micro-batches (other workers may have added tweets too)
+    RedisBatchQueue(CLASSIFY_QUEUE_KEY).push(tweet_id)
+    results = drain_classifications()
+
+    # Another worker may have picked our tweet up as part of its batch
+    return results.get(tweet_id, "Batched")
+
+def drain_classifications(keep=None):
+    """
+    Classifies everything in the pending buffer, one batch at a time.
+    Tags are saved and pushed for every tweet except `keep`, which the caller saves itself.
+    Returns {tweet_id: tag_string}.
+    """
+    results = {}
+    queue = RedisBatchQueue(CLASSIFY_QUEUE_KEY)
+    # closing(): a batch that raises goes back to the buffer now, not when the generator is collected
+    with closing(queue.drain(settings.AI_BATCH_SIZE, settings.AI_BATCH_MAX_WAIT)) as batches:
+        for batch in batches:
+            results.update(classify_batch(batch, keep=keep))
+    return results
+
+def classify_batch(tweet_ids, keep=None):
+    """
+    Classifies several tweets with ONE model.predict call.
+    Each tweet still gets its own ai_tags write and ai_update WebSocket push.
+    Returns {tweet_id: tag_string}.
+    """
     from .models import Tweet
-    import tensorflow as tf
-    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
-    from tensorflow.keras.preprocessing import image as keras_image
-    
-    try:
-        tweet = Tweet.objects.get(id=tweet_id)
+
+    stashed = pop_stashed_pixels(tweet_ids)
+    tweets, pixels = [], []
+    for tweet in Tweet.objects.filter(id__in=tweet_ids).only('id', 'user_id', 'image'):
         if not tweet.image:
-            return "No Image"
-
-        print(f"🤖 [AI] Analyzing image for Tweet #{tweet_id}...")
-
-        # 1. Load the Pre-trained Model
-        # This takes time the first run as it downloads ~14MB
-        model = MobileNetV2(weights='imagenet')
-
-        # 2. Load and Process Image
-        img_path = tweet.image.path
-        # Resize to 224x224 as required by MobileNet
-        img = keras_image.load_img(img_path, target_size=(224, 224))
-        
-        x = keras_image.img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
-
-        # 3. Predict
-        preds = model.predict(x)
-        results = decode_predictions(preds, top=3)[0]
-        
-        # 4. Format Results (e.g., "tabby, tiger_cat")
-        tags = [res[1].replace('_', ' ') for res in results]
-        tag_string = ", ".join(tags)
-
-        # 5. Save
-        tweet.ai_tags = tag_string
-        tweet.save()
-
-        # --- NEW: SEND WEBSOCKET MESSAGE ---
-        channel_layer = get_channel_layer()
-        group_name = f"notifications_{tweet.user.id}"
-        
-        message_data = {
-            "type": "ai_update",
-            "tweet_id": tweet.id,
-            "tags": tag_string
-        }
-
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "send_notification", # Matches consumer method
-                "message": json.dumps(message_data) # Send as JSON string
-            }
-        )
-        
-    
-        
-        print(f"✅ [AI] Result: {tag_string}")
-        return tag_string
+            continue
+        try:
+            array = stashed.get(tweet.id)
+            if array is None:
+                # Through the storage, not .path: the image may be on S3
+                with tweet.image.open('rb') as f:
+                    array = ml.load_pixels(f)
+            pixels.append(array)
+            tweets.append(tweet)
+        except Exception as e:
+            print(f"❌ [AI Error] Tweet #{tweet.id}: {e}")
 
+    if not tweets:
+        return {}
+
+    print(f"🤖 [AI] Analyzing {len(tweets)} image(s) in one batch...")
+    try:
+        tag_lists = ml.predict_tags(pixels)
     except Exception as e:
         print(f"❌ [AI Error] {e}")
-        return "Error"
\ No newline at end of file
+        # RedisBatchQueue.drain() puts the batch back for the next drain
+        raise
+
+    results = {}
+    for tweet, tags in zip(tweets, tag_lists):
+        # Format Results (e.g., "tabby, tiger cat")
+        tweet.ai_tags = ", ".join(tags)
+        results[tweet.id] = tweet.ai_tags
+        if tweet.id != keep:
+            tweet.save(update_fields=['ai_tags'])
+            notify_ai_update(tweet)
+        print(f"✅ [AI] Tweet #{tweet.id}: {tweet.ai_tags}")
+
+    return results
+
+# --- VIDEO (dedicated `video` queue, see CELERY_TASK_ROUTES) ---
+
+@shared_task(acks_late=True, soft_time_limit=settings.VIDEO_TRANSCODE_TIMEOUT * 4)
+def transcode_video(tweet_id):
+    """
+    Renditions + HLS + poster for a tweet's video (see video.py). Runs on its own
+    queue and workers, so a 10-minute transcode never delays moderation, AI tags
+    or notifications. Output paths are fixed, so a redelivered task just redoes it.
+    """
+    from .models import Tweet
+
+    try:
+        tweet = Tweet.objects.only('id', 'video', 'video_renditions').get(id=tweet_id)
+    except Tweet.DoesNotExist:
+        return
+    if not tweet.video:
+        return
+
+    print(f"🎬 [Video] Transcoding Tweet #{tweet_id}...")
+    try:
+        tweet.video_renditions = video.transcode(tweet.id, tweet.video)
+    except Exception as e:
+        print(f"❌ [Video Error] Tweet #{tweet_id}: {e}")
+        tweet.video_renditions = {'status': 'failed'}
+    tweet.save(update_fields=['video_renditions'])
+    if tweet.video_renditions['status'] == 'ready':
+        print(f"✅ [Video] Tweet #{tweet_id}: {', '.join(tweet.video_renditions['mp4'])} + HLS + poster")
+    return tweet.video_renditions['status']
+
+def schedule_transcode(tweet):
+    # Shown as "processing" right away; the video workers fill in the rest.
+    # Saved BEFORE the task is queued, or a fast ready/failed could be overwritten by it.
+    tweet.video_renditions = {'status': 'processing'}
+    tweet.save(update_fields=['video_renditions'])
+    transaction.on_commit(lambda: transcode_video.delay(tweet.id))
+
+# --- THE POST-CREATE PIPELINE ---
+
+@shared_task(acks_late=True)
+def process_new_tweet(tweet_id):
+    """
+    The cheap, user-visible part of posting a tweet, on the `realtime` queue:
+    fan-out and moderation, written with one save(update_fields=...).
+    Media work is handed over to its own queue (see CELERY_TASK_ROUTES), so a
+    burst of photo or video uploads never delays moderation:
+    the image to process_tweet_image, a video to transcode_video.
+
+    Every step is idempotent (ZADD, censoring already-censored text), so a
+    redelivered task (acks_late) can safely run again.
+    """
+    from .models import Tweet
+    from . import timeline
+
+    try:
+        tweet = Tweet.objects.get(id=tweet_id)
+    except Tweet.DoesNotExist:
+        return
+
+    # A. Notify Followers (home timelines)
+    timeline.fan_out(tweet)
+
+    # B. Check for bad words
+    tweet.content, matches = get_engine().censor(tweet.content)
+    changed = ['content'] if matches else []
+
+    # C. Image: variants + AI tags on the `images` queue
+    if tweet.image:
+        process_tweet_image.delay(tweet.id)
+
+    # D. Video: transcoding on the `video` queue (writes its own status first)
+    if tweet.video and not tweet.video_renditions:
+        schedule_transcode(tweet)
+
+    # E. One write for everything else we changed
+    if changed:
+        tweet.save(update_fields=changed)
+
+    print(f"✅ [Pipeline] Tweet #{tweet_id} processed ({', '.join(changed) or 'no changes'})")
+    return changed
+
+@shared_task(acks_late=True)
+def process_tweet_image(tweet_id):
+    """
+    Image variants, perceptual hash and AI tags of a new tweet (`images`
+    queue). The image is decoded once; resizing, hashing and classification
+    share the pixels, and the results are written with one save(update_fields=...).
+    A near-duplicate of an already classified image reuses its tags (imagehash.py).
+
+    Idempotent (fixed variant paths, tweets that already have tags are not
+    classified again), so a redelivered task can safely run again.
+    """
+    from .models import Tweet
+
+    try:
+        tweet = Tweet.objects.only('id', 'user_id', 'image', 'image_variants', 'ai_tags').get(id=tweet_id)
+    except Tweet.DoesNotExist:
+        return
+    if not tweet.image:
+        return []
+
+    # Decode once, then resize + hash + classify from the same pixels
+    img = media.decode_original(tweet.image)
+    tweet.image_variants = media.build_variants(tweet.id, img)
+    changed = ['image_variants']
+    phash = imagehash.dhash(img)
+    imagehash.record(tweet.id, phash)
+
+    if not tweet.ai_tags:
+        # A reposted meme: same tags as the copy already classified, no model run
+        tweet.ai_tags = imagehash.tags_of_duplicate(phash, exclude=tweet.id)
+        if tweet.ai_tags:
+            changed.append('ai_tags')
+            print(f"♻️ [AI] Tweet #{tweet_id}: tags of a near-duplicate image reused")
+
+    if not tweet.ai_tags:
+        stash_pixels(tweet.id, ml.load_pixels(img))
+        RedisBatchQueue(CLASSIFY_QUEUE_KEY).push(tweet.id)
+        try:
+            tags = drain_classifications(keep=tweet.id).get(tweet.id)
+        except Exception:
+            # Back in the buffer: whoever drains next saves the tags, the variants are saved now
+            tags = None
+        # If another worker's batch took our tweet, it already saved the tags
+        if tags:
+            tweet.ai_tags = tags
+            changed.append('ai_tags')
+
+    tweet.save(update_fields=changed)
+    if 'ai_tags' in changed:
+        notify_ai_update(tweet)
+
+    print(f"✅ [Image] Tweet #{tweet_id} processed ({', '.join(changed)})")
+    return changed
@@ -1,7 +1,59 @@
+import hashlib
+import json
+import io
+import os
+import shutil
+import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pytest
+from PIL import Image
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_redis import get_redis_connection
+from prometheus_client import REGISTRY
 from rest_framework.test import APIClient
-from .models import Tweet
+from . import cache as response_cache
+from . import counters, imagehash, ml, notifications
+from .batching import RedisBatchQueue
+from .models import Comment, Follow, ImageHash, Notification, Tweet, Upload
+from .moderation import ModerationEngine, get_engine
+from .redis_client import get_redis
+from .tasks import (
+    classify_batch, flush_share_counts, moderate_tweets, notify_followers, process_new_tweet, process_tweet_image,
+    resize_image,
+)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def redis_test_dbs():
+    # Tests flush Redis: give them their own DBs (not the dev stack's 1 and 2) before anything connects
+    from django.conf import settings
+    from django.test import override_settings
+    from . import redis_client
+
+    host = settings.REDIS_HOST
+    location = os.environ.get('TEST_CACHE_URL', f'redis://{host}:6379/15')
+    with override_settings(
+        REDIS_URL=os.environ.get('TEST_REDIS_URL', f'redis://{host}:6379/14'),
+        CACHES={**settings.CACHES, 'default': {**settings.CACHES['default'], 'LOCATION': location}},
+    ):
+        redis_client._client = None
+        yield
+    redis_client._client = None
+
+@pytest.fixture(autouse=True)
+def clean_redis(redis_test_dbs):
+    # Timelines, counters etc. live in the app Redis DB, responses and throttles
+    # in the cache DB; start every test empty
+    get_redis().flushdb()
+    cache.clear()
 
 # This mark tells Pytest: "Allow this test to touch the database"
 @pytest.mark.django_db
@@ -23,4 +75,1468 @@ def test_create_tweet():
     
     # Check if it actually exists in the DB
     assert Tweet.objects.count() == 1
-    assert Tweet.objects.get().content == "Hello from GitHub Actions!"
\ No newline at end of file
+    assert Tweet.objects.get().content == "Hello from GitHub Actions!"
+
+# --- HELPERS ---
+
+def make_image_file(name='photo.png', size=(320, 240), color=(200, 40, 40)):
+    # Build a real (tiny) image in memory so Pillow/ImageField can open it
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+# --- AI CLASSIFICATION (micro-batching) ---
+
+def test_batch_queue_drains_in_batches():
+    queue = RedisBatchQueue('test:batch-queue')
+    queue.client.delete(queue.key)
+    for tweet_id in range(1, 6):
+        queue.push(tweet_id)
+
+    batches = list(queue.drain(batch_size=2, max_wait=0))
+
+    assert batches == [[1, 2], [3, 4], [5]]
+    assert len(queue) == 0
+
+def test_batch_queue_puts_back_unfinished_batches():
+    queue = RedisBatchQueue('test:batch-queue')
+    queue.client.delete(queue.key, queue.leases_key)
+    for tweet_id in range(1, 6):
+        queue.push(tweet_id)
+
+    # The consumer fails mid-batch: the batch goes back to the front
+    with pytest.raises(RuntimeError), closing(queue.drain(batch_size=2, max_wait=0)) as batches:
+        for batch in batches:
+            if batch == [3, 4]:
+                raise RuntimeError('model blew up')
+    assert [int(i) for i in queue.client.lrange(queue.key, 0, -1)] == [3, 4, 5]
+
+    # The worker dies holding a batch: the next drain takes it back once the lease is over
+    queue.LEASE = 0
+    crashed = queue.drain(batch_size=2, max_wait=0)
+    assert next(crashed) == [3, 4]
+    assert len(queue) == 1
+    assert list(queue.drain(batch_size=3, max_wait=0)) == [[3, 4, 5]]
+    assert len(queue) == 0 and queue.client.zcard(queue.leases_key) == 0
+    crashed.close()  # what was left is someone else's now: nothing to put back
+
+@pytest.mark.django_db
+def test_classify_batch_runs_one_predict_for_many_tweets(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+    user = User.objects.create_user(username='photographer', password='password123')
+    tweets = [Tweet.objects.create(user=user, image=make_image_file()) for _ in range(3)]
+
+    calls = []
+    def fake_predict(pixel_arrays, top=3):
+        calls.append(len(pixel_arrays))
+        return [['tabby', 'tiger cat'] for _ in pixel_arrays]
+    monkeypatch.setattr(ml, 'predict_tags', fake_predict)
+
+    results = classify_batch([t.id for t in tweets])
+
+    # One stacked predict call, but every tweet gets its own tags
+    assert calls == [3]
+    assert set(results) == {t.id for t in tweets}
+    for tweet in tweets:
+        tweet.refresh_from_db()
+        assert tweet.ai_tags == 'tabby, tiger cat'
+
+@pytest.mark.django_db
+def test_stub_model_stands_in_for_the_classifier(settings, tmp_path):
+    # AI_MODEL=stub (load tests): the whole pipeline runs without TensorFlow
+    settings.AI_MODEL = 'stub'
+    settings.AI_STUB_SECONDS = 0
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+    red, blue = (np.full(ml.INPUT_SIZE + (3,), colour, dtype=np.float32) for colour in ((210, 30, 30), (30, 70, 210)))
+    assert [tags[0] for tags in ml.predict_tags([red, blue])] == ['red', 'blue']
+
+    user = User.objects.create_user(username='photographer', password='password123')
+    tweet = Tweet.objects.create(user=user, image=make_image_file())
+    classify_batch([tweet.id])
+    tweet.refresh_from_db()
+    assert len(tweet.ai_tags.split(', ')) == 3
+
+
+# --- HOME TIMELINE (fan-out) ---
+
+@pytest.mark.django_db
+def test_follow_and_timeline():
+    alice = User.objects.create_user(username='alice', password='password123')
+    bob = User.objects.create_user(username='bob', password='password123')
+    client = APIClient()
+    client.force_authenticate(user=bob)
+
+    assert client.post(f'/api/users/{alice.id}/follow/').status_code == 201
+    assert Follow.objects.filter(follower=bob, following=alice).exists()
+
+    first = Tweet.objects.create(user=alice, content='first')
+    second = Tweet.objects.create(user=alice, content='second')
+    for tweet in (first, second):
+        notify_followers(tweet.id)  # what perform_create schedules
+
+    response = client.get('/api/timeline/')
+    assert response.status_code == 200
+    assert [t['id'] for t in response.data['results']] == [second.id, first.id]
+
+    # Unfollowing removes her tweets again
+    client.delete(f'/api/users/{alice.id}/follow/')
+    assert client.get('/api/timeline/').data['results'] == []
+
+@pytest.mark.django_db
+def test_timeline_pulls_celebrity_tweets_on_read(settings):
+    settings.TIMELINE_FANOUT_LIMIT = 2
+    star = User.objects.create_user(username='star', password='password123')
+    fans = [User.objects.create_user(username=f'fan{i}', password='password123') for i in range(2)]
+    for fan in fans:
+        Follow.objects.create(follower=fan, following=star)
+
+    tweet = Tweet.objects.create(user=star, content='hello fans')
+    notify_followers(tweet.id)
+
+    # No fan-out-on-write happened...
+    assert get_redis().zscore(f'timeline:{fans[0].id}', tweet.id) is None
+
+    # ...but the tweet is merged in when the fan reads
+    client = APIClient()
+    client.force_authenticate(user=fans[0])
+    assert [t['id'] for t in client.get('/api/timeline/').data['results']] == [tweet.id]
+
+
+@pytest.mark.django_db
+def test_empty_timeline_is_not_rebuilt_on_every_read(monkeypatch):
+    from . import timeline
+
+    loner = User.objects.create_user(username='loner', password='password123')
+    rebuilds = []
+    rebuild = timeline.rebuild_timeline
+    monkeypatch.setattr(timeline, 'rebuild_timeline', lambda user_id: rebuilds.append(user_id) or rebuild(user_id))
+
+    assert timeline.read_timeline(loner.id, 10) == []
+    assert timeline.read_timeline(loner.id, 10) == []
+    assert rebuilds == [loner.id]
+    assert 0 < get_redis().ttl(f'timeline:{loner.id}') <= 300
+
+    # Still pushed to like any other timeline
+    tweet = Tweet.objects.create(user=loner, content='hello?')
+    notify_followers(tweet.id)
+    assert timeline.read_timeline(loner.id, 10) == [tweet.id]
+
+
+@pytest.mark.django_db
+def test_fan_out_does_not_create_a_partial_timeline():
+    from . import timeline
+
+    author = User.objects.create_user(username='regular', password='password123')
+    reader = User.objects.create_user(username='returning', password='password123')
+    Follow.objects.create(follower=reader, following=author)
+    old = [Tweet.objects.create(user=author, content=f'old {i}') for i in range(3)]
+
+    # The reader has no cached timeline (evicted, or from before the cache existed)
+    new = Tweet.objects.create(user=author, content='new')
+    notify_followers(new.id)
+    assert not get_redis().exists(f'timeline:{reader.id}')
+
+    # ...so the first read rebuilds it, history included
+    assert timeline.read_timeline(reader.id, 10) == [new.id] + [t.id for t in reversed(old)]
+
+
+# --- KEYSET PAGINATION ---
+
+@pytest.mark.django_db
+def test_tweet_feed_cursor_pagination():
+    user = User.objects.create_user(username='writer', password='password123')
+    tweets = [Tweet.objects.create(user=user, content=f'tweet {i}') for i in range(7)]
+    # Same timestamp for several rows: the id must break the tie
+    Tweet.objects.filter(id__in=[t.id for t in tweets[2:5]]).update(created_at=tweets[2].created_at)
+    expected = [t.id for t in sorted(Tweet.objects.all(), key=lambda t: (t.created_at, t.id), reverse=True)]
+
+    client = APIClient()
+    seen, url = [], '/api/tweets/?page_size=3'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert 'count' not in response.data  # no COUNT(*) any more
+        seen += [t['id'] for t in response.data['results']]
+        url = response.data['next']
+
+    assert seen == expected
+
+@pytest.mark.django_db
+def test_graphql_tweets_connection():
+    user = User.objects.create_user(username='gql', password='password123')
+    for i in range(3):
+        Tweet.objects.create(user=user, content=f'tweet {i}')
+
+    query = """
+        query ($after: String) {
+            tweets(first: 2, after: $after) {
+                edges { node { content } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+    """
+    client = APIClient()
+    first = client.post('/graphql/', {'query': query}, format='json').json()['data']['tweets']
+    assert [e['node']['content'] for e in first['edges']] == ['tweet 2', 'tweet 1']
+    assert first['pageInfo']['hasNextPage'] is True
+
+    variables = {'after': first['pageInfo']['endCursor']}
+    second = client.post('/graphql/', {'query': query, 'variables': variables}, format='json').json()['data']['tweets']
+    assert [e['node']['content'] for e in second['edges']] == ['tweet 0']
+    assert second['pageInfo']['hasNextPage'] is False
+
+
+def _graphql_queries_for_feed(n):
+    User.objects.all().delete()
+    authors = [User.objects.create_user(username=f'author{i}', password='password123') for i in range(n)]
+    for i, author in enumerate(authors):
+        tweet = Tweet.objects.create(user=author, content=f'tweet {i}')
+        for j in range(3):
+            Comment.objects.create(user=authors[(i + j) % n], tweet=tweet, text=f'c{j}')
+
+    # `first: n` makes each query body distinct, so the response cache can't answer it
+    query = """
+        query ($first: Int!) {
+            tweets(first: $first) {
+                edges { node { username content comments(first: 2) { text user { username } } } }
+            }
+        }
+    """
+    with CaptureQueriesContext(connection) as queries:
+        data = APIClient().post('/graphql/', {'query': query, 'variables': {'first': n}}, format='json').json()
+    edges = data['data']['tweets']['edges']
+    assert len(edges) == n
+    assert all(len(e['node']['comments']) == 2 and e['node']['comments'][0]['user']['username'] for e in edges)
+    return len(queries)
+
+
+@pytest.mark.django_db
+def test_graphql_query_count_does_not_grow_with_page_size():
+    # tweets + comments + users (authors of tweets AND comments), whatever the page size
+    assert _graphql_queries_for_feed(2) == _graphql_queries_for_feed(8) == 3
+
+
+@pytest.mark.django_db
+def test_graphql_single_tweet_uses_loaders():
+    user = User.objects.create_user(username='single', password='password123')
+    tweet = Tweet.objects.create(user=user, content='just one')
+    query = 'query ($id: Int!) { tweet(id: $id) { content username } }'
+
+    data = APIClient().post('/graphql/', {'query': query, 'variables': {'id': tweet.id}}, format='json').json()
+    assert data['data']['tweet'] == {'content': 'just one', 'username': 'single'}
+
+    missing = APIClient().post('/graphql/', {'query': query, 'variables': {'id': tweet.id + 1}}, format='json').json()
+    assert missing['errors']
+
+@pytest.mark.django_db
+def test_graphql_rejects_too_deep_or_too_expensive_queries(settings):
+    client = APIClient()
+    # 50 tweets x 50 comments x 2 fields each is over GRAPHQL_MAX_COST: rejected before any SQL runs
+    expensive = '{ tweets(first: 50) { edges { node { comments(first: 50) { text user { username } } } } } }'
+    with CaptureQueriesContext(connection) as queries:
+        errors = client.post('/graphql/', {'query': expensive}, format='json').json()['errors']
+    assert 'too expensive' in errors[0]['message']
+    assert len(queries) == 0
+
+    # A variable without a default is costed at its worst case
+    with_variable = 'query ($n: Int!) { tweets(first: 50) { edges { node { comments(first: $n) { text user { username } } } } } }'
+    errors = client.post('/graphql/', {'query': with_variable, 'variables': {'n': 1}}, format='json').json()['errors']
+    assert 'too expensive' in errors[0]['message']
+    # ...and so is one with a small default: the value sent can be anything
+    with_default = 'query ($n: Int = 1) { tweets(first: 50) { edges { node { comments(first: $n) { text user { username } } } } } }'
+    errors = client.post('/graphql/', {'query': with_default, 'variables': {'n': 50}}, format='json').json()['errors']
+    assert 'too expensive' in errors[0]['message']
+
+    # Fragments are followed; this one is cheap (10 tweets x 3 comments)
+    fragments = '{ tweets { ...Page } } fragment Page on TweetConnection { edges { node { ...Node } } } fragment Node on TweetType { comments { text } }'
+    assert 'errors' not in client.post('/graphql/', {'query': fragments}, format='json').json()
+
+    settings.GRAPHQL_MAX_DEPTH = 4
+    deep = '{ tweets { edges { node { comments { user { username } } } } } }'
+    errors = client.post('/graphql/', {'query': deep}, format='json').json()['errors']
+    assert 'exceeds maximum operation depth' in errors[0]['message']
+
+
+@pytest.mark.django_db
+def test_graphql_persisted_query_skips_parse_and_validate(monkeypatch):
+    from strawberry.schema import schema as strawberry_schema
+    from .graphql_extensions import persisted_documents
+
+    persisted_documents.clear()
+    user = User.objects.create_user(username='apq', password='password123')
+    Tweet.objects.create(user=user, content='persisted')
+    query = 'query Feed { tweets(first: 5) { edges { node { content username } } } }'
+    digest = hashlib.sha256(query.encode()).hexdigest()
+    persisted = {'persistedQuery': {'version': 1, 'sha256Hash': digest}}
+    client = APIClient()
+
+    # 1. Unknown hash: the client has to send the full text
+    data = client.post('/graphql/', {'extensions': persisted}, format='json').json()
+    assert data['errors'][0]['message'] == 'PersistedQueryNotFound'
+
+    # 2. Text + hash: parsed, validated and remembered (a wrong hash is refused)
+    wrong = {'persistedQuery': {'version': 1, 'sha256Hash': '0' * 64}}
+    assert client.post('/graphql/', {'query': query, 'extensions': wrong}, format='json').json()['errors']
+    data = client.post('/graphql/', {'query': query, 'extensions': persisted}, format='json').json()
+    assert data['data']['tweets']['edges'][0]['node'] == {'content': 'persisted', 'username': 'apq'}
+
+    # 3. Hash only: no parse, no validation
+    def fail(*args, **kwargs):
+        raise AssertionError('should not run')
+    monkeypatch.setattr(strawberry_schema, 'parse', fail)
+    monkeypatch.setattr(strawberry_schema, 'validate_document', fail)
+    cache.clear()
+    data = client.post('/graphql/', {'extensions': persisted}, format='json').json()
+    assert data['data']['tweets']['edges'][0]['node']['content'] == 'persisted'
+
+    # Resolver timings are exported per (persisted) operation
+    count = REGISTRY.get_sample_value(
+        'tweets_graphql_resolver_seconds_count', {'operation': 'Feed', 'field': 'Query.tweets'},
+    )
+    assert count == 2
+
+# --- COMMENT PREVIEW + COUNT ---
+
+@pytest.mark.django_db
+def test_feed_embeds_bounded_comment_preview(settings, django_assert_max_num_queries):
+    assert settings.COMMENT_PREVIEW_SIZE == 3
+    user = User.objects.create_user(username='viral', password='password123')
+    tweet = Tweet.objects.create(user=user, content='so viral')
+    comments = [Comment.objects.create(user=user, tweet=tweet, text=f'c{i}') for i in range(6)]
+
+    client = APIClient()
+    with django_assert_max_num_queries(2):  # tweets + ONE windowed comment query
+        data = client.get('/api/tweets/').data['results'][0]
+
+    assert data['comments_count'] == 6
+    assert [c['text'] for c in data['comments']] == ['c5', 'c4', 'c3']
+
+    # The full list is paginated separately
+    page = client.get(f'/api/tweets/{tweet.id}/comments/?page_size=4').data
+    assert [c['text'] for c in page['results']] == ['c5', 'c4', 'c3', 'c2']
+    assert [c['text'] for c in client.get(page['next']).data['results']] == ['c1', 'c0']
+
+    comments[0].delete()
+    tweet.refresh_from_db()
+    assert tweet.comments_count == 5
+
+
+@pytest.mark.django_db
+def test_deleting_a_tweet_deletes_its_comments_in_one_statement(django_assert_num_queries):
+    user = User.objects.create_user(username='thread', password='password123')
+    fan = User.objects.create_user(username='threadfan', password='password123')
+    small = Tweet.objects.create(user=user, content='few replies')
+    big = Tweet.objects.create(user=user, content='many replies')
+    Comment.objects.bulk_create([Comment(user=fan, tweet=small, text='hi') for _ in range(2)])
+    Comment.objects.bulk_create([Comment(user=fan, tweet=big, text='hi') for _ in range(200)])
+
+    # Same statements whatever the number of comments: no per-comment load or UPDATE
+    with CaptureQueriesContext(connection) as few:
+        small.delete()
+    with django_assert_num_queries(len(few)):
+        big.delete()
+    assert not Comment.objects.exists()
+
+    # Queryset and user deletes still keep the counter right
+    other = Tweet.objects.create(user=user, content='still here')
+    Comment.objects.bulk_create([Comment(user=fan, tweet=other, text='hi') for _ in range(3)])
+    Tweet.objects.filter(id=other.id).update(comments_count=3)
+    Comment.objects.filter(id=Comment.objects.filter(tweet=other).first().id).delete()
+    fan.delete()
+    other.refresh_from_db()
+    assert other.comments_count == 0
+
+
+# --- SHARE COUNTER (Redis write-behind) ---
+
+@pytest.mark.django_db
+def test_share_is_counted_before_and_after_flush():
+    owner = User.objects.create_user(username='sharer', password='password123')
+    tweet = Tweet.objects.create(user=owner, content='share me')
+    client = APIClient()
+    client.force_authenticate(user=owner)
+
+    for expected in (1, 2):
+        response = client.post(f'/api/tweets/{tweet.id}/share/')
+        assert response.data['shares_count'] == expected
+
+    # Not in the DB yet, but reads merge the pending delta
+    tweet.refresh_from_db()
+    assert tweet.shares_count == 0
+    assert client.get(f'/api/tweets/{tweet.id}/').data['shares_count'] == 2
+
+    assert flush_share_counts() == 1
+    tweet.refresh_from_db()
+    assert tweet.shares_count == 2
+    assert client.get('/api/tweets/').data['results'][0]['shares_count'] == 2
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_shares_are_never_lost():
+    owner = User.objects.create_user(username='hot', password='password123')
+    tweets = [Tweet.objects.create(user=owner, content=f'hot {i}') for i in range(3)]
+    shares = [tweets[i % 3].id for i in range(3000)]
+
+    def share(tweet_id):
+        counters.incr_share(tweet_id)
+
+    def flush():
+        # Flushes racing with the shares (as Celery beat would)
+        try:
+            return counters.flush_shares()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        futures = [pool.submit(share, tweet_id) for tweet_id in shares]
+        futures += [pool.submit(flush) for _ in range(10)]
+        for future in futures:
+            future.result()
+
+    counters.flush_shares()
+
+    for tweet in tweets:
+        tweet.refresh_from_db()
+        assert tweet.shares_count == 1000
+
+@pytest.mark.django_db
+def test_share_flush_that_died_after_the_update_is_not_applied_twice(monkeypatch):
+    owner = User.objects.create_user(username='crash', password='password123')
+    tweet = Tweet.objects.create(user=owner, content='share me')
+    for _ in range(3):
+        counters.incr_share(tweet.id)
+
+    # The UPDATE commits, then the worker dies before deleting the taken deltas
+    def crash(*keys):
+        raise ConnectionError('worker killed')
+    monkeypatch.setattr(get_redis(), 'delete', crash)
+    with pytest.raises(ConnectionError):
+        counters.flush_shares()
+    monkeypatch.undo()
+
+    counters.incr_share(tweet.id)
+    assert counters.flush_shares() == 0   # the retry only clears the applied deltas
+    assert counters.flush_shares() == 1   # then the share made in between
+    tweet.refresh_from_db()
+    assert tweet.shares_count == 4
+
+
+# --- MODERATION ---
+
+def test_moderation_engine_matches_whole_words_in_any_case():
+    engine = ModerationEngine(['bad', 'hate', 'bad apple'])
+    text, matches = engine.censor('BAD day. I Hate this badge, bad apple!')
+    assert matches == 3
+    assert text == '*** day. I **** this badge, *********!'
+
+def test_moderation_lexicon_reloads_from_file(settings, tmp_path):
+    lexicon = tmp_path / 'lexicon.txt'
+    lexicon.write_text('# one term per line\nfoo\n')
+    settings.MODERATION_LEXICON_FILE = str(lexicon)
+    assert get_engine().censor('foo bar')[0] == '*** bar'
+
+    lexicon.write_text('bar\n')
+    os.utime(lexicon, (0, 12345))  # make sure the mtime changes
+    assert get_engine().censor('foo bar')[0] == 'foo ***'
+
+@pytest.mark.django_db
+def test_moderate_tweets_batch():
+    user = User.objects.create_user(username='mod', password='password123')
+    dirty = Tweet.objects.create(user=user, content='Such SPAM')
+    clean = Tweet.objects.create(user=user, content='Spammer badge')
+
+    assert moderate_tweets([dirty.id, clean.id]) == 1
+    dirty.refresh_from_db()
+    clean.refresh_from_db()
+    assert dirty.content == 'Such ****'
+    assert clean.content == 'Spammer badge'
+
+
+# --- IMAGE VARIANTS ---
+
+@pytest.mark.django_db
+def test_resize_image_writes_variants_and_keeps_original(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    user = User.objects.create_user(username='lens', password='password123')
+
+    exif = Image.Exif()
+    exif[0x010F] = 'SecretCam'  # camera maker tag
+    buffer = io.BytesIO()
+    Image.new('RGB', (2000, 1000), (10, 120, 200)).save(buffer, 'JPEG', exif=exif)
+    original = buffer.getvalue()
+    tweet = Tweet.objects.create(user=user, image=SimpleUploadedFile('big.jpg', original, 'image/jpeg'))
+
+    variants = resize_image(tweet.id)
+
+    assert {name: (v['width'], v['height']) for name, v in variants.items()} == {
+        'thumb': (150, 75), 'feed': (600, 300), 'full': (1200, 600),
+    }
+    with open(tweet.image.path, 'rb') as f:
+        assert f.read() == original  # original untouched
+    with Image.open(tmp_path / variants['feed']['jpeg']) as img:
+        assert img.format == 'JPEG' and not img.getexif()
+    with Image.open(tmp_path / variants['thumb']['webp']) as img:
+        assert img.format == 'WEBP'
+
+    # Idempotent: same paths the second time
+    assert resize_image(tweet.id) == variants
+
+    data = APIClient().get(f'/api/tweets/{tweet.id}/').data
+    assert data['image_variants']['feed']['webp'].endswith(variants['feed']['webp'])
+
+
+# --- POST-CREATE PIPELINE ---
+
+@pytest.mark.django_db
+def test_tweet_pipeline_decodes_once_and_is_idempotent(settings, tmp_path, monkeypatch):
+    from . import timeline
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    user = User.objects.create_user(username='pipeline', password='password123')
+    tweet = Tweet.objects.create(user=user, content='spam cat', image=make_image_file(size=(1600, 1200)))
+
+    decoded, predicted = [], []
+    real_load_pixels = ml.load_pixels
+    def load_pixels(img_or_path):
+        decoded.append(img_or_path)
+        return real_load_pixels(img_or_path)
+    def fake_predict(pixel_arrays, top=3):
+        predicted.append(len(pixel_arrays))
+        return [['tabby'] for _ in pixel_arrays]
+    monkeypatch.setattr(ml, 'load_pixels', load_pixels)
+    monkeypatch.setattr(ml, 'predict_tags', fake_predict)
+
+    # Moderation + fan-out right away; the image goes to the `images` queue
+    assert process_new_tweet(tweet.id) == ['content']
+    assert process_tweet_image(tweet.id) == ['image_variants', 'ai_tags']
+
+    tweet.refresh_from_db()
+    assert tweet.content == '**** cat'
+    assert tweet.ai_tags == 'tabby'
+    assert set(tweet.image_variants) == {'thumb', 'feed', 'full'}
+    # The classifier got the pixels the pipeline had already decoded (no file re-read)
+    assert len(decoded) == 1 and isinstance(decoded[0], Image.Image)
+    assert predicted == [1]
+    assert timeline.read_timeline(user.id, 10) == [tweet.id]
+
+    # A retry does not classify again or change anything else
+    assert process_new_tweet(tweet.id) == []
+    assert process_tweet_image(tweet.id) == ['image_variants']
+    assert predicted == [1]
+
+
+def make_pattern_file(seed, name='meme.png', size=(640, 480), fmt='PNG', quality=95):
+    # A blocky random picture: unlike a flat colour, it has a distinctive perceptual hash
+    pixels = np.random.default_rng(seed).integers(0, 255, (6, 8, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(size, Image.BICUBIC).save(buffer, format=fmt, quality=quality)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+@pytest.mark.django_db
+def test_reposted_image_reuses_tags_and_is_found_as_similar(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    user = User.objects.create_user(username='memer', password='password123')
+    predicted = []
+    def fake_predict(pixel_arrays, top=3):
+        predicted.append(len(pixel_arrays))
+        return [['doge'] for _ in pixel_arrays]
+    monkeypatch.setattr(ml, 'predict_tags', fake_predict)
+
+    original = Tweet.objects.create(user=user, image=make_pattern_file(1))
+    process_tweet_image(original.id)
+    # Smaller and recompressed: a few bits apart at most
+    repost = Tweet.objects.create(user=user, image=make_pattern_file(1, 'repost.jpg', (300, 225), 'JPEG', 60))
+    assert process_tweet_image(repost.id) == ['image_variants', 'ai_tags']
+    other = Tweet.objects.create(user=user, image=make_pattern_file(2))
+    process_tweet_image(other.id)
+
+    # The repost got the tags without a model run; the other picture was classified
+    repost.refresh_from_db()
+    assert repost.ai_tags == 'doge'
+    assert predicted == [1, 1]
+
+    hashes = dict(ImageHash.objects.values_list('tweet_id', 'hash'))
+    assert imagehash.distance(hashes[original.id], hashes[repost.id]) <= settings.IMAGE_DUPLICATE_DISTANCE
+    assert imagehash.distance(hashes[original.id], hashes[other.id]) > settings.IMAGE_SIMILAR_MAX_DISTANCE
+
+    client = APIClient()
+    response = client.get(f'/api/tweets/{original.id}/similar/')
+    assert [(t['id'], t['distance']) for t in response.data['results']] == [
+        (repost.id, imagehash.distance(hashes[original.id], hashes[repost.id])),
+    ]
+    assert client.get(f'/api/tweets/{original.id}/similar/?distance=64').status_code == 400
+
+
+def test_band_search_finds_every_hash_within_the_distance():
+    # Pigeonhole: flipping any `d` bits must still share a band lookup (d // BANDS flips)
+    value = 0x0123456789ABCDEF
+    rng = np.random.default_rng(0)
+    for d in range(12):
+        bits = rng.choice(64, size=d, replace=False)
+        other = value
+        for bit in bits:
+            other ^= 1 << int(bit)
+        flips = d // imagehash.BANDS
+        assert any(
+            b in imagehash._neighbours(a, flips) for a, b in zip(imagehash.bands(value), imagehash.bands(other))
+        )
+
+
+# --- FULL-TEXT SEARCH ---
+
+@pytest.mark.django_db
+def test_ranked_search_with_highlight_and_typo_fallback():
+    user = User.objects.create_user(username='searcher', password='password123')
+    best = Tweet.objects.create(user=user, content='Cats are sleeping. More cats!', ai_tags='tabby')
+    other = Tweet.objects.create(user=user, content='A dog chasing a cat')
+    Tweet.objects.create(user=user, content='Nothing to see here')
+    client = APIClient()
+
+    data = client.get('/api/tweets/search/?q=cats').data
+    assert data['mode'] == 'fulltext'
+    assert [t['id'] for t in data['results']] == [best.id, other.id]
+    assert '<mark>Cats</mark>' in data['results'][0]['headline']
+
+    # The search vector follows later writes (ai_tags set by the classifier)
+    Tweet.objects.filter(id=other.id).update(ai_tags='golden retriever')
+    assert [t['id'] for t in client.get('/api/tweets/search/?q=retriever').data['results']] == [other.id]
+
+    # Typo: no lexeme matches, trigram similarity does
+    data = client.get('/api/tweets/search/?q=sleepng').data
+    assert data['mode'] == 'fuzzy'
+    assert [t['id'] for t in data['results']] == [best.id]
+
+    # ?search= on the feed uses the same index (username is part of the document)
+    assert len(client.get('/api/tweets/?search=searcher').data['results']) == 3
+    # ...and follows a rename
+    User.objects.filter(id=user.id).update(username='finder')
+    assert len(client.get('/api/tweets/?search=finder').data['results']) == 3
+    assert client.get('/api/tweets/?search=searcher').data['results'] == []
+
+    # Deep pages are refused, not silently answered with the last allowed one
+    assert client.get('/api/tweets/search/?q=cats&page=10').status_code == 200
+    assert client.get('/api/tweets/search/?q=cats&page=11').status_code == 400
+    assert client.get('/api/tweets/search/?q=cats&page=0').status_code == 400
+
+
+# --- RESPONSE CACHE ---
+
+def cache_events(result):
+    return REGISTRY.get_sample_value(
+        'tweets_response_cache_requests_total', {'kind': 'feed', 'result': result}) or 0
+
+@pytest.mark.django_db
+def test_anonymous_feed_is_cached_and_invalidated(django_assert_num_queries):
+    user = User.objects.create_user(username='cached', password='password123')
+    tweet = Tweet.objects.create(user=user, content='cache me')
+    anon = APIClient()
+
+    hits = cache_events('hit')
+    anon.get('/api/tweets/')
+    with django_assert_num_queries(0):
+        assert anon.get('/api/tweets/').data['results'][0]['content'] == 'cache me'
+    assert cache_events('hit') == hits + 1
+
+    # A comment changes the tweet -> the page with it is recomputed
+    Comment.objects.create(user=user, tweet=tweet, text='first!')
+    assert anon.get('/api/tweets/').data['results'][0]['comments_count'] == 1
+
+    # So does a share, and the detail view is cached/invalidated the same way
+    author = APIClient()
+    author.force_authenticate(user=user)
+    assert anon.get(f'/api/tweets/{tweet.id}/').data['shares_count'] == 0
+    author.post(f'/api/tweets/{tweet.id}/share/')
+    assert anon.get(f'/api/tweets/{tweet.id}/').data['shares_count'] == 1
+
+    # A new tweet shows up on the first page
+    Tweet.objects.create(user=user, content='newer')
+    assert anon.get('/api/tweets/').data['results'][0]['content'] == 'newer'
+
+    # Logged-in users are not served from the cache (is_owner differs)
+    assert author.get('/api/tweets/').data['results'][0]['is_owner'] is True
+
+def test_stale_response_is_served_while_another_request_refreshes():
+    key = response_cache.make_key('feed', 'anon', 'stale-test')
+    assert response_cache.get_or_compute(key, 'feed', lambda: 'v1', deps=lambda v: [999]) == 'v1'
+
+    response_cache.invalidate_tweet(999)
+    # Simulate a request that is already recomputing
+    lock = get_redis_connection('default')
+    lock.set(key + ':lock', 1)
+    assert response_cache.get_or_compute(key, 'feed', lambda: 'v2') == 'v1'
+    lock.delete(key + ':lock')
+    assert response_cache.get_or_compute(key, 'feed', lambda: 'v2') == 'v2'
+
+
+@pytest.mark.django_db
+def test_only_invalidations_of_its_own_tweets_keep_a_response_stale():
+    conn = get_redis_connection('default')
+    key = response_cache.make_key('feed', 'anon', 'fresh-test')
+
+    def compute(invalidated):
+        def run():
+            response_cache.invalidate_tweet(invalidated, graphql=False)
+            return 'v'
+        return run
+
+    # Someone else's tweet changed while computing: still fresh
+    response_cache.get_or_compute(key, 'feed', compute(2), deps=lambda v: [1])
+    assert conn.exists(key + ':fresh')
+    # One of ours did: stored as a stale fallback only
+    conn.delete(key, key + ':fresh')
+    response_cache.get_or_compute(key, 'feed', compute(1), deps=lambda v: [1])
+    assert conn.exists(key) and not conn.exists(key + ':fresh')
+
+    # GraphQL is only invalidated by what it shows
+    user = User.objects.create_user(username='gql', password='password123')
+    tweet = Tweet.objects.create(user=user, content='hi')
+    generation = response_cache.graphql_generation()
+    tweet.ai_tags = 'cat'
+    tweet.save(update_fields=['ai_tags'])
+    counters.incr_share(tweet.id)
+    assert response_cache.graphql_generation() == generation
+    tweet.content = 'edited'
+    tweet.save(update_fields=['content'])
+    counters.flush_shares()
+    assert response_cache.graphql_generation() == generation + 2
+
+
+# --- FAST SERIALIZATION + RENDERERS ---
+
+@pytest.mark.django_db
+def test_fast_list_serialization_matches_drf(settings, tmp_path):
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from rest_framework.request import Request
+    from .search import ranked_search
+    from .serializers import TweetSearchResultSerializer, TweetSerializer
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    author = User.objects.create_user(username='fast', password='password123')
+    reader = User.objects.create_user(username='reader', password='password123')
+    with_image = Tweet.objects.create(user=author, content='picture of a cat', image=make_image_file())
+    resize_image(with_image.id)
+    plain = Tweet.objects.create(user=reader, content='plain cat text', ai_tags='cat, tabby')
+    Comment.objects.create(user=reader, tweet=plain, text='nice')
+    counters.incr_share(plain.id)
+
+    django_request = APIRequestFactory().get('/api/tweets/')
+    force_authenticate(django_request, user=reader)
+    for request in (None, Request(django_request)):
+        if request is not None:
+            request.user  # authenticate
+        context = {'request': request}
+        tweets = list(Tweet.objects.select_related('user').with_comment_preview().order_by('-id'))
+        fast = TweetSerializer(tweets, many=True, context=context).data
+        counters.merge_pending_shares(tweets)
+        slow = [super(TweetSerializer, TweetSerializer(t, context=context)).to_representation(t) for t in tweets]
+        assert fast == slow
+
+        found, _ = ranked_search(Tweet.objects.select_related('user'), 'cat', 0, 10)
+        fast = TweetSearchResultSerializer(found, many=True, context=context).data
+        slow = [
+            super(TweetSerializer, TweetSearchResultSerializer(t, context=context)).to_representation(t)
+            for t in found
+        ]
+        assert fast == slow and {'rank', 'headline'} <= set(fast[0])
+
+
+@pytest.mark.django_db
+def test_feed_renders_as_json_or_msgpack():
+    import msgpack
+    import orjson
+
+    user = User.objects.create_user(username='packer', password='password123')
+    Tweet.objects.create(user=user, content='héllo ✓')
+    client = APIClient()
+
+    as_json = client.get('/api/tweets/')
+    assert as_json['Content-Type'] == 'application/json'
+    assert 'héllo ✓'.encode() in as_json.content  # UTF-8, not \u escapes
+
+    as_msgpack = client.get('/api/tweets/', HTTP_ACCEPT='application/msgpack')
+    assert as_msgpack['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(as_msgpack.content) == orjson.loads(as_json.content)
+
+
+# --- WEBSOCKETS: token auth, presence, batched publisher ---
+
+@pytest.mark.django_db
+def test_websocket_notifications_go_through_presence_and_publisher(settings, django_capture_on_commit_callbacks):
+    from asgiref.sync import async_to_sync
+    from channels.testing import WebsocketCommunicator
+    from rest_framework.authtoken.models import Token
+    from backend.asgi import application
+    from . import presence, publisher
+
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    settings.NOTIFICATION_COALESCE_WINDOW = 0
+    owner = User.objects.create_user(username='online', password='password123')
+    offline = User.objects.create_user(username='offline', password='password123')
+    token = Token.objects.create(user=owner)
+
+    # Commenting only buffers the events (after commit); the flush writes the inbox and queues the pushes
+    with django_capture_on_commit_callbacks(execute=True):
+        Comment.objects.create(user=offline, tweet=Tweet.objects.create(user=owner, content='mine'), text='hello there')
+        Comment.objects.create(user=owner, tweet=Tweet.objects.create(user=offline, content='theirs'), text='hi')
+    assert get_redis().llen(publisher.OUTBOX_KEY) == 0
+    assert len(notifications.flush_due()) == 2
+    assert get_redis().llen(publisher.OUTBOX_KEY) == 2
+
+    async def scenario():
+        for path in ('/ws/notifications/', '/ws/notifications/?token=wrong', f'/ws/notifications/{offline.id}/?token={token.key}'):
+            connected, _ = await WebsocketCommunicator(application, path).connect()
+            assert not connected
+
+        socket = WebsocketCommunicator(application, f'/ws/notifications/?token={token.key}')
+        connected, _ = await socket.connect()
+        assert connected
+        assert await presence.online_users([owner.id, offline.id]) == {owner.id}
+
+        # One batch: delivered to the online owner, dropped for the offline user
+        assert await publisher.drain() == 1
+        pushed = json.loads(await socket.receive_from())
+        assert pushed['message'] == '@offline commented: hello there...'
+        assert pushed['notification']['kind'] == 'comment' and pushed['unread'] == 1
+        assert await socket.receive_nothing()
+
+        await socket.disconnect()
+        assert await presence.online_users([owner.id]) == set()
+
+    async_to_sync(scenario)()
+
+
+# --- NOTIFICATIONS: coalescing, durable inbox, replay ---
+
+@pytest.mark.django_db
+def test_comment_burst_is_coalesced_into_one_notification(settings, django_capture_on_commit_callbacks):
+    from . import publisher
+
+    owner = User.objects.create_user(username='owner', password='password123')
+    tweet = Tweet.objects.create(user=owner, content='going viral')
+    fans = User.objects.bulk_create([User(username=f'u{i}') for i in range(50)])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for fan in fans:
+            Comment.objects.create(user=fan, tweet=tweet, text='wow')
+
+    # Still inside the window: nothing written or pushed
+    assert notifications.flush_due() == []
+    rows = notifications.flush_due(now=10 ** 10)
+
+    assert len(rows) == 1
+    row = Notification.objects.get()
+    assert row.text == '@u0, @u1 and 48 others commented on your tweet'
+    assert row.count == 50 and row.tweet_id == tweet.id
+    assert get_redis().llen(publisher.OUTBOX_KEY) == 1
+
+    # A later comment starts a new group
+    with django_capture_on_commit_callbacks(execute=True):
+        Comment.objects.create(user=fans[0], tweet=tweet, text='me again')
+    assert notifications.flush_due(now=10 ** 10)[0].text == '@u0 commented: me again...'
+
+
+@pytest.mark.django_db
+def test_flush_skips_deleted_tweets_and_keeps_buffers_on_failure(monkeypatch, django_capture_on_commit_callbacks):
+    from django.db import IntegrityError
+
+    fan = User.objects.create_user(username='fan', password='password123')
+    tweets = [
+        Tweet.objects.create(user=User.objects.create_user(username=f'owner{i}', password='password123'), content='hi')
+        for i in range(2)
+    ]
+    with django_capture_on_commit_callbacks(execute=True):
+        for tweet in tweets:
+            Comment.objects.create(user=fan, tweet=tweet, text='nice')
+
+    # A failed write puts the groups back instead of dropping them
+    def fail(*args, **kwargs):
+        raise IntegrityError('boom')
+    monkeypatch.setattr(Notification.objects, 'bulk_create', fail)
+    with pytest.raises(IntegrityError):
+        notifications.flush_due(now=10 ** 10)
+    monkeypatch.undo()
+
+    # Deleted during the window: its group is dropped, the other user still gets theirs
+    tweets[0].delete()
+    rows = notifications.flush_due(now=10 ** 10)
+    assert [(row.recipient_id, row.tweet_id, row.count) for row in rows] == [(tweets[1].user_id, tweets[1].id, 1)]
+    assert notifications.flush_due(now=10 ** 10) == []
+
+
+@pytest.mark.django_db
+def test_notification_inbox_unread_and_replay_on_reconnect(settings):
+    from asgiref.sync import async_to_sync
+    from channels.testing import WebsocketCommunicator
+    from rest_framework.authtoken.models import Token
+    from backend.asgi import application
+
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    settings.NOTIFICATION_REPLAY_LIMIT = 2
+    user = User.objects.create_user(username='inbox', password='password123')
+    token = Token.objects.create(user=user)
+    rows = Notification.objects.bulk_create([
+        Notification(recipient=user, kind=Notification.AI_UPDATE, text=f'n{i}') for i in range(4)
+    ])
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+    assert [n['text'] for n in client.get('/api/notifications/').data['results']] == ['n3', 'n2', 'n1', 'n0']
+    assert client.get('/api/notifications/unread/').data == {'unread': 4}
+    assert client.post('/api/notifications/read/', {'up_to': rows[1].id}).data == {'marked': 2, 'unread': 2}
+
+    # Reconnect after having seen n0: the missed ones come first, capped at the limit
+    async def scenario():
+        socket = WebsocketCommunicator(application, f'/ws/notifications/?token={token.key}&cursor={rows[0].id}')
+        connected, _ = await socket.connect()
+        assert connected
+        frame = json.loads(await socket.receive_from())
+        await socket.disconnect()
+        return frame
+
+    frame = async_to_sync(scenario)()
+    assert [n['text'] for n in frame['replay']] == ['n1', 'n2']
+    assert frame['more'] is True and frame['unread'] == 2
+    assert [n['read'] for n in frame['replay']] == [True, False]
+
+
+# --- CHUNKED UPLOADS and RANGED MEDIA ---
+
+def upload_in_chunks(client, kind, data, filename, chunk_size):
+    created = client.post('/api/uploads/', {'kind': kind, 'filename': filename, 'size': len(data)}, format='json')
+    assert created.status_code == 201
+    url = f"/api/uploads/{created.data['id']}/"
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        response = client.generic(
+            'PUT', url, chunk, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(chunk) - 1}/{len(data)}',
+        )
+        assert response.status_code == 200, response.data
+    return created.data['id'], url
+
+
+@pytest.mark.django_db
+def test_chunked_upload_resumes_and_attaches_to_a_tweet(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.UPLOAD_CHUNK_SIZE = 1000
+    user = User.objects.create_user(username='uploader', password='password123')
+    client = APIClient()
+    client.force_authenticate(user=user)
+    data = os.urandom(2500)
+
+    created = client.post('/api/uploads/', {'kind': 'video', 'filename': '../cat video.mp4', 'size': len(data)}, format='json')
+    url = f"/api/uploads/{created.data['id']}/"
+
+    def put(start, end):
+        return client.generic('PUT', url, data[start:end + 1], content_type='application/octet-stream',
+                              HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(data)}')
+
+    assert put(0, 999).data['offset'] == 1000
+    # The same chunk again (the response got lost): 409 with where to resume
+    retry = put(0, 999)
+    assert retry.status_code == 409 and retry.data['offset'] == 1000
+    assert put(1000, 1499).status_code == 400  # chunks are chunk_size bytes
+    assert client.post(f'{url}complete/').status_code == 400  # not everything is there yet
+
+    assert client.get(url).data['offset'] == 1000
+    put(1000, 1999)
+    put(2000, 2499)
+    assert client.post(f'{url}complete/').data['status'] == 'complete'
+
+    other = User.objects.create_user(username='thief', password='password123')
+    thief = APIClient()
+    thief.force_authenticate(user=other)
+    assert thief.get(url).status_code == 404
+    assert thief.post('/api/tweets/', {'content': 'mine', 'video_upload': created.data['id']}).status_code == 400
+
+    response = client.post('/api/tweets/', {'content': 'look', 'video_upload': created.data['id']})
+    assert response.status_code == 201
+    tweet = Tweet.objects.get(id=response.data['id'])
+    assert tweet.video.name.startswith('tweet_videos/uploads/') and tweet.video.name.endswith('cat_video.mp4')
+    assert (tmp_path / tweet.video.name).read_bytes() == data
+    # Attached once only
+    assert client.post('/api/tweets/', {'content': 'again', 'video_upload': created.data['id']}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_chunked_upload_rejects_a_broken_image(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    user = User.objects.create_user(username='uploader', password='password123')
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    upload_id, url = upload_in_chunks(client, 'image', b'not a png at all', 'x.png', settings.UPLOAD_CHUNK_SIZE)
+    assert client.post(f'{url}complete/').status_code == 400
+    assert not Upload.objects.filter(id=upload_id).exists()
+    assert not any(path.is_file() for path in tmp_path.rglob('*'))
+
+
+@pytest.mark.django_db
+def test_chunked_upload_to_s3_uses_multipart(settings):
+    import boto3
+    from moto import mock_aws
+
+    settings.UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # S3's minimum part size
+    user = User.objects.create_user(username='uploader', password='password123')
+    client = APIClient()
+    client.force_authenticate(user=user)
+    data = os.urandom(settings.UPLOAD_CHUNK_SIZE + 1234)
+
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='media')
+        settings.STORAGES = {
+            'default': {'BACKEND': 'storages.backends.s3.S3Storage', 'OPTIONS': {'bucket_name': 'media'}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        upload_id, url = upload_in_chunks(client, 'video', data, 'clip.mp4', settings.UPLOAD_CHUNK_SIZE)
+        assert len(Upload.objects.get(id=upload_id).backend_state['parts']) == 2
+        assert client.post(f'{url}complete/').status_code == 200
+
+        response = client.post('/api/tweets/', {'content': 'on s3', 'video_upload': upload_id})
+        name = Tweet.objects.get(id=response.data['id']).video.name
+        assert s3.get_object(Bucket='media', Key=name)['Body'].read() == data
+        # Media URLs send the client to the bucket, which handles ranges itself
+        assert client.get(f'/media/{name}').status_code == 302
+
+
+@pytest.mark.django_db
+def test_media_is_served_with_ranges(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    (tmp_path / 'tweet_videos').mkdir()
+    (tmp_path / 'tweet_videos' / 'clip.mp4').write_bytes(bytes(range(256)) * 4)
+    client = APIClient()
+
+    whole = client.get('/media/tweet_videos/clip.mp4')
+    assert whole.status_code == 200 and whole['Accept-Ranges'] == 'bytes'
+    assert whole['Content-Type'] == 'video/mp4' and len(b''.join(whole.streaming_content)) == 1024
+
+    part = client.get('/media/tweet_videos/clip.mp4', HTTP_RANGE='bytes=10-19')
+    assert part.status_code == 206 and part['Content-Range'] == 'bytes 10-19/1024'
+    assert b''.join(part.streaming_content) == bytes(range(10, 20))
+
+    # Under ASGI the file is read by an async iterator (not loaded whole into memory)
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+
+    async def fetch_over_asgi():
+        response = await AsyncClient().get('/media/tweet_videos/clip.mp4', headers={'Range': 'bytes=10-19'})
+        return [block async for block in response.streaming_content]
+    assert b''.join(async_to_sync(fetch_over_asgi)()) == bytes(range(10, 20))
+
+    tail = client.get('/media/tweet_videos/clip.mp4', HTTP_RANGE='bytes=-4')
+    assert b''.join(tail.streaming_content) == bytes(range(252, 256))
+
+    assert client.get('/media/tweet_videos/clip.mp4', HTTP_RANGE='bytes=5000-').status_code == 416
+    assert client.get('/media/../settings.py').status_code == 404
+    assert client.get('/media/tweet_videos/missing.mp4').status_code == 404
+
+
+# --- VIDEO TRANSCODING ---
+
+def test_video_ladder_never_upscales(settings):
+    from . import video
+
+    settings.VIDEO_RENDITIONS = {'720p': (720, 2500, 128), '480p': (480, 1000, 96), '240p': (240, 300, 64)}
+    assert [name for name, *_ in video.ladder(1080)] == ['720p', '480p', '240p']
+    assert [name for name, *_ in video.ladder(480)] == ['480p', '240p']
+    # Smaller than every rendition: one capped rendition at the source height
+    assert video.ladder(181) == [('240p', 180, 300, 64)]
+
+
+def test_tasks_are_routed_to_their_queue_and_priority(settings):
+    from backend.celery import app
+    from .tasks import classify_image, moderate_content, transcode_video
+
+    route = app.amqp.router.route
+    assert route({}, moderate_content.name)['queue'].name == 'realtime'
+    assert route({}, moderate_content.name)['priority'] == 2
+    assert route({}, process_new_tweet.name)['queue'].name == 'realtime'
+    assert route({}, process_tweet_image.name)['queue'].name == 'images'
+    assert route({}, classify_image.name)['queue'].name == 'images'
+    assert route({}, transcode_video.name)['queue'].name == 'video'
+    assert route({}, 'tweets.tasks.expire_uploads')['queue'].name == 'celery'
+    assert classify_image.rate_limit == settings.CELERY_TASK_ANNOTATIONS[classify_image.name]['rate_limit']
+
+
+def test_queue_collector_reports_depth_and_oldest_message(settings):
+    import redis
+    from backend.celery import app
+    from .metrics import CeleryQueueCollector
+
+    broker = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    queue = 'metrics-test'
+    keys = [queue, *(f'{queue}:{p}' for p in range(1, 10))]
+    broker.delete(*keys)
+    try:
+        # Never consumed: there's no worker for this queue
+        app.send_task('tweets.tasks.expire_uploads', queue=queue, priority=7)
+        app.send_task('tweets.tasks.expire_uploads', queue=queue, priority=0)
+        time.sleep(0.05)
+        app.send_task('tweets.tasks.expire_uploads', queue=queue, priority=7)
+
+        depth, age = CeleryQueueCollector(queues=[queue]).collect()
+        assert [(s.labels, s.value) for s in depth.samples] == [({'queue': queue}, 3)]
+        assert broker.llen(queue) == 1 and broker.llen(f'{queue}:7') == 2
+        assert 0.05 <= age.samples[0].value < 5
+    finally:
+        broker.delete(*keys)
+
+
+@pytest.mark.django_db
+def test_transcode_is_queued_after_the_processing_status_is_saved(monkeypatch, django_capture_on_commit_callbacks):
+    from .tasks import schedule_transcode, transcode_video
+
+    user = User.objects.create_user(username='fast', password='password123')
+    tweet = Tweet.objects.create(user=user, content='clip', video='tweet_videos/missing.mp4')
+    # A worker fast enough to finish before the request does
+    monkeypatch.setattr(transcode_video, 'delay', lambda tweet_id: Tweet.objects.filter(id=tweet_id).update(
+        video_renditions={'status': 'failed'}))
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        schedule_transcode(tweet)
+        assert Tweet.objects.get(id=tweet.id).video_renditions == {'status': 'processing'}
+    assert len(callbacks) == 1
+    assert Tweet.objects.get(id=tweet.id).video_renditions == {'status': 'failed'}
+
+
+@pytest.mark.skipif(not (shutil.which('ffmpeg') and shutil.which('ffprobe')), reason='needs ffmpeg and ffprobe')
+@pytest.mark.django_db
+def test_transcode_video_writes_renditions_hls_and_poster(settings, tmp_path):
+    import subprocess
+    from .tasks import transcode_video
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.VIDEO_HLS_SEGMENT_SECONDS = 1
+    (tmp_path / 'tweet_videos').mkdir()
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=640x480:rate=25:duration=3',
+        '-f', 'lavfi', '-i', 'sine=duration=3', '-shortest', str(tmp_path / 'tweet_videos' / 'clip.mp4'),
+    ], check=True)
+    user = User.objects.create_user(username='director', password='password123')
+    tweet = Tweet.objects.create(user=user, content='action', video='tweet_videos/clip.mp4')
+
+    assert transcode_video(tweet.id) == 'ready'
+
+    renditions = Tweet.objects.get(id=tweet.id).video_renditions
+    assert sorted(renditions['mp4']) == ['240p', '480p']
+    assert renditions['mp4']['240p'] | {'path': None} == {'width': 320, 'height': 240, 'bitrate': 364, 'path': None}
+    assert 2.5 < renditions['duration'] < 3.5
+    master = (tmp_path / renditions['hls']).read_text()
+    assert '480p/index.m3u8' in master and 'RESOLUTION=640x480' in master
+    assert (tmp_path / renditions['hls']).parent.joinpath('240p', 'seg_000.ts').exists()
+    with Image.open(tmp_path / renditions['poster']) as poster:
+        assert poster.size == (640, 480)
+
+    # Served (with ranges) through /media/, and shown in the API
+    data = APIClient().get(f'/api/tweets/{tweet.id}/').data['video_renditions']
+    assert data['mp4']['480p']['url'].endswith(renditions['mp4']['480p']['path'])
+    assert APIClient().get(f"/media/{renditions['hls']}")['Content-Type'] == 'application/vnd.apple.mpegurl'
+
+
+# --- SIGNUP AVAILABILITY (Bloom filter + case-insensitive unique indexes) ---
+
+@pytest.mark.django_db
+def test_availability_check_answers_free_names_without_the_db(django_assert_num_queries):
+    from . import availability
+
+    client = APIClient()
+    User.objects.create_user(username='John', email='John@Example.com', password='password123')
+    check = lambda kind, value: client.post('/api/check-availability/', {'type': kind, 'value': value}).data['taken']
+
+    # Not built yet: every answer comes from the DB
+    with django_assert_num_queries(1):
+        assert check('username', 'nobody') is False
+
+    # What a deploy runs after `migrate`; the second time there's nothing to do
+    out = io.StringIO()
+    call_command('rebuild_availability_filters', missing=True, stdout=out)
+    assert 'username filter built from 1 users' in out.getvalue()
+    assert all(availability.get_filter(kind).is_built() for kind in availability.KINDS)
+    with django_assert_num_queries(0):
+        call_command('rebuild_availability_filters', missing=True, stdout=io.StringIO())
+    with django_assert_num_queries(0):
+        assert check('username', 'nobody') is False
+        assert check('email', 'nobody@example.com') is False
+    # Any case: the filter and the DB compare upper-cased values
+    with django_assert_num_queries(1):
+        assert check('username', 'jOHN') is True
+    with django_assert_num_queries(1):
+        assert check('email', 'john@example.COM') is True
+
+    # A signup is added right away (no rebuild needed), and case variants are refused
+    response = client.post('/api/signup/', {'username': 'Mary', 'password': 'password123', 'email': 'mary@example.com'})
+    assert response.status_code == 201
+    assert check('username', 'mary') is True
+    response = client.post('/api/signup/', {'username': 'MARY', 'password': 'password123'})
+    assert response.status_code == 400 and 'username' in response.data
+
+
+def test_bloom_filter_keeps_items_added_during_a_rebuild():
+    from .bloom import RedisBloomFilter
+
+    bloom = RedisBloomFilter('test', capacity=1000, error_rate=0.01, shards=4)
+    bloom.add('early')  # before the first build: not stored, and nothing claims to be free
+    assert bloom.might_contain('early') is None and not bloom.is_built()
+
+    def existing():
+        yield 'alice'
+        bloom.add('signed-up-meanwhile')  # a signup while the DB is being read
+        yield 'bob'
+
+    assert bloom.rebuild(existing()) == 2
+    assert bloom.is_built()
+    assert all(bloom.might_contain(name) for name in ('alice', 'bob', 'signed-up-meanwhile'))
+    false_positives = sum(bool(bloom.might_contain(f'free-{i}')) for i in range(1000))
+    assert false_positives < 50
+
+
+# --- CACHED TOKEN AUTHENTICATION ---
+
+@pytest.mark.django_db
+def test_token_auth_is_cached_and_revoked_on_rotation_and_deactivation(django_assert_num_queries):
+    from rest_framework.authtoken.models import Token
+    from . import authentication
+
+    user = User.objects.create_user(username='tokenuser', email='t@example.com', password='password123')
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    with django_assert_num_queries(1):  # authtoken_token JOIN auth_user
+        assert client.get('/api/me/').data['username'] == 'tokenuser'
+    with django_assert_num_queries(0):  # process-local cache
+        assert client.get('/api/me/').data['username'] == 'tokenuser'
+    authentication.local_cache().clear()
+    with django_assert_num_queries(0):  # Redis (another process)
+        assert client.get('/api/me/').data['username'] == 'tokenuser'
+    assert not get_redis().exists(f'auth:token:{token.key}')  # stored under its hash only
+
+    # Rotation: the old token stops working at once, the new one works
+    new_key = client.post('/api/token/rotate/').data['token']
+    assert client.get('/api/me/').status_code == 401
+    client.credentials(HTTP_AUTHORIZATION=f'Token {new_key}')
+    assert client.get('/api/me/').status_code == 200
+
+    # Deactivating the user drops every cached copy
+    user.is_active = False
+    user.save()
+    assert client.get('/api/me/').status_code == 401
+
+    user.is_active = True
+    user.save()
+    assert client.post('/api/logout/').status_code == 204
+    assert client.get('/api/me/').status_code == 401
+
+
+@pytest.mark.django_db
+def test_token_read_before_a_logout_is_not_cached_after_it(monkeypatch):
+    from rest_framework.authtoken.models import Token
+    from . import authentication
+
+    user = User.objects.create_user(username='racer', password='password123')
+    token = Token.objects.create(user=user)
+    user_fields = authentication._user_fields
+
+    def logout_meanwhile(u):
+        # The row is already read; the logout commits and revokes before the fill
+        authentication.revoke_token(token.key)
+        return user_fields(u)
+    monkeypatch.setattr(authentication, '_user_fields', logout_meanwhile)
+
+    assert authentication.resolve_token(token.key).id == user.id   # this request still passes
+    assert not get_redis().exists(authentication.TOKEN_KEY.format(authentication.digest(token.key)))
+    assert authentication.local_cache().get(authentication.digest(token.key)) is None
+
+    # Same for a user-wide revocation (deactivation, rename...)
+    monkeypatch.setattr(authentication, '_user_fields', lambda u: authentication.revoke_user(u.id) or user_fields(u))
+    authentication.resolve_token(token.key)
+    assert not get_redis().exists(authentication.TOKEN_KEY.format(authentication.digest(token.key)))
+
+    # Later reads fill it again
+    monkeypatch.undo()
+    authentication.resolve_token(token.key)
+    assert get_redis().exists(authentication.TOKEN_KEY.format(authentication.digest(token.key)))
+
+def test_token_revocation_reaches_other_processes():
+    from . import authentication
+
+    authentication.start_revocation_listener()
+    redis_client = get_redis()
+    deadline = time.monotonic() + 5
+    while dict(redis_client.pubsub_numsub(authentication.AUTH_REVOKE_CHANNEL)).get(
+            authentication.AUTH_REVOKE_CHANNEL.encode(), 0) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    cached = authentication.local_cache()
+    cached.set(authentication.digest('somekey'), {'id': 1})
+    cached.set(authentication.digest('otherkey'), {'id': 2})
+    # What revoke_token() in another process publishes
+    redis_client.publish(authentication.AUTH_REVOKE_CHANNEL, f"token:{authentication.digest('somekey')}")
+    while cached.get(authentication.digest('somekey')) is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cached.get(authentication.digest('somekey')) is None
+    assert cached.get(authentication.digest('otherkey')) == {'id': 2}
+
+
+# --- RATE LIMITING (GCRA in Redis, shared by REST, GraphQL and WebSockets) ---
+
+@pytest.mark.django_db
+def test_rate_limit_is_one_budget_with_costs_across_rest_graphql_and_websockets(settings, tmp_path):
+    from asgiref.sync import async_to_sync
+    from channels.testing import WebsocketCommunicator
+    from rest_framework.authtoken.models import Token
+    from backend.asgi import application
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'anon': '3/min', 'user': '30/min'}}
+
+    # Anonymous: 3 reads, then a 429 with when to come back; the state is one string per client
+    anon = APIClient()
+    assert [anon.get('/api/tweets/').status_code for _ in range(4)] == [200, 200, 200, 429]
+    assert 1 <= int(anon.get('/api/tweets/')['Retry-After']) <= 20
+    assert get_redis().type('rl:anon:127.0.0.1') == b'string'
+
+    # Logged in: a photo costs 20 cells, a comment 5, a read 1, a GraphQL query 2
+    user = User.objects.create_user(username='limited', password='password123')
+    client = APIClient()
+    client.force_authenticate(user=user)
+    assert client.post('/api/tweets/', {'content': 'pic', 'image': make_image_file()}, format='multipart').status_code == 201
+    tweet_id = Tweet.objects.get().id
+    assert client.post('/api/comments/', {'tweet': tweet_id, 'text': 'nice'}).status_code == 201
+    assert client.get('/api/tweets/').status_code == 200                     # 26 of 30 spent
+    client.force_login(user)  # GraphQL uses the session
+    graphql = lambda: client.post('/graphql/', {'query': '{ tweets(first: 1) { edges { node { id } } } }'}, format='json')
+    assert graphql().status_code == 200                                      # 28
+    # A query, whatever its name: costed from the parsed document, not the text
+    named = 'query mutationCount { tweets(first: 1) { edges { node { id } } } }'
+    assert client.post('/graphql/', {'query': named}, format='json').status_code == 200  # 30
+    response = graphql()
+    assert response.status_code == 429 and response.json()['errors'][0]['extensions']['code'] == 'RATE_LIMITED'
+    assert client.get('/api/tweets/').status_code == 429
+
+    # ...and the same budget refuses a WebSocket connect
+    token = Token.objects.create(user=user)
+
+    async def connect():
+        socket = WebsocketCommunicator(application, f'/ws/notifications/?token={token.key}')
+        connected, code = await socket.connect()
+        return connected, code
+    assert async_to_sync(connect)() == (False, 4429)
+
+
+@pytest.mark.django_db
+def test_graphql_rate_limits_token_clients_by_user():
+    from rest_framework.authtoken.models import Token
+
+    user = User.objects.create_user(username='tokenclient', password='password123')
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    query = {'query': '{ tweets(first: 1) { edges { node { id } } } }'}
+    assert client.post('/graphql/', query, format='json').status_code == 200
+
+    # Charged to the user's budget, not the anonymous per-IP one
+    redis = get_redis()
+    assert redis.exists(f'rl:user:user:{user.id}') and not redis.exists('rl:anon:127.0.0.1')
+
+    # A wrong token is anonymous, never the session
+    client.force_login(user)
+    client.credentials(HTTP_AUTHORIZATION='Token nope')
+    assert client.post('/graphql/', query, format='json').status_code == 200
+    assert redis.exists('rl:anon:127.0.0.1')
+
+
+# --- BULK INGEST (COPY + checkpoints) ---
+
+@pytest.mark.django_db
+def test_bulk_ingest_loads_users_tweets_comments_and_resumes(tmp_path, monkeypatch, django_capture_on_commit_callbacks):
+    from . import availability, ingest
+    from .models import IngestCheckpoint
+
+    users = tmp_path / 'users.csv'
+    users.write_text(
+        'id,username,email,password\n'
+        '900,alice,alice@example.com,pbkdf2_sha256$1$salt$hash\n'
+        ',bob,,secret-password\n'
+        ',dave,,pa$$word\n'  # a password, not a hash
+        ',ALICE,,\n'  # taken in another case: skipped
+    )
+    availability.rebuild('username')
+    checkpoint = ingest.ingest('users', str(users), log=lambda _: None)
+    assert (checkpoint.rows, checkpoint.skipped) == (3, 1)
+    alice, bob = User.objects.get(username='alice'), User.objects.get(username='bob')
+    assert alice.id == 900 and bob.check_password('secret-password')
+    assert User.objects.get(username='dave').check_password('pa$$word')
+    assert User.objects.create_user(username='carol').id > 900  # the sequence moved past explicit ids
+    assert availability.get_filter('username').might_contain('BOB')  # no rebuild needed
+
+    # Tweets by username; the 4th line is broken, so the run stops after the first batch
+    lines = [
+        {'username': 'alice', 'content': 'first', 'created_at': '2024-01-01T00:00:00Z'},
+        {'username': 'bob', 'content': 'second', 'image': 'tweet_images/cat.jpg'},
+        {'username': 'nobody', 'content': 'unknown author: skipped'},
+        {'username': 'alice', 'contnet': 'typo'},
+        {'user_id': 900, 'content': 'fifth'},
+    ]
+    tweets = tmp_path / 'tweets.jsonl'
+    tweets.write_text('\n'.join(json.dumps(line) for line in lines) + '\n')
+    with pytest.raises(ingest.IngestError):
+        ingest.ingest('tweets', str(tweets), batch_size=2, pipeline='defer', log=lambda _: None)
+    checkpoint = IngestCheckpoint.objects.get(kind='tweets')
+    assert checkpoint.rows == 2 and checkpoint.pipeline == IngestCheckpoint.DEFERRED
+    assert Tweet.objects.count() == 2
+    # Posted through the API meanwhile: inside the id range, but not part of the load
+    live = Tweet.objects.create(user=alice, content='live', video='tweet_videos/live.mp4',
+                                video_renditions={'status': 'ready'})
+
+    # Fixed and run again: resumes after the committed batch, nothing loaded twice
+    lines[3] = {'username': 'alice', 'content': 'typo fixed'}
+    tweets.write_text('\n'.join(json.dumps(line) for line in lines) + '\n')
+    checkpoint = ingest.ingest('tweets', str(tweets), batch_size=2, pipeline='defer', log=lambda _: None)
+    assert (checkpoint.rows, checkpoint.skipped) == (4, 1) and checkpoint.finished_at
+    loaded = Tweet.objects.exclude(id=live.id)
+    assert sorted(loaded.values_list('content', flat=True)) == ['fifth', 'first', 'second', 'typo fixed']
+    assert checkpoint.id_ranges == [[checkpoint.first_id, live.id - 1], [live.id + 1, checkpoint.last_id]]
+    assert all(Tweet.objects.values_list('search_vector', flat=True))  # the trigger ran
+    assert ingest.ingest('tweets', str(tweets), log=lambda _: None).rows == 4  # already done
+
+    # The deferred pipeline, scheduled in bulk
+    scheduled = []
+    monkeypatch.setattr(moderate_tweets, 'apply_async', lambda args, **kw: scheduled.append(('moderate', args[0])))
+    monkeypatch.setattr(process_tweet_image, 'apply_async', lambda args, **kw: scheduled.append(('image', args[0])))
+    assert ingest.schedule_deferred(checkpoint, log=lambda _: None) == 4
+    image_tweet = Tweet.objects.get(content='second')
+    assert scheduled == [
+        ('moderate', sorted(loaded.filter(id__lt=live.id).values_list('id', flat=True))),
+        ('image', image_tweet.id),
+        ('moderate', sorted(loaded.filter(id__gt=live.id).values_list('id', flat=True))),
+    ]
+    assert Tweet.objects.get(id=live.id).video_renditions == {'status': 'ready'}
+    assert IngestCheckpoint.objects.get(kind='tweets').pipeline == IngestCheckpoint.SCHEDULED
+
+    # Comments bump comments_count in the same statement (usernames in any case)
+    anon = APIClient()
+    assert anon.get(f'/api/tweets/{image_tweet.id}/').data['comments_count'] == 0  # now cached
+    comments = tmp_path / 'comments.csv'
+    comments.write_text(
+        'username,tweet_id,text\n'
+        f'BOB,{image_tweet.id},"nice, cat"\n'
+        f'alice,{image_tweet.id},"multi\nline"\n'
+        'bob,999999,no such tweet\n'
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        checkpoint = ingest.ingest('comments', str(comments), log=lambda _: None)
+    assert (checkpoint.rows, checkpoint.skipped) == (2, 1)
+    image_tweet.refresh_from_db()
+    assert image_tweet.comments_count == 2
+    assert anon.get(f'/api/tweets/{image_tweet.id}/').data['comments_count'] == 2
+    assert set(image_tweet.comments.values_list('text', flat=True)) == {'nice, cat', 'multi\nline'}
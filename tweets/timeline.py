@@ -0,0 +1,174 @@
+"""
+Home timelines (fan-out-on-write).
+
+Every user has a capped Redis sorted set `timeline:{user_id}` holding the IDs of
+tweets from the people they follow. Tweet IDs are also the scores: they grow
+with time, so "newest first" is just ZREVRANGEBYSCORE and reading a page costs
+O(page) no matter how big the Tweet table is.
+
+A rebuilt timeline also holds EMPTY_MARKER (score 0, below every tweet ID, never
+read), so the key exists even when there is nothing to show: a user who follows
+nobody and never posted isn't rebuilt from the database on every read. When
+that is all it holds, the key expires after TIMELINE_EMPTY_TTL.
+
+Fan-out only pushes into timelines that EXIST. A missing key (never read,
+evicted, older than this cache) has to be rebuilt from the database on the next
+read; creating it with just the new tweet would hide everything older.
+
+Accounts with more than TIMELINE_FANOUT_LIMIT followers are NOT fanned out
+(one tweet would mean millions of writes). Their tweets are merged in when a
+follower reads the timeline instead (fan-out-on-read).
+"""
+from django.conf import settings
+
+from .models import Follow, Tweet
+from .redis_client import get_redis
+
+CELEBRITIES_KEY = 'timeline:celebrities'
+EMPTY_MARKER = 0
+FANOUT_CHUNK_SIZE = 1000
+
+# KEYS: timelines, ARGV[1]: TIMELINE_MAX_LENGTH, ARGV[2..]: tweet IDs (also the scores)
+PUSH_SCRIPT = """
+local members = {}
+for i = 2, #ARGV do
+    members[#members + 1] = ARGV[i]
+    members[#members + 1] = ARGV[i]
+end
+local pushed = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('ZADD', key, unpack(members))
+        -- Keep only the newest N entries (ranks are lowest-score first)
+        redis.call('ZREMRANGEBYRANK', key, 0, -tonumber(ARGV[1]) - 1)
+        pushed = pushed + 1
+    end
+end
+return pushed
+"""
+
+
+def timeline_key(user_id):
+    return f'timeline:{user_id}'
+
+
+def is_celebrity(user_id):
+    """True if the user has at least TIMELINE_FANOUT_LIMIT followers (counted with a LIMIT)."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    return Follow.objects.filter(following_id=user_id)[:limit].count() >= limit
+
+
+def push_to_timelines(user_ids, tweet_ids, client=None):
+    """
+    ZADD the tweets into each user's timeline and trim it back to TIMELINE_MAX_LENGTH.
+    Timelines that don't exist are skipped (read_timeline rebuilds them). Returns how many were pushed.
+    """
+    if not tweet_ids or not user_ids:
+        return 0
+    client = client or get_redis()
+    return client.register_script(PUSH_SCRIPT)(
+        keys=[timeline_key(user_id) for user_id in user_ids],
+        args=[settings.TIMELINE_MAX_LENGTH, *tweet_ids],
+    )
+
+
+def fan_out(tweet):
+    """Pushes a new tweet into the author's and their followers' timelines. Returns the number of timelines."""
+    client = get_redis()
+    push_to_timelines([tweet.user_id], [tweet.id], client)
+
+    if is_celebrity(tweet.user_id):
+        # Followers will pull this author's tweets at read time
+        client.sadd(CELEBRITIES_KEY, tweet.user_id)
+        return 1
+    client.srem(CELEBRITIES_KEY, tweet.user_id)
+
+    follower_ids = (
+        Follow.objects.filter(following_id=tweet.user_id)
+        .values_list('follower_id', flat=True)
+        .iterator(chunk_size=FANOUT_CHUNK_SIZE)
+    )
+    count, chunk = 1, []
+    for follower_id in follower_ids:
+        chunk.append(follower_id)
+        if len(chunk) == FANOUT_CHUNK_SIZE:
+            push_to_timelines(chunk, [tweet.id], client)
+            count += len(chunk)
+            chunk = []
+    push_to_timelines(chunk, [tweet.id], client)
+    return count + len(chunk)
+
+
+def recent_tweet_ids(author_ids, limit, before=None):
+    """Newest tweet IDs by these authors (uses the (user, -id) index)."""
+    queryset = Tweet.objects.filter(user_id__in=author_ids)
+    if before is not None:
+        queryset = queryset.filter(id__lt=before)
+    return list(queryset.order_by('-id').values_list('id', flat=True)[:limit])
+
+
+def rebuild_timeline(user_id):
+    """Cold start (new user, evicted key): fill the timeline from the database."""
+    # Celebrities are merged in at read time, so leave them out here
+    celebrity_ids = [int(i) for i in get_redis().smembers(CELEBRITIES_KEY)]
+    followee_ids = list(
+        Follow.objects.filter(follower_id=user_id)
+        .exclude(following_id__in=celebrity_ids)
+        .values_list('following_id', flat=True)
+    )
+    tweet_ids = recent_tweet_ids(followee_ids + [user_id], settings.TIMELINE_MAX_LENGTH)
+    client = get_redis()
+    pipe = client.pipeline()
+    # The marker creates the key, so the push below (and fan-out from now on) lands in it
+    pipe.zadd(timeline_key(user_id), {EMPTY_MARKER: 0})
+    if not tweet_ids:
+        # Tweets pushed later keep the TTL: the timeline is just rebuilt once more when it expires
+        pipe.expire(timeline_key(user_id), settings.TIMELINE_EMPTY_TTL)
+    pipe.execute()
+    push_to_timelines([user_id], tweet_ids, client)
+
+
+def add_followee(user_id, followee_id):
+    """Backfill a newly followed account's recent tweets into the timeline (if it is cached at all)."""
+    if is_celebrity(followee_id):
+        return
+    push_to_timelines([user_id], recent_tweet_ids([followee_id], settings.TIMELINE_MAX_LENGTH))
+
+
+def remove_followee(user_id, followee_id):
+    tweet_ids = recent_tweet_ids([followee_id], settings.TIMELINE_MAX_LENGTH)
+    if tweet_ids:
+        get_redis().zrem(timeline_key(user_id), *tweet_ids)
+
+
+def read_timeline(user_id, count, before=None):
+    """
+    Returns up to `count` tweet IDs (newest first) older than `before`.
+    Merges the pushed timeline with the recent tweets of followed celebrities.
+    """
+    client = get_redis()
+    key = timeline_key(user_id)
+    if not client.exists(key):
+        rebuild_timeline(user_id)
+
+    max_score = f'({before}' if before is not None else '+inf'
+    # Above 0: skips EMPTY_MARKER
+    ids = [int(i) for i in client.zrevrangebyscore(key, max_score, '(0', start=0, num=count)]
+
+    celebrity_ids = [int(i) for i in client.smembers(CELEBRITIES_KEY)]
+    if celebrity_ids:
+        followed = list(
+            Follow.objects.filter(follower_id=user_id, following_id__in=celebrity_ids)
+            .values_list('following_id', flat=True)
+        )
+        if followed:
+            ids = sorted(set(ids) | set(recent_tweet_ids(followed, count, before)), reverse=True)[:count]
+
+    return ids
+
+
+def hydrate(tweet_ids, queryset=None):
+    """Loads tweets for a list of IDs in one query, keeping the given order (deleted tweets are skipped)."""
+    queryset = queryset if queryset is not None else Tweet.objects.select_related('user')
+    tweets = queryset.in_bulk(tweet_ids)
+    return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
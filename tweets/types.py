@@ -1,8 +1,12 @@
 import strawberry
 from strawberry import auto
+from strawberry.types import Info
 from typing import List, Optional
+from django.conf import settings
 from . import models
 
+MAX_COMMENTS = 50
+
 @strawberry.django.type(models.User)
 class UserType:
     username: auto
@@ -12,9 +16,13 @@ class UserType:
 class CommentType:
     id: auto
     text: auto
-    user: UserType # Nested relationship!
     created_at: auto
 
+    # Nested relationship, batched: all comment authors load in one query
+    @strawberry.field
+    async def user(self, info: Info) -> UserType:
+        return await info.context.loaders.users.load(self.user_id)
+
 @strawberry.django.type(models.Tweet)
 class TweetType:
     id: auto
@@ -22,10 +30,34 @@ class TweetType:
     username: str # Custom field logic
     created_at: auto
     shares_count: auto
-    # We can fetch comments for a tweet directly
-    comments: List[CommentType]
+    comments_count: auto
+
+    # We can fetch comments for a tweet directly (newest first, bounded).
+    # The loader fetches them for every tweet of the page in ONE windowed query.
+    @strawberry.field
+    async def comments(self, info: Info, first: int = settings.COMMENT_PREVIEW_SIZE) -> List[CommentType]:
+        first = max(0, min(first, MAX_COMMENTS))
+        return await info.context.loaders.comments_by_tweet.load((self.id, first))
 
-    # Custom resolver for username (like SerializerMethodField)
+    # Custom resolver for username (like SerializerMethodField), batched too
     @strawberry.field
-    def username(self) -> str:
-        return self.user.username
\ No newline at end of file
+    async def username(self, info: Info) -> str:
+        user = await info.context.loaders.users.load(self.user_id)
+        return user.username
+
+# --- CURSOR PAGINATION (connection style) ---
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str]
+
+@strawberry.type
+class TweetEdge:
+    cursor: str
+    node: TweetType
+
+@strawberry.type
+class TweetConnection:
+    edges: List[TweetEdge]
+    page_info: PageInfo
@@ -0,0 +1,228 @@
+"""
+Resumable chunked uploads, written straight to the storage backend.
+
+    POST   /api/uploads/                {"kind": "video", "filename": "cat.mp4", "size": 73400320}
+    PUT    /api/uploads/<id>/           raw bytes of one chunk + Content-Range: bytes <start>-<end>/<size>
+    GET    /api/uploads/<id>/           {"offset": ...}: where to resume after a dropped connection
+    POST   /api/uploads/<id>/complete/
+    POST   /api/tweets/                 {"content": "...", "video_upload": "<id>"}
+
+Every chunk is UPLOAD_CHUNK_SIZE bytes (the last one is what's left) and must
+start at the current offset, so the offset only ever moves by whole chunks: after
+a failure the client GETs the offset and sends that chunk again. A chunk is
+copied to the storage UPLOAD_COPY_BUFFER bytes at a time, so a worker holds the
+same memory for a 5 MB photo and a 1 GB video, and is busy for one chunk, not
+for the whole upload.
+
+Backends (picked from STORAGES['default']):
+    local disk   chunks are written in place into the final file
+    S3           AWS, MinIO... one multipart-upload part per chunk (S3 wants >= 5 MiB parts)
+"""
+import os
+import posixpath
+import re
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from .models import Upload
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+UPLOAD_DIRS = {Upload.IMAGE: 'tweet_images/uploads', Upload.VIDEO: 'tweet_videos/uploads'}
+
+
+class OffsetMismatch(Exception):
+    """The chunk doesn't start where the upload is: the client resumes from `offset`."""
+
+    def __init__(self, offset):
+        super().__init__(f'Expected the chunk at offset {offset}.')
+        self.offset = offset
+
+
+def _copy(stream, dest, length):
+    """Copies exactly `length` bytes, UPLOAD_COPY_BUFFER at a time."""
+    remaining = length
+    while remaining:
+        piece = stream.read(min(settings.UPLOAD_COPY_BUFFER, remaining)) if stream else b''
+        if not piece:
+            raise ValidationError('The chunk is shorter than its Content-Range.')
+        dest.write(piece)
+        remaining -= len(piece)
+
+
+class FileSystemBackend:
+    """Chunks go straight into the final file (seek + write), nothing to assemble."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def start(self, upload):
+        path = self.storage.path(upload.storage_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+
+    def write(self, upload, stream, length):
+        with open(self.storage.path(upload.storage_name), 'r+b') as f:
+            f.seek(upload.offset)
+            _copy(stream, f, length)
+        return upload.backend_state
+
+    def complete(self, upload):
+        pass
+
+    def abort(self, upload):
+        self.storage.delete(upload.storage_name)
+
+
+class S3Backend:
+    """One multipart-upload part per chunk; S3 joins them on complete()."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.client = storage.connection.meta.client
+
+    def _target(self, upload):
+        return {'Bucket': self.storage.bucket_name, 'Key': posixpath.join(self.storage.location, upload.storage_name)}
+
+    def start(self, upload):
+        response = self.client.create_multipart_upload(
+            ContentType=upload.content_type or 'application/octet-stream', **self._target(upload),
+        )
+        upload.backend_state = {'upload_id': response['UploadId'], 'parts': []}
+
+    def write(self, upload, stream, length):
+        state = upload.backend_state
+        part = upload.offset // settings.UPLOAD_CHUNK_SIZE + 1
+        # boto3 needs a seekable body (to sign and retry it): spooled in memory up to
+        # UPLOAD_COPY_BUFFER, to a temp file beyond that
+        with tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_COPY_BUFFER) as buffer:
+            _copy(stream, buffer, length)
+            buffer.seek(0)
+            response = self.client.upload_part(
+                UploadId=state['upload_id'], PartNumber=part, Body=buffer, ContentLength=length,
+                **self._target(upload),
+            )
+        # A retried part replaces the previous one; same bytes = same ETag
+        return {**state, 'parts': state['parts'] + [{'PartNumber': part, 'ETag': response['ETag']}]}
+
+    def complete(self, upload):
+        self.client.complete_multipart_upload(
+            UploadId=upload.backend_state['upload_id'],
+            MultipartUpload={'Parts': upload.backend_state['parts']},
+            **self._target(upload),
+        )
+
+    def abort(self, upload):
+        if upload.status == Upload.UPLOADING:
+            self.client.abort_multipart_upload(UploadId=upload.backend_state['upload_id'], **self._target(upload))
+        else:
+            self.storage.delete(upload.storage_name)
+
+
+def get_backend():
+    storage = storages['default']
+    if isinstance(storage, FileSystemStorage):
+        return FileSystemBackend(storage)
+    if hasattr(storage, 'bucket_name'):  # django-storages S3Storage
+        return S3Backend(storage)
+    raise ImproperlyConfigured(f'Chunked uploads do not support {type(storage).__name__}')
+
+
+def make_storage_name(kind, filename):
+    # A random directory per upload: names never collide, so nothing is renamed on complete()
+    name = storages['default'].get_valid_name(os.path.basename(filename)) or 'upload'
+    return f'{UPLOAD_DIRS[kind]}/{uuid.uuid4().hex}/{name[-100:]}'
+
+
+def create(user, kind, filename, size, content_type=''):
+    upload = Upload(
+        user=user, kind=kind, filename=filename, content_type=content_type, size=size,
+        storage_name=make_storage_name(kind, filename),
+    )
+    get_backend().start(upload)
+    upload.save()
+    return upload
+
+
+def write_chunk(upload, stream, content_range, content_length):
+    """Appends one chunk. Returns the upload with its new offset."""
+    if upload.status != Upload.UPLOADING:
+        raise ValidationError('This upload is already complete.')
+    match = CONTENT_RANGE_RE.match(content_range or '')
+    if not match:
+        raise ValidationError('Content-Range: bytes <start>-<end>/<size> is required.')
+    start, end, total = map(int, match.groups())
+    if total != upload.size:
+        raise ValidationError(f'The upload is {upload.size} bytes, not {total}.')
+    if start != upload.offset:
+        raise OffsetMismatch(upload.offset)
+    length = end - start + 1
+    expected = min(settings.UPLOAD_CHUNK_SIZE, upload.size - upload.offset)
+    if length != expected or content_length != length:
+        raise ValidationError(f'Expected a chunk of {expected} bytes.')
+
+    state = get_backend().write(upload, stream, length)
+
+    # Only moves forward if nobody else did in the meantime (two tabs, a retried request)
+    updated = Upload.objects.filter(id=upload.id, status=Upload.UPLOADING, offset=start).update(
+        offset=start + length, backend_state=state,
+    )
+    if not updated:
+        upload.refresh_from_db(fields=['offset'])
+        raise OffsetMismatch(upload.offset)
+    upload.offset, upload.backend_state = start + length, state
+    return upload
+
+
+def _verify_image(upload):
+    try:
+        with storages['default'].open(upload.storage_name, 'rb') as f:
+            Image.open(f).verify()
+    except Exception:
+        raise ValidationError('The uploaded file is not a valid image.')
+
+
+def complete(upload):
+    """Finishes the object in the storage; the upload can then be attached to a tweet."""
+    if upload.status != Upload.UPLOADING:
+        return upload
+    if upload.offset != upload.size:
+        raise ValidationError(f'Only {upload.offset} of {upload.size} bytes were received.')
+    get_backend().complete(upload)
+    upload.status = Upload.COMPLETE
+    if upload.kind == Upload.IMAGE:
+        try:
+            _verify_image(upload)
+        except ValidationError:
+            abort(upload)
+            raise
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['status', 'completed_at'])
+    return upload
+
+
+def abort(upload):
+    """Deletes the upload and whatever was stored (unless a tweet uses it)."""
+    if upload.status != Upload.ATTACHED:
+        try:
+            get_backend().abort(upload)
+        except Exception as e:  # the row goes anyway; a leftover object is only wasted space
+            print(f"❌ [Upload] Could not clean up {upload.storage_name}: {e}")
+    if upload.pk:
+        upload.delete()
+
+
+def expire(now=None):
+    """Aborts uploads never finished (or never attached) within UPLOAD_EXPIRY. Returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.UPLOAD_EXPIRY)
+    stale = list(Upload.objects.filter(status__in=[Upload.UPLOADING, Upload.COMPLETE], created_at__lt=cutoff))
+    for upload in stale:
+        abort(upload)
+    return len(stale)
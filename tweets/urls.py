@@ -1,15 +1,21 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TweetViewSet,CommentViewSet, UserCreate, check_availability, get_current_user
+from .views import TweetViewSet,CommentViewSet,NotificationViewSet,UploadViewSet, TimelineView, UserCreate, check_availability, follow_user, get_current_user, logout, rotate_token
 
 router = DefaultRouter()
 router.register(r'tweets', TweetViewSet)
 router.register(r'comments', CommentViewSet)
+router.register(r'notifications', NotificationViewSet, basename='notification')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('signup/', UserCreate.as_view(), name='user-create'),
     path('check-availability/', check_availability, name='check_availability'),
     path('me/', get_current_user, name='get_current_user'),
+    path('logout/', logout, name='logout'),
+    path('token/rotate/', rotate_token, name='rotate_token'),
+    path('users/<int:user_id>/follow/', follow_user, name='follow_user'),
+    path('timeline/', TimelineView.as_view(), name='timeline'),
     
 ]
\ No newline at end of file
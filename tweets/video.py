@@ -0,0 +1,220 @@
+"""
+Video renditions, HLS and a poster frame (ffmpeg).
+
+The uploaded original is never modified or served to feeds. For each entry of
+settings.VIDEO_RENDITIONS no taller than the source we encode a capped-bitrate
+H.264/AAC MP4 (faststart, for plain <video> tags), remux it into HLS segments,
+and write a master playlist over all of them plus a JPEG poster:
+
+    tweet_videos/renditions/<tweet_id>/720p.mp4
+    tweet_videos/renditions/<tweet_id>/hls/720p/index.m3u8 (+ seg_000.ts ...)
+    tweet_videos/renditions/<tweet_id>/hls/master.m3u8
+    tweet_videos/renditions/<tweet_id>/poster.jpg
+
+Tweet.video_renditions records the storage names, e.g.
+
+    {"status": "ready", "duration": 12.5, "poster": "...", "hls": "...",
+     "mp4": {"720p": {"width": 1280, "height": 720, "bitrate": 2628, "path": "..."}, ...}}
+
+Keyframes are forced every VIDEO_HLS_SEGMENT_SECONDS, so the HLS step is a copy
+(no second encode). ffmpeg runs on a local temp copy (the original may be on S3)
+with VIDEO_FFMPEG_THREADS threads, inside the dedicated `video` Celery queue.
+Playlists use relative segment names: on S3 the bucket must be readable
+through those URLs (public-read, or a CDN in front).
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+RENDITIONS_DIR = 'tweet_videos/renditions/{}'
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def _run(args):
+    try:
+        subprocess.run(
+            args, check=True, capture_output=True, timeout=settings.VIDEO_TRANSCODE_TIMEOUT,
+        )
+    except subprocess.CalledProcessError as e:
+        raise TranscodeError(e.stderr.decode(errors='replace')[-500:]) from e
+    except subprocess.TimeoutExpired as e:
+        raise TranscodeError(f'ffmpeg took more than {settings.VIDEO_TRANSCODE_TIMEOUT}s') from e
+
+
+def probe(path):
+    """Width, height, duration (s) and whether there is an audio track."""
+    try:
+        output = subprocess.run(
+            [settings.FFPROBE_BINARY, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+            check=True, capture_output=True, timeout=60,
+        ).stdout
+    except subprocess.CalledProcessError as e:
+        raise TranscodeError(f'Not a video: {e.stderr.decode(errors="replace")[-200:]}') from e
+    info = json.loads(output)
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise TranscodeError('No video stream')
+    width, height = int(video['width']), int(video['height'])
+    # Phones store portrait video as landscape + a rotation tag
+    rotation = abs(int(video.get('tags', {}).get('rotate', 0) or 0))
+    for side_data in video.get('side_data_list', []):
+        rotation = abs(int(side_data.get('rotation', rotation) or 0))
+    if rotation in (90, 270):
+        width, height = height, width
+    return {
+        'width': width,
+        'height': height,
+        'duration': float(info.get('format', {}).get('duration') or 0),
+        'has_audio': any(s.get('codec_type') == 'audio' for s in streams),
+    }
+
+
+def ladder(source_height):
+    """
+    The renditions to produce, tallest first: every one no taller than the
+    source, and at least the smallest (at the source's own height), so a small
+    clip still gets one capped rendition instead of an upscaled one.
+    """
+    chosen = []
+    for name, (height, video_kbps, audio_kbps) in sorted(settings.VIDEO_RENDITIONS.items(), key=lambda item: -item[1][0]):
+        if height <= source_height:
+            chosen.append((name, height, video_kbps, audio_kbps))
+    if not chosen:
+        name, (height, video_kbps, audio_kbps) = min(settings.VIDEO_RENDITIONS.items(), key=lambda item: item[1][0])
+        chosen.append((name, source_height - source_height % 2, video_kbps, audio_kbps))
+    return chosen
+
+
+def encode_args(source, output, height, video_kbps, audio_kbps, has_audio):
+    segment = settings.VIDEO_HLS_SEGMENT_SECONDS
+    args = [
+        settings.FFMPEG_BINARY, '-y', '-v', 'error', '-i', source,
+        '-threads', str(settings.VIDEO_FFMPEG_THREADS),
+        '-vf', f'scale=-2:{height}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+        # Capped bitrate: never more than video_kbps, whatever the source
+        '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k',
+        # A keyframe at every segment boundary, so HLS is a plain remux
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment})', '-sc_threshold', '0',
+    ]
+    if has_audio:
+        args += ['-c:a', 'aac', '-b:a', f'{audio_kbps}k', '-ac', '2']
+    else:
+        args += ['-an']
+    return args + ['-movflags', '+faststart', output]
+
+
+def hls_args(mp4, playlist):
+    return [
+        settings.FFMPEG_BINARY, '-y', '-v', 'error', '-i', mp4, '-c', 'copy',
+        '-f', 'hls', '-hls_time', str(settings.VIDEO_HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(os.path.dirname(playlist), 'seg_%03d.ts'), playlist,
+    ]
+
+
+def poster_args(source, output, duration, height):
+    # A second in (black first frames are common), or the middle of very short clips
+    at = min(settings.VIDEO_POSTER_SECOND, duration / 2) if duration else 0
+    return [
+        settings.FFMPEG_BINARY, '-y', '-v', 'error', '-ss', f'{at:.2f}', '-i', source,
+        '-frames:v', '1', '-vf', f'scale=-2:{height}', '-q:v', '3', output,
+    ]
+
+
+def master_playlist(entries):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for name, rendition in entries:
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={rendition['bitrate'] * 1000},"
+            f"RESOLUTION={rendition['width']}x{rendition['height']}"
+        )
+        lines.append(f'{name}/index.m3u8')
+    return '\n'.join(lines) + '\n'
+
+
+def _download(field_file, path):
+    with field_file.open('rb') as src, open(path, 'wb') as dest:
+        shutil.copyfileobj(src, dest, settings.UPLOAD_COPY_BUFFER)
+
+
+def _store(local_path, name):
+    # Paths are deterministic: a re-run replaces the previous files
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    with open(local_path, 'rb') as f:
+        return default_storage.save(name, File(f))
+
+
+def transcode(tweet_id, field_file):
+    """Writes every rendition, the HLS playlists and the poster. Returns the video_renditions dict."""
+    base = RENDITIONS_DIR.format(tweet_id)
+    with tempfile.TemporaryDirectory(prefix='transcode-') as workdir:
+        source = os.path.join(workdir, 'source')
+        _download(field_file, source)
+        info = probe(source)
+
+        mp4s, master = {}, []
+        for name, height, video_kbps, audio_kbps in ladder(info['height']):
+            local_mp4 = os.path.join(workdir, f'{name}.mp4')
+            _run(encode_args(source, local_mp4, height, video_kbps, audio_kbps, info['has_audio']))
+            width = round(info['width'] * height / info['height'] / 2) * 2
+            rendition = {
+                'width': width, 'height': height,
+                'bitrate': video_kbps + (audio_kbps if info['has_audio'] else 0),
+                'path': _store(local_mp4, f'{base}/{name}.mp4'),
+            }
+
+            hls_dir = os.path.join(workdir, 'hls', name)
+            os.makedirs(hls_dir)
+            _run(hls_args(local_mp4, os.path.join(hls_dir, 'index.m3u8')))
+            for filename in sorted(os.listdir(hls_dir)):
+                _store(os.path.join(hls_dir, filename), f'{base}/hls/{name}/{filename}')
+
+            mp4s[name] = rendition
+            master.append((name, rendition))
+
+        master_path = os.path.join(workdir, 'master.m3u8')
+        with open(master_path, 'w') as f:
+            f.write(master_playlist(master))
+
+        poster = os.path.join(workdir, 'poster.jpg')
+        _run(poster_args(source, poster, info['duration'], ladder(info['height'])[0][1]))
+
+        return {
+            'status': 'ready',
+            'duration': round(info['duration'], 2),
+            'poster': _store(poster, f'{base}/poster.jpg'),
+            'hls': _store(master_path, f'{base}/hls/master.m3u8'),
+            'mp4': mp4s,
+        }
+
+
+def rendition_urls(video_renditions, request=None):
+    """Turns stored rendition paths into (absolute) URLs for the API."""
+    if not video_renditions:
+        return {}
+
+    def url(path):
+        value = default_storage.url(path)
+        return request.build_absolute_uri(value) if request else value
+
+    result = dict(video_renditions)
+    for key in ('poster', 'hls'):
+        if key in result:
+            result[key] = url(result[key])
+    if 'mp4' in result:
+        result['mp4'] = {
+            name: {'width': r['width'], 'height': r['height'], 'bitrate': r['bitrate'], 'url': url(r['path'])}
+            for name, r in result['mp4'].items()
+        }
+    return result
@@ -1,12 +1,35 @@
-from rest_framework import viewsets, permissions,status,filters,generics
+import mimetypes
+import os
+
+import prometheus_client
+from prometheus_client import multiprocess
+
+from rest_framework import mixins, viewsets, permissions,status,generics
 from rest_framework.parsers import MultiPartParser, FormParser,JSONParser
-from tweets.tasks import classify_image, moderate_content, notify_followers, resize_image
-from .models import Tweet,Comment
-from .serializers import CommentSerializer, TweetSerializer,UserSerializer,UserInfoSerializer
+from tweets.tasks import moderate_content, process_new_tweet, schedule_transcode
+from . import availability, cache, counters, imagehash, media, notifications, timeline, uploads
+from .metrics import CeleryQueueCollector
+from .models import Tweet,Comment,Follow,ImageHash,Notification,Upload
+from .pagination import KeysetPagination
+from .search import FullTextSearchFilter, ranked_search
+from .serializers import CommentSerializer, NotificationSerializer, SimilarTweetSerializer, TweetSerializer,TweetSearchResultSerializer,UploadSerializer,UserSerializer,UserInfoSerializer
+from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.static import was_modified_since
 
 
 
@@ -36,19 +59,23 @@ def check_availability(request):
     if not value:
         return Response({'error': 'Value is required'}, status=400)
 
+    # Bloom filter first: most names typed are free, and those never reach Postgres
     if check_type == 'username':
-        if User.objects.filter(username__iexact=value).exists():
+        if availability.is_taken('username', value):
             return Response({'taken': True, 'message': 'Username already taken'}, status=200)
     
     elif check_type == 'email':
-        if User.objects.filter(email__iexact=value).exists():
+        if availability.is_taken('email', value):
             return Response({'taken': True, 'message': 'Email already registered'}, status=200)
 
     return Response({'taken': False}, status=200)
 
 class TweetViewSet(viewsets.ModelViewSet):
-    queryset = Tweet.objects.select_related('user').prefetch_related('comments', 'comments__user').order_by('-created_at')
+    # Only the latest few comments per tweet, in one windowed query (not every comment of every tweet)
+    queryset = Tweet.objects.select_related('user').with_comment_preview().order_by('-created_at')
     serializer_class = TweetSerializer
+    pagination_class = KeysetPagination  # ?cursor=...&page_size=N (no COUNT/OFFSET)
+    MAX_SEARCH_PAGES = 10  # ranked results are for the top matches, not deep paging
     
     # 1. Security: Users must be logged in to post, but anyone can read
     # IsOwnerOrReadOnly ensures only the author can Update/Delete
@@ -58,8 +85,15 @@ class TweetViewSet(viewsets.ModelViewSet):
     parser_classes = (MultiPartParser, FormParser,JSONParser)
 
     # --- NEW: SEARCH CONFIGURATION ---
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['content', 'user__username','ai_tags'] # Search by text or username
+    # ?search= matches content, ai_tags and username through the full-text GIN index
+    filter_backends = [FullTextSearchFilter]
+
+    # --- RATE LIMITS: a tweet with a photo/video costs `media`, not `write` (see ratelimit.py) ---
+    def get_throttle_cost(self, request):
+        if self.action in ('create', 'update', 'partial_update'):
+            if request.FILES or request.data.get('image_upload') or request.data.get('video_upload'):
+                return 'media'
+        return None
 
     # 3. Automation: Auto-assign the 'user' field when saving
     def perform_create(self, serializer):
@@ -67,18 +101,11 @@ class TweetViewSet(viewsets.ModelViewSet):
         tweet = serializer.save(user=self.request.user)
         
         # 2. Trigger the Background Pipeline
+        # process_new_tweet does fan-out + moderation on the `realtime` queue, then hands
+        # the image to process_tweet_image (`images` queue: variants, hash, AI tags, one decode)
+        # and a video to schedule_transcode (`video` queue). See CELERY_TASK_ROUTES.
         # We pass the ID, not the whole object, because passing objects to Celery is risky
-        
-        # A. Notify Followers
-        notify_followers.delay(tweet.user.username, tweet.content)
-        
-        # B. Check for bad words
-        moderate_content.delay(tweet.id)
-        
-        # C. Resize Image (if one exists)
-        if tweet.image:
-            resize_image.delay(tweet.id)
-            classify_image.delay(tweet.id)
+        process_new_tweet.delay(tweet.id)
 
     def perform_update(self, serializer):
         # Save the changes
@@ -86,28 +113,314 @@ class TweetViewSet(viewsets.ModelViewSet):
         
         # Re-run moderation because text might have changed!
         moderate_content.delay(tweet.id)
+
+        # New video: new renditions
+        if 'video' in serializer.validated_data or 'video_upload' in serializer.validated_data:
+            if tweet.video:
+                schedule_transcode(tweet)
             
+    # --- RESPONSE CACHE: anonymous reads are served from Redis (see cache.py) ---
+    def list(self, request, *args, **kwargs):
+        viewer = cache.viewer_class(request)
+        if viewer is None or request.query_params.get('search'):
+            return super().list(request, *args, **kwargs)
+
+        params = sorted(request.query_params.items())
+        key = cache.make_key('feed', viewer, request.get_host(), params)
+        data = cache.get_or_compute(
+            key, 'feed',
+            lambda: super(TweetViewSet, self).list(request, *args, **kwargs).data,
+            deps=lambda data: [tweet['id'] for tweet in data['results']],
+            # Only the first page changes when a tweet is posted (keyset cursors)
+            head='cursor' not in request.query_params,
+        )
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        viewer = cache.viewer_class(request)
+        if viewer is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        key = cache.make_key('tweet', viewer, request.get_host(), kwargs['pk'])
+        data = cache.get_or_compute(
+            key, 'tweet',
+            lambda: super(TweetViewSet, self).retrieve(request, *args, **kwargs).data,
+            deps=lambda data: [data['id']],
+        )
+        return Response(data)
+
+    def get_queryset(self):
+        if self.action == 'share':
+            # Sharing only needs the row for the permission check
+            return Tweet.objects.only('id', 'user_id', 'shares_count')
+        return super().get_queryset()
+
     # This creates a new URL: POST /api/tweets/{id}/share/
     @action(detail=True, methods=['post'])
     def share(self, request, pk=None):
         tweet = self.get_object() # Get the tweet by ID (pk)
-        tweet.shares_count += 1   # Increment count
-        tweet.save()              # Save to DB
-        return Response({'status': 'shared', 'shares_count': tweet.shares_count})
+        # Atomic INCR in Redis; flushed to the DB in bulk by flush_share_counts
+        pending = counters.incr_share(tweet.id)
+        # GraphQL shows the DB count: its cache is invalidated when the flush writes it
+        cache.invalidate_tweet(tweet.id, reason='share', graphql=False)
+        return Response({'status': 'shared', 'shares_count': tweet.shares_count + pending})
+
+    # GET /api/tweets/search/?q=...&page=N (best matches first, with highlights)
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def search(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'q is required'}, status=400)
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            return Response({'error': 'page must be a number'}, status=400)
+        if not 1 <= page <= self.MAX_SEARCH_PAGES:
+            return Response({'error': f'page must be between 1 and {self.MAX_SEARCH_PAGES}'}, status=400)
+
+        page_size = KeysetPagination().get_page_size(request)
+        tweets, mode = ranked_search(self.get_queryset(), text, (page - 1) * page_size, page_size)
+
+        next_url = None
+        if len(tweets) == page_size and mode == 'fulltext' and page < self.MAX_SEARCH_PAGES:
+            next_url = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+
+        serializer = TweetSearchResultSerializer(tweets, many=True, context=self.get_serializer_context())
+        return Response({'mode': mode, 'next': next_url, 'results': serializer.data})
+
+    # GET /api/tweets/{id}/similar/?distance=N (tweets with a near-identical image, closest first)
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def similar(self, request, pk=None):
+        image_hash = get_object_or_404(ImageHash.objects.only('hash'), tweet_id=pk)
+        try:
+            max_distance = int(request.query_params.get('distance', settings.IMAGE_DUPLICATE_DISTANCE))
+        except ValueError:
+            return Response({'error': 'distance must be a number'}, status=400)
+        if not 0 <= max_distance <= settings.IMAGE_SIMILAR_MAX_DISTANCE:
+            return Response({'error': f'distance must be between 0 and {settings.IMAGE_SIMILAR_MAX_DISTANCE}'}, status=400)
+
+        page_size = KeysetPagination().get_page_size(request)
+        matches = imagehash.find_similar(image_hash.hash, max_distance, exclude=image_hash.tweet_id, limit=page_size)
+        tweets = self.get_queryset().in_bulk([tweet_id for _, tweet_id in matches])
+        results = []
+        for distance, tweet_id in matches:
+            if tweet_id in tweets:
+                tweets[tweet_id].distance = distance
+                results.append(tweets[tweet_id])
+
+        serializer = SimilarTweetSerializer(results, many=True, context=self.get_serializer_context())
+        return Response({'results': serializer.data})
+
+    # GET /api/tweets/{id}/comments/?cursor=... (all comments, one page at a time)
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
+    def comments(self, request, pk=None):
+        tweet = get_object_or_404(Tweet.objects.only('id'), pk=pk)
+        queryset = Comment.objects.filter(tweet=tweet).select_related('user')
+        page = self.paginate_queryset(queryset)
+        serializer = CommentSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
     
     
 
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all().order_by('-created_at')
     serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+# --- NEW: NOTIFICATION INBOX (rows written by notifications.flush_due) ---
+class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = NotificationSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def unread(self, request):
+        return Response({'unread': notifications.unread_count(request.user.id)})
+
+    @action(detail=False, methods=['post'])
+    def read(self, request):
+        # Marks everything read, or only up to {"up_to": <id>} (what the client has actually shown)
+        queryset = self.get_queryset().filter(read_at__isnull=True)
+        up_to = request.data.get('up_to')
+        if up_to is not None:
+            try:
+                queryset = queryset.filter(id__lte=int(up_to))
+            except (TypeError, ValueError):
+                return Response({'error': 'up_to must be a notification id'}, status=400)
+        marked = queryset.update(read_at=timezone.now())
+        return Response({'marked': marked, 'unread': notifications.unread_count(request.user.id)})
+
+# --- NEW: RESUMABLE CHUNKED UPLOADS (see uploads.py) ---
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    # The upload is paid for once, when it starts; its chunks are cheap (see ratelimit.py)
+    throttle_costs = {'create': 'media', 'update': 'chunk'}
+
+    def get_queryset(self):
+        return Upload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.instance = uploads.create(self.request.user, **serializer.validated_data)
+
+    # PUT /api/uploads/{id}/ with the RAW bytes of one chunk (not multipart, so nothing is parsed or spooled twice)
+    def update(self, request, *args, **kwargs):
+        try:
+            upload = uploads.write_chunk(
+                self.get_object(), request.stream,
+                request.headers.get('Content-Range'), int(request.headers.get('Content-Length') or 0),
+            )
+        except uploads.OffsetMismatch as e:
+            # Already have that chunk, or missed one: resume from e.offset
+            return Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        uploads.abort(instance)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        return Response(self.get_serializer(uploads.complete(self.get_object())).data)
+
+# --- NEW: MEDIA FILES with HTTP Range (video seeking), instead of static() ---
+def serve_media(request, path):
+    storage = storages['default']
+    if not isinstance(storage, FileSystemStorage):
+        # S3 & co. handle ranges themselves (the URL is signed if the bucket is private)
+        return HttpResponseRedirect(storage.url(path))
+
+    try:
+        full_path = storage.path(path)  # refuses ../ tricks
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Media file not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Media file not found')
+
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    size = stat.st_size
+    try:
+        byte_range = media.parse_range(request.headers.get('Range'), size)
+    except media.RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = max(0, end - start + 1)
+    read = media.aiter_file_range if isinstance(request, ASGIRequest) else media.iter_file_range
+    content_type, encoding = mimetypes.guess_type(full_path)
+    response = StreamingHttpResponse(
+        read(full_path, start, length), status=206 if byte_range else 200,
+        content_type=content_type or 'application/octet-stream',
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+# --- NEW: /metrics with the Celery queue gauges ---
+_queue_collector = None
+
+def export_metrics(request):
+    """django_prometheus' /metrics view, plus the depth/age of each Celery queue."""
+    global _queue_collector
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    if _queue_collector is None:
+        _queue_collector = CeleryQueueCollector()
+    queues = prometheus_client.CollectorRegistry()
+    queues.register(_queue_collector)
+    return HttpResponse(
+        prometheus_client.generate_latest(registry) + prometheus_client.generate_latest(queues),
+        content_type=prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+# --- NEW: LOGOUT / TOKEN ROTATION ---
+# Deleting the Token row revokes it everywhere, cached copies included (see authentication.py)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def logout(request):
+    Token.objects.filter(user=request.user).delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def rotate_token(request):
+    with transaction.atomic():
+        Token.objects.filter(user=request.user).delete()
+        token = Token.objects.create(user=request.user)
+    return Response({'token': token.key})
+
 # --- NEW: GET CURRENT USER VIEW ---
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_current_user(request):
     serializer = UserInfoSerializer(request.user)
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+# --- NEW: FOLLOW / UNFOLLOW ---
+@api_view(['POST', 'DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def follow_user(request, user_id):
+    followee = get_object_or_404(User, id=user_id)
+    if followee == request.user:
+        return Response({'error': 'You cannot follow yourself'}, status=400)
+
+    if request.method == 'POST':
+        _, created = Follow.objects.get_or_create(follower=request.user, following=followee)
+        if created:
+            timeline.add_followee(request.user.id, followee.id)
+        return Response({'following': True}, status=201 if created else 200)
+
+    deleted, _ = Follow.objects.filter(follower=request.user, following=followee).delete()
+    if deleted:
+        timeline.remove_followee(request.user.id, followee.id)
+    return Response({'following': False}, status=200)
+
+# --- NEW: HOME TIMELINE ---
+class TimelineView(generics.GenericAPIView):
+    """
+    GET /api/timeline/?before=<tweet_id>
+    Reads tweet IDs from the user's Redis timeline and loads them in one query.
+    """
+    serializer_class = TweetSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            before = int(request.query_params['before']) if 'before' in request.query_params else None
+        except ValueError:
+            return Response({'error': 'before must be a tweet id'}, status=400)
+
+        page_size = api_settings.PAGE_SIZE
+        tweet_ids = timeline.read_timeline(request.user.id, page_size, before)
+        tweets = timeline.hydrate(
+            tweet_ids,
+            Tweet.objects.select_related('user').with_comment_preview(),
+        )
+
+        next_url = None
+        if len(tweet_ids) == page_size:
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', tweet_ids[-1])
+
+        serializer = self.get_serializer(tweets, many=True)
+        return Response({'next': next_url, 'results': serializer.data})
+
@@ -0,0 +1,52 @@
+"""
+Token authentication for WebSockets.
+
+Browsers can't set headers on a WebSocket, so the DRF token (the same one the
+REST API uses) is passed in the query string:
+
+    ws://host/ws/notifications/?token=<key>
+
+Other clients may send `Authorization: Token <key>` instead. Without a token
+the session user from AuthMiddlewareStack is kept; a wrong token means
+AnonymousUser, never a fallback to the session. Tokens are resolved through
+the same two-level cache as the REST API (authentication.py), so reconnect
+storms don't hit Postgres either.
+"""
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+
+from .authentication import resolve_token
+
+
+@database_sync_to_async
+def get_token_user(key):
+    # Same cached resolver as the REST API (see authentication.py)
+    user = resolve_token(key)
+    return user if user is not None and user.is_active else AnonymousUser()
+
+
+def token_from_scope(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            keyword, _, key = value.decode('latin1').partition(' ')
+            if keyword.lower() == 'token' and key:
+                return key.strip()
+    values = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    return values[0] if values else None
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        key = token_from_scope(scope)
+        if key:
+            scope = dict(scope, user=await get_token_user(key))
+        return await super().__call__(scope, receive, send)
+
+
+def TokenAuthMiddlewareStack(inner):
+    # Session first, then the token (if any) overrides it
+    return AuthMiddlewareStack(TokenAuthMiddleware(inner))